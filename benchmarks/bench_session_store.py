@@ -0,0 +1,85 @@
+"""Бенчмарк задержки add_message для бэкендов хранилища сессий.
+
+Запуск: uv run python benchmarks/bench_session_store.py [--sessions 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from memory.storage import InMemorySessionStore  # noqa: E402
+from memory.sqlite_store import SQLiteSessionStore  # noqa: E402
+
+
+def percentile(values, pct):
+    """Перцентиль по отсортированному списку."""
+    index = min(len(values) - 1, int(len(values) * pct / 100))
+    return values[index]
+
+
+def run(store, sessions: int, messages: int, max_history_size: int) -> dict:
+    """Заполнение хранилища и замер задержки одного сообщения."""
+    started = time.perf_counter()
+    for user_id in range(sessions):
+        store.get_session(user_id, f"user{user_id}")
+        store.add_message(user_id, "user", "3", max_history_size)
+    populate_time = time.perf_counter() - started
+
+    rng = random.Random(42)
+    text = "Глаголы действия для уровня Применение: " * 20
+    latencies = []
+    for _ in range(messages):
+        user_id = rng.randrange(sessions)
+        started = time.perf_counter()
+        store.get_session(user_id, f"user{user_id}")
+        store.add_message(user_id, "assistant", text, max_history_size)
+        latencies.append(time.perf_counter() - started)
+
+    drain_time = 0.0
+    if isinstance(store, SQLiteSessionStore):
+        started = time.perf_counter()
+        store.flush()
+        drain_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "populate_s": populate_time,
+        "mean_us": sum(latencies) / len(latencies) * 1e6,
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "max_us": latencies[-1] * 1e6,
+        "drain_s": drain_time,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--history", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {"memory": run(InMemorySessionStore({}), args.sessions, args.messages, args.history)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteSessionStore(os.path.join(tmp, "sessions.db"), sessions={})
+        try:
+            results["sqlite"] = run(store, args.sessions, args.messages, args.history)
+        finally:
+            store.close()
+
+    print(f"sessions={args.sessions} messages={args.messages} history={args.history}")
+    print(f"{'backend':<8} {'populate,s':>11} {'mean,us':>9} {'p50,us':>8} {'p99,us':>8} {'max,us':>9} {'drain,s':>8}")
+    for name, r in results.items():
+        print(
+            f"{name:<8} {r['populate_s']:>11.2f} {r['mean_us']:>9.1f} {r['p50_us']:>8.1f} "
+            f"{r['p99_us']:>8.1f} {r['max_us']:>9.1f} {r['drain_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
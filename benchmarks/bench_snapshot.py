@@ -0,0 +1,68 @@
+"""Бенчмарк снимка сессий: запись при остановке и загрузка при старте.
+
+Загрузка замеряется в отдельном процессе, как при настоящем перезапуске.
+
+Запуск: uv run python benchmarks/bench_snapshot.py [--sessions 100000]
+"""
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from memory.storage import InMemorySessionStore  # noqa: E402
+from memory.snapshot import read_snapshot, write_snapshot  # noqa: E402
+
+
+def load(path: str) -> None:
+    """Загрузка снимка в пустое хранилище (выполняется в дочернем процессе)."""
+    started = time.perf_counter()
+    sessions = read_snapshot(path, ttl_hours=24)
+    read_time = time.perf_counter() - started
+
+    store = InMemorySessionStore({})
+    started = time.perf_counter()
+    store.restore_sessions(sessions)
+    restore_time = time.perf_counter() - started
+    print(f"load:     {read_time:.2f}s read + {restore_time:.2f}s restore ({store.session_count()} sessions)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--load", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load)
+        return
+
+    store = InMemorySessionStore({})
+    text = "Глаголы действия для уровня Применение: применить, использовать, решить. " * 4
+    for user_id in range(args.sessions):
+        store.get_session(user_id, f"user{user_id}")
+        for i in range(args.history):
+            store.add_message(user_id, "user" if i % 2 == 0 else "assistant", f"{i}. {text}", args.history)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.snapshot")
+
+        started = time.perf_counter()
+        write_snapshot(path, store.snapshot_sessions())
+        write_time = time.perf_counter() - started
+
+        print(f"sessions={args.sessions} history={args.history}")
+        print(f"snapshot: {write_time:.2f}s, {os.path.getsize(path) / 2**20:.1f} MiB")
+        # Память исходного хранилища освобождается до загрузки в дочернем процессе
+        del store
+        gc.collect()
+        subprocess.run([sys.executable, __file__, "--load", path], check=True)
+
+
+if __name__ == "__main__":
+    main()
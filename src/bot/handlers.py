@@ -1,14 +1,33 @@
 """Обработчики сообщений Telegram бота."""
 import logging
 import asyncio
+import time
 from aiogram import Router
 from aiogram.types import Message
 from aiogram.filters import Command
 
-from llm.client import create_llm_client, generate_response_with_history, LLMError
+from llm.cache import ResponseCache
+from llm.circuit import circuit_breakers
+from llm.hedging import Hedger
+from llm.deadline import restart_deadline, without_deadline
+from llm.limiter import request_limiter
+from llm.usage import usage_owner
+from llm.retry import RetryBudget, RetryPolicy
+from llm.router import model_router
+from llm.timeouts import llm_timeouts
+from llm.singleflight import SingleFlight
+from llm.client import create_llm_client, generate_response_with_history, generate_summary, LLMError
 from llm.prompts import load_system_prompt
+from llm.summary import extractive_summary
+from llm.warmup import warm_up_cache
 from config.settings import Config
-from memory.storage import get_user_session, add_message, get_user_history, start_cleanup_task, clear_user_history
+from bot.mailbox import UserMailbox
+from bot.streaming import StreamingReply
+from memory.storage import (
+    get_user_session, add_message, get_user_context, start_cleanup_task, clear_user_history,
+    get_user_summary, history_needs_compaction, get_compaction_batch, apply_history_summary
+)
+from memory.tokens import estimate_message_tokens
 from monitoring.metrics import metrics_collector
 
 logger = logging.getLogger(__name__)
@@ -17,22 +36,105 @@ router = Router()
 # Глобальные переменные для LLM
 llm_client = None
 system_prompt = None
+system_prompt_tokens = 0
 config = None
+response_cache = None
+hedger = None
+retry_policy = None
+
+# Одинаковые одновременные запросы к LLM выполняются один раз
+llm_flights = SingleFlight()
+
+# Приветствие /start без обращения по имени
+WELCOME_BODY = """Я - эксперт по формулировке целей обучения.
+
+🎯 Помогаю подбирать глаголы действия и составлять учебные цели для 6 уровней:
+
+1. **Знание** - запоминание фактов
+2. **Понимание** - объяснение концепций  
+3. **Применение** - использование на практике
+4. **Анализ** - разбор на части
+5. **Синтез** - создание нового
+6. **Оценка** - критическое мышление
+
+📝 **Как работать:**
+Выберите один из уровней выше (например, напишите "Применение" или "3"), и я предоставлю:
+• Глаголы действия для этого уровня
+• Примеры формулировок целей обучения
+
+Для получения примеров используйте команду /help"""
+
+# Контекст первого сообщения диалога (выбора уровня) для запроса к LLM:
+# приветствие без обращения по имени, одинаковое для всех пользователей,
+# поэтому ответы на выбор уровня берутся из общего прогретого кэша
+FIRST_TURN_HISTORY = (
+    {"role": "user", "content": "/start"},
+    {"role": "assistant", "content": WELCOME_BODY},
+)
+
+# Очередь сообщений по пользователям: порядок обработки и склейка серий
+user_mailbox = UserMailbox()
+
+# Фоновые задачи сворачивания истории: не больше одной на пользователя
+_compaction_tasks = {}
 
 
 async def init_llm(app_config: Config) -> None:
     """Инициализация LLM клиента."""
-    global llm_client, system_prompt, config
+    global llm_client, system_prompt, system_prompt_tokens, config, response_cache, hedger, retry_policy
     logger.info("Initializing LLM client...")
     
     config = app_config
-    llm_client = await create_llm_client(config.openrouter_api_key)
+    llm_client = await create_llm_client(
+        config.openrouter_api_key,
+        max_connections=config.llm_http_max_connections,
+        max_keepalive_connections=config.llm_http_keepalive_connections,
+        keepalive_expiry=config.http_keepalive_seconds,
+        http2=config.llm_http2,
+        prewarm=config.http_prewarm
+    )
     system_prompt = load_system_prompt()
+    system_prompt_tokens = estimate_message_tokens(system_prompt)
+    user_mailbox.debounce_ms = config.message_debounce_ms
+    response_cache = ResponseCache(
+        max_entries=config.response_cache_size,
+        ttl_seconds=config.response_cache_ttl_seconds,
+        stale_seconds=config.response_cache_stale_seconds,
+        max_entry_chars=config.response_cache_max_entry_chars
+    ) if config.response_cache_size else None
+    hedger = Hedger(delay=config.hedge_delay_ms / 1000) if config.hedge_enabled else None
+    retry_policy = RetryPolicy(
+        base_delay=config.retry_base_delay_seconds,
+        max_delay=config.retry_max_delay_seconds,
+        budget=RetryBudget(ratio=config.retry_budget_ratio, min_retries=config.retry_budget_min_retries)
+    )
+    request_limiter.configure(
+        max_concurrency=config.llm_max_concurrency,
+        rate_per_minute=config.llm_rate_per_minute,
+        burst=config.llm_rate_burst,
+        adaptive=config.llm_adaptive_concurrency,
+        min_concurrency=config.llm_min_concurrency
+    )
+    circuit_breakers.configure(
+        window=config.circuit_window,
+        failure_rate=config.circuit_failure_rate,
+        min_requests=config.circuit_min_requests,
+        open_seconds=config.circuit_open_seconds
+    )
+    model_router.configure(config.model_pool, exploration=config.router_exploration)
+    llm_timeouts.configure(
+        enabled=config.llm_adaptive_timeouts,
+        factor=float(config.llm_timeout_factor),
+        min_timeout=float(config.llm_timeout_min_seconds),
+        max_timeout=float(config.llm_timeout_max_seconds)
+    )
     
     # Запуск фоновой задачи очистки памяти
     asyncio.create_task(start_cleanup_task(
         cleanup_interval_hours=config.cleanup_interval_hours,
-        ttl_hours=config.memory_ttl_hours
+        ttl_hours=config.memory_ttl_hours,
+        expiry_interval_seconds=config.expiry_interval_seconds,
+        expiry_batch_size=config.expiry_batch_size
     ))
     
     # Запуск периодического логирования статистики
@@ -42,6 +144,98 @@ async def init_llm(app_config: Config) -> None:
     logger.info("LLM client and memory cleanup task initialized successfully")
 
 
+def schedule_history_compaction(user_id: int) -> None:
+    """Запуск фонового сворачивания истории, если она превысила порог."""
+    if not config.summary_enabled or user_id in _compaction_tasks:
+        return
+    if not history_needs_compaction(user_id, config.summary_threshold_tokens, config.summary_keep_recent):
+        return
+
+    # Сворачивание не ограничено дедлайном апдейта, во время которого запущено
+    task = asyncio.create_task(compact_user_history(user_id), context=without_deadline())
+    _compaction_tasks[user_id] = task
+    task.add_done_callback(lambda _: _compaction_tasks.pop(user_id, None))
+
+
+async def compact_user_history(user_id: int) -> None:
+    """Сворачивание ранней части истории в резюме вне пути запроса.
+
+    Резюме строит дешевая модель SUMMARY_MODEL, а без нее или при ошибке -
+    экстрактивная эвристика.
+    """
+    batch = get_compaction_batch(user_id, config.summary_keep_recent)
+    if batch is None:
+        return
+    previous_summary, folded = batch
+    turns = [(msg.role, msg.content) for msg in folded]
+
+    summary = None
+    if config.summary_model:
+        try:
+            with usage_owner(user_id):
+                summary = await generate_summary(llm_client, previous_summary, turns, config.summary_model)
+        except LLMError as e:
+            logger.warning(f"Summary model failed for user {user_id}, using extractive summary: {e}")
+    if not summary:
+        summary = extractive_summary(previous_summary, turns)
+
+    if apply_history_summary(user_id, summary, folded):
+        metrics_collector.record_summary_compaction(len(folded))
+
+
+def welcome_text(user_name: str) -> str:
+    """Приветствие /start с обращением к пользователю."""
+    return f"Добро пожаловать, {user_name}! 👋\n\n{WELCOME_BODY}"
+
+
+def is_first_turn(history) -> bool:
+    """Является ли история контекстом сразу после /start (с любым обращением)."""
+    return (
+        len(history) == len(FIRST_TURN_HISTORY)
+        and history[0]["role"] == "user" and history[0]["content"] == "/start"
+        and history[1]["role"] == "assistant" and history[1]["content"].endswith(WELCOME_BODY)
+    )
+
+
+async def start_cache_warmup() -> None:
+    """Запуск фонового прогрева кэша ответов (вызывается при старте polling)."""
+    if response_cache is None or not config.cache_warmup_enabled:
+        return
+    asyncio.create_task(run_cache_warmup())
+
+
+async def run_cache_warmup() -> None:
+    """Прогрев кэша ответами на выбор уровней с периодическим обновлением.
+
+    Повторные прогоны перегенерируют ответы, поэтому пользователи в разное
+    время получают разные формулировки, а записи не успевают устареть.
+    """
+    while True:
+        started = time.perf_counter()
+        try:
+            entries = await warm_up_cache(
+                response_cache,
+                llm_client,
+                system_prompt,
+                FIRST_TURN_HISTORY,
+                config.primary_model,
+                config.fallback_model,
+                concurrency=config.cache_warmup_concurrency,
+                temperature=config.temperature,
+                max_tokens=config.max_tokens,
+                top_p=config.top_p
+            )
+            duration = time.perf_counter() - started
+            metrics_collector.record_cache_warmup(duration, entries)
+            logger.info(f"Response cache warmed up: {entries} entries in {duration:.1f}s")
+        except Exception as e:
+            logger.error(f"Error in cache warm-up: {e}")
+
+        if not config.cache_warmup_refresh_seconds:
+            return
+        await asyncio.sleep(config.cache_warmup_refresh_seconds)
+
+
 async def start_hourly_stats_logging() -> None:
     """Запуск периодического логирования статистики каждый час."""
     while True:
@@ -58,37 +252,21 @@ async def handle_start(message: Message) -> None:
     user_name = message.from_user.first_name or "друг"
     user_id = message.from_user.id
     
-    # Очистка истории диалога при /start
-    clear_user_history(user_id)
-    
-    # Создание/получение сессии для сохранения в памяти
-    session = get_user_session(user_id, user_name)
-    
-    welcome_text = f"""Добро пожаловать, {user_name}! 👋
-
-Я - эксперт по формулировке целей обучения.
-
-🎯 Помогаю подбирать глаголы действия и составлять учебные цели для 6 уровней:
-
-1. **Знание** - запоминание фактов
-2. **Понимание** - объяснение концепций  
-3. **Применение** - использование на практике
-4. **Анализ** - разбор на части
-5. **Синтез** - создание нового
-6. **Оценка** - критическое мышление
-
-📝 **Как работать:**
-Выберите один из уровней выше (например, напишите "Применение" или "3"), и я предоставлю:
-• Глаголы действия для этого уровня
-• Примеры формулировок целей обучения
-
-Для получения примеров используйте команду /help"""
+    text = welcome_text(user_name)
     
-    # Сохранение команды и ответа в историю диалога
-    add_message(user_id, "user", "/start", config.max_history_size)
-    add_message(user_id, "assistant", welcome_text, config.max_history_size)
+    # Дожидаемся ответа на предыдущее сообщение, чтобы он не попал в новую историю
+    async with user_mailbox.lock(user_id):
+        # Очистка истории диалога при /start
+        clear_user_history(user_id)
+        
+        # Создание/получение сессии для сохранения в памяти
+        session = get_user_session(user_id, user_name)
+        
+        # Сохранение команды и ответа в историю диалога
+        add_message(user_id, "user", "/start", config.max_history_size)
+        add_message(user_id, "assistant", text, config.max_history_size)
     
-    await message.answer(welcome_text)
+    await message.answer(text)
     logger.info(f"Команда /start от пользователя {user_id}, сохранена в историю")
 
 
@@ -120,9 +298,10 @@ async def handle_help(message: Message) -> None:
 💡 **Формат цели:**
 "По окончании занятия обучаемые смогут [ГЛАГОЛ] [ОБЪЕКТ] в соответствии с положением/инструкцией/регламентом..." """
     
-    # Сохранение команды и ответа в историю диалога
-    add_message(user_id, "user", "/help", config.max_history_size)
-    add_message(user_id, "assistant", help_text, config.max_history_size)
+    # Сохранение команды и ответа в историю диалога после текущего ответа LLM
+    async with user_mailbox.lock(user_id):
+        add_message(user_id, "user", "/help", config.max_history_size)
+        add_message(user_id, "assistant", help_text, config.max_history_size)
     
     await message.answer(help_text)
     logger.info(f"Команда /help от пользователя {user_id}, сохранена в историю")
@@ -150,48 +329,96 @@ async def handle_message(message: Message) -> None:
         await message.answer(f"Сообщение слишком длинное. Максимум {config.max_message_length} символов.")
         return
     
-    try:
-        # Получение/создание сессии пользователя
-        session = get_user_session(user_id, user_name)
-        
-        # Получение истории диалога для LLM
-        history = get_user_history(user_id)
-        
-        # Добавление пользовательского сообщения в историю
-        add_message(user_id, "user", user_text, config.max_history_size)
-        
-        # Генерация ответа с учетом истории
-        logger.info(f"Generating LLM response with history for user {user_id} ({len(history)} messages)")
-        
-        response = await generate_response_with_history(
-            client=llm_client,
-            system_prompt=system_prompt,
-            user_message=user_text,
-            message_history=history,
-            primary_model=config.primary_model,
-            fallback_model=config.fallback_model,
-            retry_attempts=config.retry_attempts,
-            temperature=config.temperature,
-            max_tokens=config.max_tokens,
-            top_p=config.top_p
-        )
-        
-        # Добавление ответа ассистента в историю
-        add_message(user_id, "assistant", response, config.max_history_size)
-        
-        # Запись метрики успешного сообщения
+    # Склейка быстрой серии сообщений в один запрос (MESSAGE_DEBOUNCE_MS)
+    merged_text = await user_mailbox.collect(user_id, user_text)
+    if merged_text is None:
         metrics_collector.record_message(user_id, len(user_text), processed=True)
-        
-        await message.answer(response)
-        logger.info(f"LLM response with history sent to user {user_id}")
-        
-    except LLMError as e:
-        logger.error(f"LLM error for user {user_id}: {e}")
-        metrics_collector.record_message(user_id, len(user_text), processed=False)
-        error_message = "Извините, сервис временно недоступен. Попробуйте повторить запрос через несколько минут."
-        await message.answer(error_message)
-        
-    except Exception as e:
-        logger.error(f"Unexpected error for user {user_id}: {e}")
+        return
+    user_text = merged_text
+    if len(user_text) > config.max_message_length:
+        logger.warning(f"Merged messages too long from user {user_id}: {len(user_text)} chars")
         metrics_collector.record_message(user_id, len(user_text), processed=False)
-        await message.answer("Произошла внутренняя ошибка. Пожалуйста, попробуйте позже.")
\ No newline at end of file
+        await message.answer(f"Сообщения слишком длинные. Максимум {config.max_message_length} символов.")
+        return
+    
+    # Сообщения пользователя обрабатываются строго по очереди
+    async with user_mailbox.lock(user_id):
+        # Склейка и ожидание очереди не тратят время, отведенное на ответ
+        restart_deadline()
+        reply = None
+        try:
+            # Получение/создание сессии пользователя
+            session = get_user_session(user_id, user_name)
+            
+            # Получение истории диалога для LLM в пределах бюджета токенов:
+            # бюджет контекста минус системный промпт и новое сообщение
+            history_budget = config.max_context_tokens - system_prompt_tokens - estimate_message_tokens(user_text)
+            history = get_user_context(user_id, history_budget)
+            if is_first_turn(history):
+                metrics_collector.record_first_turn()
+                # В истории приветствие с именем, а запрос идет с общим (см. FIRST_TURN_HISTORY)
+                history = FIRST_TURN_HISTORY
+            
+            if config.summary_enabled:
+                summary = get_user_summary(user_id)
+                if summary is not None and history and history[0] is summary.message:
+                    metrics_collector.record_summary_usage(hit=True, tokens_saved=summary.saved_tokens)
+                elif history_needs_compaction(user_id, config.summary_threshold_tokens, config.summary_keep_recent):
+                    metrics_collector.record_summary_usage(hit=False)
+            
+            # Добавление пользовательского сообщения в историю
+            add_message(user_id, "user", user_text, config.max_history_size)
+            
+            # Генерация ответа с учетом истории
+            logger.info(f"Generating LLM response with history for user {user_id} ({len(history)} messages)")
+            
+            # Потоковый ответ показывается по мере генерации правками одного сообщения
+            reply = StreamingReply(message, config.stream_edit_interval_ms / 1000) if config.stream_responses else None
+            
+            # Токены запроса учитываются в метриках на этого пользователя
+            with usage_owner(user_id):
+                response = await generate_response_with_history(
+                    client=llm_client,
+                    system_prompt=system_prompt,
+                    user_message=user_text,
+                    message_history=history,
+                    primary_model=config.primary_model,
+                    fallback_model=config.fallback_model,
+                    retry_attempts=config.retry_attempts,
+                    cache=response_cache,
+                    on_delta=reply.update if reply else None,
+                    hedger=hedger,
+                    breakers=circuit_breakers if config.circuit_breaker_enabled else None,
+                    flights=llm_flights if config.request_coalescing else None,
+                    router=model_router if config.model_pool else None,
+                    retry_policy=retry_policy,
+                    temperature=config.temperature,
+                    max_tokens=config.max_tokens,
+                    top_p=config.top_p
+                )
+            
+            # Добавление ответа ассистента в историю
+            add_message(user_id, "assistant", response, config.max_history_size)
+            schedule_history_compaction(user_id)
+            
+            # Запись метрики успешного сообщения
+            metrics_collector.record_message(user_id, len(user_text), processed=True)
+            
+            if reply:
+                await reply.finish(response)
+            else:
+                await message.answer(response)
+            logger.info(f"LLM response with history sent to user {user_id}")
+            
+        except LLMError as e:
+            logger.error(f"LLM error for user {user_id}: {e}")
+            metrics_collector.record_message(user_id, len(user_text), processed=False)
+            error_message = "Извините, сервис временно недоступен. Попробуйте повторить запрос через несколько минут."
+            # Начатый потоковый ответ заменяется текстом ошибки
+            await (reply.fail if reply else message.answer)(error_message)
+            
+        except Exception as e:
+            logger.error(f"Unexpected error for user {user_id}: {e}")
+            metrics_collector.record_message(user_id, len(user_text), processed=False)
+            error_message = "Произошла внутренняя ошибка. Пожалуйста, попробуйте позже."
+            await (reply.fail if reply else message.answer)(error_message)
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""Последовательная обработка сообщений одного пользователя."""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _UserSlot:
+    """Блокировка пользователя и число задач, которые ее держат или ждут."""
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UserMailbox:
+    """Очередь обработки сообщений по user_id.
+
+    aiogram обрабатывает обновления конкурентно, поэтому два быстрых
+    сообщения одного пользователя читают одну и ту же историю и
+    отправляют два запроса к LLM. Блокировка пользователя выстраивает
+    его сообщения в порядке поступления; записи удаляются, как только
+    у пользователя не остается задач, поэтому словарь не растет вместе
+    с числом сессий.
+
+    При debounce_ms > 0 сообщения, пришедшие в течение окна после
+    первого, склеиваются в одно и обрабатываются одним запросом к LLM.
+    """
+
+    def __init__(self, debounce_ms: int = 0):
+        self.debounce_ms = debounce_ms
+        self._slots: Dict[int, _UserSlot] = {}
+        self._bursts: Dict[int, List[str]] = {}  # Открытые окна склейки
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @asynccontextmanager
+    async def lock(self, user_id: int) -> AsyncIterator[None]:
+        """Эксклюзивная обработка сообщения пользователя."""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._slots[user_id] = _UserSlot()
+        slot.users += 1
+        try:
+            async with slot.lock:
+                yield
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._slots[user_id]
+
+    async def collect(self, user_id: int, text: str) -> Optional[str]:
+        """Склейка пачки сообщений пользователя.
+
+        Возвращает текст для обработки или None, если сообщение вошло в
+        пачку, которую обработает задача первого сообщения.
+        """
+        if self.debounce_ms <= 0:
+            return text
+
+        burst = self._bursts.get(user_id)
+        if burst is not None:
+            burst.append(text)
+            return None
+
+        burst = self._bursts[user_id] = [text]
+        try:
+            await asyncio.sleep(self.debounce_ms / 1000)
+        finally:
+            del self._bursts[user_id]
+        if len(burst) > 1:
+            logger.info(f"Merged {len(burst)} messages from user {user_id} into one request")
+        return "\n".join(burst)
@@ -5,6 +5,7 @@ from typing import Callable, Any, Dict
 from aiogram import BaseMiddleware
 from aiogram.types import Message, TelegramObject
 
+from llm.deadline import deadline_scope
 from monitoring.metrics import metrics_collector
 
 logger = logging.getLogger(__name__)
@@ -120,4 +121,31 @@ class MetricsMiddleware(BaseMiddleware):
                 model=model,
                 response_time=response_time,
                 error_type=error_type
-            )
\ No newline at end of file
+            )
+
+class DeadlineMiddleware(BaseMiddleware):
+    """Middleware, задающее дедлайн обработки апдейта.
+
+    Дедлайн передается через contextvar (llm.deadline): каждая попытка
+    запроса к LLM получает только оставшееся время, и пользователь
+    быстро получает ошибку вместо многоминутного ожидания всех попыток.
+    Обработчик перезапускает отсчет (restart_deadline), когда дождался
+    своей очереди. seconds <= 0 отключает дедлайн.
+    """
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Any],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Выполнение обработчика в пределах дедлайна."""
+        with deadline_scope(self.seconds) as deadline:
+            try:
+                return await handler(event, data)
+            finally:
+                if deadline is not None and deadline.exceeded:
+                    metrics_collector.record_deadline_exceeded()
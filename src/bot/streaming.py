@@ -0,0 +1,117 @@
+"""Постепенный вывод потокового ответа LLM в Telegram."""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста одного сообщения Telegram
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+
+# Попыток вывести окончательный текст правкой до перехода на новое сообщение
+FINAL_EDIT_ATTEMPTS = 3
+
+
+class StreamingReply:
+    """Ответ, который дописывается редактированием одного сообщения.
+
+    Первый фрагмент текста отправляется новым сообщением, следующие
+    заменяют его текст через edit_text. Telegram ограничивает частоту
+    редактирования, поэтому правки не чаще одной за edit_interval
+    секунд: промежуточные фрагменты склеиваются, и показывается только
+    последний. Ошибки промежуточных правок не прерывают генерацию, а
+    finish выводит окончательный текст целиком: дожидается разрешенного
+    момента правки и retry_after, повторяет правку и, если сообщение
+    нельзя отредактировать, отправляет текст новым сообщением.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        edit_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    ):
+        self.message = message
+        self.edit_interval = edit_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._reply: Optional[Message] = None  # Отправленное сообщение с ответом
+        self._shown = ""                       # Текст, который сейчас виден пользователю
+        self._next_edit = 0.0                  # Раньше этого момента правки не отправляются
+        self.edits = 0
+
+    @property
+    def started(self) -> bool:
+        """Отправлено ли уже сообщение с ответом."""
+        return self._reply is not None
+
+    async def update(self, text: str) -> None:
+        """Показ накопленного текста, если с прошлой правки прошло достаточно времени."""
+        if self._clock() < self._next_edit:
+            return
+        await self._show(text[:TELEGRAM_MAX_MESSAGE_CHARS])
+
+    async def finish(self, text: str) -> None:
+        """Вывод окончательного текста; не вместившееся в одно сообщение уходит следующими."""
+        head = text[:TELEGRAM_MAX_MESSAGE_CHARS]
+        if self._reply is None:
+            await self.message.answer(head)
+        elif head != self._shown:
+            await self._edit_final(head)
+        for start in range(TELEGRAM_MAX_MESSAGE_CHARS, len(text), TELEGRAM_MAX_MESSAGE_CHARS):
+            await self.message.answer(text[start:start + TELEGRAM_MAX_MESSAGE_CHARS])
+
+    async def fail(self, text: str) -> None:
+        """Текст ошибки вместо частично выведенного ответа."""
+        if self._reply is None:
+            await self.message.answer(text)
+        else:
+            await self._edit_final(text)
+
+    async def _edit_final(self, text: str) -> None:
+        """Окончательная правка: ждет лимиты Telegram, при неудаче - новое сообщение."""
+        for _ in range(FINAL_EDIT_ATTEMPTS):
+            wait = self._next_edit - self._clock()
+            if wait > 0:
+                await self._sleep(wait)
+            try:
+                await self._reply.edit_text(text)
+                self.edits += 1
+                self._shown = text
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(f"Telegram edit rate limit hit, retrying final edit in {e.retry_after}s")
+                self._next_edit = self._clock() + e.retry_after
+            except TelegramBadRequest as e:
+                if "message is not modified" in str(e):
+                    self._shown = text
+                    return
+                logger.warning(f"Streaming reply can not be edited, sending new message: {e}")
+                break
+            except TelegramAPIError as e:
+                logger.warning(f"Failed to edit streaming reply, retrying: {e}")
+                self._next_edit = self._clock() + self.edit_interval
+        await self.message.answer(text)
+
+    async def _show(self, text: str) -> None:
+        if text == self._shown:
+            return
+        try:
+            if self._reply is None:
+                self._reply = await self.message.answer(text)
+            else:
+                await self._reply.edit_text(text)
+                self.edits += 1
+            self._shown = text
+            self._next_edit = self._clock() + self.edit_interval
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram edit rate limit hit, pausing edits for {e.retry_after}s")
+            self._next_edit = self._clock() + e.retry_after
+        except TelegramAPIError as e:
+            logger.warning(f"Failed to update streaming reply: {e}")
+            self._next_edit = self._clock() + self.edit_interval
@@ -0,0 +1,94 @@
+"""HTTP-сессия Telegram: пул соединений, keep-alive и метрики соединений."""
+import asyncio
+import logging
+import ssl
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import certifi
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiohttp import (
+    ClientSession, TCPConnector, TraceConfig, TraceConnectionCreateEndParams, TraceConnectionCreateStartParams,
+    TraceConnectionReuseconnParams
+)
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Имя пула в метриках
+POOL_NAME = "telegram"
+
+
+async def _on_connection_create_start(
+    session: ClientSession, context: SimpleNamespace, params: TraceConnectionCreateStartParams
+) -> None:
+    context.connect_started = time.perf_counter()
+
+
+async def _on_connection_create_end(
+    session: ClientSession, context: SimpleNamespace, params: TraceConnectionCreateEndParams
+) -> None:
+    metrics_collector.record_http_connection(POOL_NAME, time.perf_counter() - context.connect_started)
+    metrics_collector.record_http_request(POOL_NAME, reused=False)
+
+
+async def _on_connection_reuseconn(
+    session: ClientSession, context: SimpleNamespace, params: TraceConnectionReuseconnParams
+) -> None:
+    metrics_collector.record_http_request(POOL_NAME, reused=True)
+
+
+def connection_trace_config() -> TraceConfig:
+    """Трассировка aiohttp: время установки соединений и доля повторных."""
+    trace_config = TraceConfig()
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.freeze()
+    return trace_config
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """Сессия aiogram с настроенным пулом соединений к Telegram Bot API.
+
+    limit - число одновременных соединений, keepalive_timeout - сколько
+    секунд держать простаивающее соединение. Long polling держит одно
+    соединение почти постоянно, поэтому keep-alive важен в основном для
+    ответов и правок сообщений между обновлениями.
+
+    ClientSession с коннектором и трассировкой собирается здесь же, а не
+    через внутреннее состояние AiohttpSession; прокси не поддерживается.
+    """
+
+    def __init__(self, limit: int = 100, keepalive_timeout: float = 60.0, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self._client_session: Optional[ClientSession] = None
+
+    async def create_session(self) -> ClientSession:
+        if self._client_session is None or self._client_session.closed:
+            connector = TCPConnector(
+                ssl=ssl.create_default_context(cafile=certifi.where()),
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=3600
+            )
+            self._client_session = ClientSession(
+                connector=connector,
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[connection_trace_config()]
+            )
+        return self._client_session
+
+    async def close(self) -> None:
+        if self._client_session is not None and not self._client_session.closed:
+            await self._client_session.close()
+            # Время на закрытие SSL-соединений, как в AiohttpSession.close
+            await asyncio.sleep(0.25)
+
@@ -1,7 +1,8 @@
 """Настройки приложения из переменных окружения."""
 import os
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -14,17 +15,69 @@ class Config:
     openrouter_api_key: str
     primary_model: str = "qwen/qwen-2.5-72b-instruct:free"
     fallback_model: str = "deepseek/deepseek-chat-v3.1:free"
+    model_pool: List[str] = field(default_factory=list)
+    router_exploration: float = 0.1
     temperature: float = 0.7
     max_tokens: int = 1500
     top_p: float = 0.9
     retry_attempts: int = 3
     max_message_length: int = 1000
+    message_debounce_ms: int = 0
     memory_ttl_hours: int = 24
     max_history_size: int = 10
+    max_context_tokens: int = 8000
+    summary_enabled: bool = False
+    summary_threshold_tokens: int = 3000
+    summary_keep_recent: int = 4
+    summary_model: str = ""
+    response_cache_size: int = 1000
+    response_cache_ttl_seconds: int = 3600
+    response_cache_stale_seconds: int = 0
+    response_cache_max_entry_chars: int = 8000
+    cache_warmup_enabled: bool = False
+    cache_warmup_concurrency: int = 2
+    cache_warmup_refresh_seconds: int = 1800
+    stream_responses: bool = True
+    stream_edit_interval_ms: int = 1000
+    hedge_enabled: bool = False
+    hedge_delay_ms: int = 0
+    circuit_breaker_enabled: bool = True
+    circuit_window: int = 20
+    circuit_failure_rate: float = 0.5
+    circuit_min_requests: int = 5
+    circuit_open_seconds: int = 30
+    llm_max_concurrency: int = 8
+    llm_rate_per_minute: int = 20
+    llm_rate_burst: int = 5
+    llm_adaptive_concurrency: bool = True
+    llm_min_concurrency: int = 1
+    llm_adaptive_timeouts: bool = True
+    llm_timeout_factor: float = 2.0
+    llm_timeout_min_seconds: int = 5
+    llm_timeout_max_seconds: int = 60
+    request_deadline_seconds: int = 60
+    retry_base_delay_seconds: float = 1.0
+    retry_max_delay_seconds: float = 10.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min_retries: int = 3
+    request_coalescing: bool = True
+    llm_http_max_connections: int = 20
+    llm_http_keepalive_connections: int = 10
+    llm_http2: bool = False
+    telegram_http_max_connections: int = 100
+    http_keepalive_seconds: int = 60
+    http_prewarm: bool = True
     cleanup_interval_hours: int = 6
+    expiry_interval_seconds: int = 60
+    expiry_batch_size: int = 500
     enable_metrics: bool = True
     metrics_cleanup_hours: int = 24
     log_hourly_stats: bool = True
+    session_backend: str = "memory"
+    session_db_path: str = "data/sessions.db"
+    snapshot_path: str = "data/sessions.snapshot"
+    memory_budget_mb: int = 256
+    spill_path: str = "data/sessions.spill"
 
 
 def load_config() -> Config:
@@ -37,17 +90,69 @@ def load_config() -> Config:
         openrouter_api_key=os.getenv("OPENROUTER_API_KEY", ""),
         primary_model=os.getenv("PRIMARY_MODEL", "qwen/qwen-2.5-72b-instruct:free"),
         fallback_model=os.getenv("FALLBACK_MODEL", "deepseek/deepseek-chat-v3.1:free"),
+        model_pool=[model.strip() for model in os.getenv("MODEL_POOL", "").split(",") if model.strip()],
+        router_exploration=float(os.getenv("ROUTER_EXPLORATION", "0.1")),
         temperature=float(os.getenv("TEMPERATURE", "0.7")),
         max_tokens=int(os.getenv("MAX_TOKENS", "1500")),
         top_p=float(os.getenv("TOP_P", "0.9")),
         retry_attempts=int(os.getenv("RETRY_ATTEMPTS", "3")),
         max_message_length=int(os.getenv("MAX_MESSAGE_LENGTH", "1000")),
+        message_debounce_ms=int(os.getenv("MESSAGE_DEBOUNCE_MS", "0")),
         memory_ttl_hours=int(os.getenv("MEMORY_TTL_HOURS", "24")),
         max_history_size=int(os.getenv("MAX_HISTORY_SIZE", "10")),
+        max_context_tokens=int(os.getenv("MAX_CONTEXT_TOKENS", "8000")),
+        summary_enabled=os.getenv("SUMMARY_ENABLED", "false").lower() == "true",
+        summary_threshold_tokens=int(os.getenv("SUMMARY_THRESHOLD_TOKENS", "3000")),
+        summary_keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", "4")),
+        summary_model=os.getenv("SUMMARY_MODEL", ""),
+        response_cache_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        response_cache_ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+        response_cache_stale_seconds=int(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "0")),
+        response_cache_max_entry_chars=int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_CHARS", "8000")),
+        cache_warmup_enabled=os.getenv("CACHE_WARMUP_ENABLED", "false").lower() == "true",
+        cache_warmup_concurrency=int(os.getenv("CACHE_WARMUP_CONCURRENCY", "2")),
+        cache_warmup_refresh_seconds=int(os.getenv("CACHE_WARMUP_REFRESH_SECONDS", "1800")),
+        stream_responses=os.getenv("STREAM_RESPONSES", "true").lower() == "true",
+        stream_edit_interval_ms=int(os.getenv("STREAM_EDIT_INTERVAL_MS", "1000")),
+        hedge_enabled=os.getenv("HEDGE_ENABLED", "false").lower() == "true",
+        hedge_delay_ms=int(os.getenv("HEDGE_DELAY_MS", "0")),
+        circuit_breaker_enabled=os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true",
+        circuit_window=int(os.getenv("CIRCUIT_WINDOW", "20")),
+        circuit_failure_rate=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+        circuit_min_requests=int(os.getenv("CIRCUIT_MIN_REQUESTS", "5")),
+        circuit_open_seconds=int(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),
+        llm_max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        llm_rate_per_minute=int(os.getenv("LLM_RATE_PER_MINUTE", "20")),
+        llm_rate_burst=int(os.getenv("LLM_RATE_BURST", "5")),
+        llm_adaptive_concurrency=os.getenv("LLM_ADAPTIVE_CONCURRENCY", "true").lower() == "true",
+        llm_min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+        llm_adaptive_timeouts=os.getenv("LLM_ADAPTIVE_TIMEOUTS", "true").lower() == "true",
+        llm_timeout_factor=float(os.getenv("LLM_TIMEOUT_FACTOR", "2.0")),
+        llm_timeout_min_seconds=int(os.getenv("LLM_TIMEOUT_MIN_SECONDS", "5")),
+        llm_timeout_max_seconds=int(os.getenv("LLM_TIMEOUT_MAX_SECONDS", "60")),
+        request_deadline_seconds=int(os.getenv("REQUEST_DEADLINE_SECONDS", "60")),
+        retry_base_delay_seconds=float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1.0")),
+        retry_max_delay_seconds=float(os.getenv("RETRY_MAX_DELAY_SECONDS", "10.0")),
+        retry_budget_ratio=float(os.getenv("RETRY_BUDGET_RATIO", "0.2")),
+        retry_budget_min_retries=int(os.getenv("RETRY_BUDGET_MIN_RETRIES", "3")),
+        request_coalescing=os.getenv("REQUEST_COALESCING", "true").lower() == "true",
+        llm_http_max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20")),
+        llm_http_keepalive_connections=int(os.getenv("LLM_HTTP_KEEPALIVE_CONNECTIONS", "10")),
+        llm_http2=os.getenv("LLM_HTTP2", "false").lower() == "true",
+        telegram_http_max_connections=int(os.getenv("TELEGRAM_HTTP_MAX_CONNECTIONS", "100")),
+        http_keepalive_seconds=int(os.getenv("HTTP_KEEPALIVE_SECONDS", "60")),
+        http_prewarm=os.getenv("HTTP_PREWARM", "true").lower() == "true",
         cleanup_interval_hours=int(os.getenv("CLEANUP_INTERVAL_HOURS", "6")),
+        expiry_interval_seconds=int(os.getenv("EXPIRY_INTERVAL_SECONDS", "60")),
+        expiry_batch_size=int(os.getenv("EXPIRY_BATCH_SIZE", "500")),
         enable_metrics=os.getenv("ENABLE_METRICS", "true").lower() == "true",
         metrics_cleanup_hours=int(os.getenv("METRICS_CLEANUP_HOURS", "24")),
-        log_hourly_stats=os.getenv("LOG_HOURLY_STATS", "true").lower() == "true"
+        log_hourly_stats=os.getenv("LOG_HOURLY_STATS", "true").lower() == "true",
+        session_backend=os.getenv("SESSION_BACKEND", "memory").lower(),
+        session_db_path=os.getenv("SESSION_DB_PATH", "data/sessions.db"),
+        snapshot_path=os.getenv("SNAPSHOT_PATH", "data/sessions.snapshot"),
+        memory_budget_mb=int(os.getenv("MEMORY_BUDGET_MB", "256")),
+        spill_path=os.getenv("SPILL_PATH", "data/sessions.spill")
     )
     
     validate_config(config)
@@ -68,6 +173,8 @@ def validate_config(config: Config) -> None:
     # Проверка диапазонов значений
     if not (0.0 <= config.temperature <= 2.0):
         raise ValueError(f"TEMPERATURE должна быть от 0.0 до 2.0, получено: {config.temperature}")
+    if not (0.0 <= config.router_exploration <= 1.0):
+        raise ValueError(f"ROUTER_EXPLORATION должна быть от 0.0 до 1.0, получено: {config.router_exploration}")
     if config.max_tokens <= 0:
         raise ValueError(f"MAX_TOKENS должен быть > 0, получено: {config.max_tokens}")
     if not (0.0 <= config.top_p <= 1.0):
@@ -76,13 +183,101 @@ def validate_config(config: Config) -> None:
         raise ValueError(f"RETRY_ATTEMPTS должен быть > 0, получено: {config.retry_attempts}")
     if config.max_message_length <= 0:
         raise ValueError(f"MAX_MESSAGE_LENGTH должен быть > 0, получено: {config.max_message_length}")
+    if config.message_debounce_ms < 0:
+        raise ValueError(f"MESSAGE_DEBOUNCE_MS должен быть >= 0, получено: {config.message_debounce_ms}")
     if config.memory_ttl_hours <= 0:
         raise ValueError(f"MEMORY_TTL_HOURS должен быть > 0, получено: {config.memory_ttl_hours}")
     if config.max_history_size <= 0:
         raise ValueError(f"MAX_HISTORY_SIZE должен быть > 0, получено: {config.max_history_size}")
+    if config.max_context_tokens <= 0:
+        raise ValueError(f"MAX_CONTEXT_TOKENS должен быть > 0, получено: {config.max_context_tokens}")
+    if config.summary_threshold_tokens <= 0:
+        raise ValueError(f"SUMMARY_THRESHOLD_TOKENS должен быть > 0, получено: {config.summary_threshold_tokens}")
+    if config.summary_keep_recent < 0:
+        raise ValueError(f"SUMMARY_KEEP_RECENT должен быть >= 0, получено: {config.summary_keep_recent}")
+    if config.response_cache_size < 0:
+        raise ValueError(f"RESPONSE_CACHE_SIZE должен быть >= 0, получено: {config.response_cache_size}")
+    if config.response_cache_ttl_seconds <= 0:
+        raise ValueError(f"RESPONSE_CACHE_TTL_SECONDS должен быть > 0, получено: {config.response_cache_ttl_seconds}")
+    if config.response_cache_stale_seconds < 0:
+        raise ValueError(f"RESPONSE_CACHE_STALE_SECONDS должен быть >= 0, получено: {config.response_cache_stale_seconds}")
+    if config.response_cache_max_entry_chars <= 0:
+        raise ValueError(f"RESPONSE_CACHE_MAX_ENTRY_CHARS должен быть > 0, получено: {config.response_cache_max_entry_chars}")
+    if config.cache_warmup_concurrency <= 0:
+        raise ValueError(f"CACHE_WARMUP_CONCURRENCY должен быть > 0, получено: {config.cache_warmup_concurrency}")
+    if config.cache_warmup_refresh_seconds < 0:
+        raise ValueError(f"CACHE_WARMUP_REFRESH_SECONDS должен быть >= 0, получено: {config.cache_warmup_refresh_seconds}")
+    if config.stream_edit_interval_ms <= 0:
+        raise ValueError(f"STREAM_EDIT_INTERVAL_MS должен быть > 0, получено: {config.stream_edit_interval_ms}")
+    if config.hedge_delay_ms < 0:
+        raise ValueError(f"HEDGE_DELAY_MS должен быть >= 0, получено: {config.hedge_delay_ms}")
+    if config.circuit_window <= 0:
+        raise ValueError(f"CIRCUIT_WINDOW должен быть > 0, получено: {config.circuit_window}")
+    if not 0.0 < config.circuit_failure_rate <= 1.0:
+        raise ValueError(f"CIRCUIT_FAILURE_RATE должен быть от 0 до 1, получено: {config.circuit_failure_rate}")
+    if not 0 < config.circuit_min_requests <= config.circuit_window:
+        raise ValueError(
+            f"CIRCUIT_MIN_REQUESTS должен быть от 1 до CIRCUIT_WINDOW, получено: {config.circuit_min_requests}"
+        )
+    if config.circuit_open_seconds <= 0:
+        raise ValueError(f"CIRCUIT_OPEN_SECONDS должен быть > 0, получено: {config.circuit_open_seconds}")
+    if config.llm_max_concurrency < 0:
+        raise ValueError(f"LLM_MAX_CONCURRENCY должен быть >= 0, получено: {config.llm_max_concurrency}")
+    if config.llm_rate_per_minute < 0:
+        raise ValueError(f"LLM_RATE_PER_MINUTE должен быть >= 0, получено: {config.llm_rate_per_minute}")
+    if config.llm_rate_burst <= 0:
+        raise ValueError(f"LLM_RATE_BURST должен быть > 0, получено: {config.llm_rate_burst}")
+    if config.llm_min_concurrency <= 0:
+        raise ValueError(f"LLM_MIN_CONCURRENCY должен быть > 0, получено: {config.llm_min_concurrency}")
+    if config.llm_max_concurrency and config.llm_min_concurrency > config.llm_max_concurrency:
+        raise ValueError(
+            f"LLM_MIN_CONCURRENCY не может превышать LLM_MAX_CONCURRENCY, получено: {config.llm_min_concurrency}"
+        )
+    if config.llm_timeout_factor < 1:
+        raise ValueError(f"LLM_TIMEOUT_FACTOR должен быть >= 1, получено: {config.llm_timeout_factor}")
+    if config.llm_timeout_min_seconds <= 0:
+        raise ValueError(f"LLM_TIMEOUT_MIN_SECONDS должен быть > 0, получено: {config.llm_timeout_min_seconds}")
+    if config.llm_timeout_max_seconds < config.llm_timeout_min_seconds:
+        raise ValueError(
+            f"LLM_TIMEOUT_MAX_SECONDS не может быть меньше LLM_TIMEOUT_MIN_SECONDS, "
+            f"получено: {config.llm_timeout_max_seconds}"
+        )
+    if config.request_deadline_seconds < 0:
+        raise ValueError(f"REQUEST_DEADLINE_SECONDS должен быть >= 0, получено: {config.request_deadline_seconds}")
+    if config.retry_base_delay_seconds < 0:
+        raise ValueError(f"RETRY_BASE_DELAY_SECONDS должен быть >= 0, получено: {config.retry_base_delay_seconds}")
+    if config.retry_max_delay_seconds < config.retry_base_delay_seconds:
+        raise ValueError(
+            f"RETRY_MAX_DELAY_SECONDS не может быть меньше RETRY_BASE_DELAY_SECONDS, "
+            f"получено: {config.retry_max_delay_seconds}"
+        )
+    if config.retry_budget_ratio < 0:
+        raise ValueError(f"RETRY_BUDGET_RATIO должен быть >= 0, получено: {config.retry_budget_ratio}")
+    if config.retry_budget_min_retries < 0:
+        raise ValueError(f"RETRY_BUDGET_MIN_RETRIES должен быть >= 0, получено: {config.retry_budget_min_retries}")
+    if config.llm_http_max_connections < 0:
+        raise ValueError(f"LLM_HTTP_MAX_CONNECTIONS должен быть >= 0, получено: {config.llm_http_max_connections}")
+    if config.llm_http_keepalive_connections < 0:
+        raise ValueError(
+            f"LLM_HTTP_KEEPALIVE_CONNECTIONS должен быть >= 0, получено: {config.llm_http_keepalive_connections}"
+        )
+    if config.telegram_http_max_connections <= 0:
+        raise ValueError(
+            f"TELEGRAM_HTTP_MAX_CONNECTIONS должен быть > 0, получено: {config.telegram_http_max_connections}"
+        )
+    if config.http_keepalive_seconds <= 0:
+        raise ValueError(f"HTTP_KEEPALIVE_SECONDS должен быть > 0, получено: {config.http_keepalive_seconds}")
     if config.cleanup_interval_hours <= 0:
         raise ValueError(f"CLEANUP_INTERVAL_HOURS должен быть > 0, получено: {config.cleanup_interval_hours}")
+    if config.expiry_interval_seconds <= 0:
+        raise ValueError(f"EXPIRY_INTERVAL_SECONDS должен быть > 0, получено: {config.expiry_interval_seconds}")
+    if config.expiry_batch_size <= 0:
+        raise ValueError(f"EXPIRY_BATCH_SIZE должен быть > 0, получено: {config.expiry_batch_size}")
     if config.metrics_cleanup_hours <= 0:
         raise ValueError(f"METRICS_CLEANUP_HOURS должен быть > 0, получено: {config.metrics_cleanup_hours}")
+    if config.memory_budget_mb < 0:
+        raise ValueError(f"MEMORY_BUDGET_MB должен быть >= 0, получено: {config.memory_budget_mb}")
+    if config.session_backend not in ("memory", "sqlite"):
+        raise ValueError(f"SESSION_BACKEND должен быть memory или sqlite, получено: {config.session_backend}")
     
     logger.info("Configuration validation completed successfully")
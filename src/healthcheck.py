@@ -3,6 +3,13 @@ import asyncio
 import logging
 from aiohttp import web
 
+from llm.circuit import circuit_breakers
+from llm.limiter import request_limiter
+from llm.router import model_router
+from llm.timeouts import llm_timeouts
+from memory.storage import get_session_stats
+from monitoring.metrics import metrics_collector
+
 logger = logging.getLogger(__name__)
 
 async def health_handler(request):
@@ -10,7 +17,13 @@ async def health_handler(request):
     return web.json_response({
         "status": "healthy",
         "service": "llm-learning-goals-bot",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "sessions": get_session_stats(),
+        "llm_circuits": circuit_breakers.states(),
+        "llm_concurrency": request_limiter.snapshot(),
+        "llm_timeouts": llm_timeouts.snapshot(),
+        "llm_router": model_router.snapshot(),
+        "http_pools": metrics_collector.get_http_pool_stats()
     })
 
 async def start_healthcheck_server(port: int = 8080):
@@ -0,0 +1,120 @@
+"""Кэш ответов LLM по нормализованному контексту запроса."""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[Hashable, ...]
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста пользователя: регистр и пробелы не влияют на ключ."""
+    return " ".join(text.split()).casefold()
+
+
+class CacheEntry:
+    """Закэшированный ответ."""
+    __slots__ = ("value", "created", "cost", "warm")
+
+    def __init__(self, value: str, created: float, cost: float, warm: bool = False):
+        self.value = value
+        self.created = created  # Время сохранения (монотонные часы)
+        self.cost = cost        # Сколько секунд занял исходный запрос к LLM
+        self.warm = warm        # Запись создана прогревом, а не запросом пользователя
+
+
+class ResponseCache:
+    """LRU-кэш ответов с TTL и режимом stale-while-revalidate.
+
+    Запись свежая ttl_seconds после сохранения. Следующие stale_seconds
+    она отдается как устаревшая, а ответ обновляется в фоне (не более
+    одного обновления на ключ). Ответы длиннее max_entry_chars не
+    кэшируются, чтобы несколько огромных ответов не вытеснили остальные.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        stale_seconds: float = 0,
+        max_entry_chars: int = 8000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entry_chars = max_entry_chars
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._refreshing: Dict[CacheKey, asyncio.Task] = {}  # Фоновые обновления по ключам
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(
+        model: str,
+        system_prompt: str,
+        user_message: str,
+        history: Sequence[Dict[str, str]]
+    ) -> CacheKey:
+        """Ключ: модель, хэш системного промпта, нормализованный текст и хэш истории.
+
+        Хэши строк Python кэширует в самих объектах, а тексты истории
+        приходят из неизменяемого представления хранилища, поэтому
+        вычисление ключа не перечитывает содержимое сообщений.
+        """
+        history_hash = hash(tuple((msg["role"], msg["content"]) for msg in history))
+        return model, hash(system_prompt), normalize_text(user_message), history_hash
+
+    def get(self, key: CacheKey) -> Tuple[Optional[CacheEntry], bool]:
+        """Поиск записи: (запись или None, устарела ли она)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+
+        age = self._clock() - entry.created
+        if age < self.ttl_seconds:
+            self._entries.move_to_end(key)
+            return entry, False
+        if age < self.ttl_seconds + self.stale_seconds:
+            self._entries.move_to_end(key)
+            return entry, True
+
+        del self._entries[key]
+        return None, False
+
+    def put(self, key: CacheKey, value: str, cost: float, warm: bool = False) -> bool:
+        """Сохранение ответа; False, если ответ превышает лимит размера."""
+        if len(value) > self.max_entry_chars:
+            logger.debug(f"Response of {len(value)} chars not cached: over {self.max_entry_chars} limit")
+            return False
+
+        self._entries[key] = CacheEntry(value, self._clock(), cost, warm)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def revalidate(self, key: CacheKey, fetch: Callable[[], Awaitable[str]]) -> None:
+        """Фоновое обновление устаревшей записи, если оно еще не запущено."""
+        if key in self._refreshing:
+            return
+        # Обновление переживает вызвавший его апдейт: пустой контекст не
+        # наследует ни его дедлайн, ни владельца токенов
+        task = asyncio.create_task(self._refresh(key, fetch), context=contextvars.Context())
+        self._refreshing[key] = task
+
+    async def _refresh(self, key: CacheKey, fetch: Callable[[], Awaitable[str]]) -> None:
+        started = time.perf_counter()
+        try:
+            value = await fetch()
+            self.put(key, value, time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Background cache refresh failed: {e}")
+        finally:
+            del self._refreshing[key]
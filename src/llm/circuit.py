@@ -0,0 +1,141 @@
+"""Предохранители (circuit breaker) для моделей LLM."""
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Предохранитель одной модели.
+
+    closed - запросы идут, исходы копятся в окне из window последних
+    запросов; при доле ошибок не ниже failure_rate (и не менее
+    min_requests исходов) предохранитель размыкается.
+    open - запросы к модели сразу отклоняются, клиент переходит к
+    следующей модели без попыток и пауз.
+    half_open - через open_seconds пропускается один пробный запрос:
+    успех замыкает предохранитель, ошибка снова размыкает на open_seconds.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        window: int = 20,
+        failure_rate: float = 0.5,
+        min_requests: int = 5,
+        open_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.model = model
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True - успешный запрос
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.state = CLOSED
+
+    def current_failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def is_open(self) -> bool:
+        """Отклоняет ли предохранитель запросы сейчас (без перехода в half_open)."""
+        return self.state == OPEN and self._clock() - self._opened_at < self.open_seconds
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос; в half_open пропускается один пробный."""
+        if self.state == OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                return False
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._outcomes.clear()
+            self._transition(CLOSED)
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._open()
+            return
+        self._outcomes.append(False)
+        if self.state == CLOSED and len(self._outcomes) >= self.min_requests \
+                and self.current_failure_rate() >= self.failure_rate:
+            self._open()
+
+    def record_cancelled(self) -> None:
+        """Отмененный запрос (например, проигравший хедж) не считается исходом."""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние для healthcheck."""
+        info: Dict[str, Any] = {
+            "state": self.state,
+            "failure_rate": round(self.current_failure_rate(), 3),
+            "requests_in_window": len(self._outcomes)
+        }
+        if self.state == OPEN:
+            info["retry_in_seconds"] = round(max(0.0, self._opened_at + self.open_seconds - self._clock()), 1)
+        return info
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        logger.warning(
+            f"Circuit for model {self.model}: {self.state} -> {state} "
+            f"(failure rate {self.current_failure_rate():.0%})"
+        )
+        self.state = state
+        metrics_collector.record_circuit_transition(self.model, state)
+
+
+class CircuitBreakerRegistry:
+    """Предохранители по именам моделей, создаются при первом обращении."""
+
+    def __init__(self, **breaker_params):
+        self._params = breaker_params
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def __len__(self) -> int:
+        return len(self._breakers)
+
+    def configure(self, **breaker_params) -> None:
+        """Параметры для новых предохранителей; существующие сбрасываются."""
+        self._params = breaker_params
+        self._breakers.clear()
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker(model, **self._params)
+        return breaker
+
+    def states(self) -> Dict[str, Dict[str, Any]]:
+        return {model: breaker.snapshot() for model, breaker in self._breakers.items()}
+
+
+# Глобальный реестр: его состояние показывает healthcheck
+circuit_breakers = CircuitBreakerRegistry()
@@ -1,24 +1,118 @@
 """Клиент для работы с OpenRouter API."""
 import logging
 import asyncio
-from openai import AsyncOpenAI
-from typing import List, Dict, Any, Optional
+import time
+from functools import lru_cache
+from openai import APITimeoutError, AsyncOpenAI
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Sequence, Tuple
+
+from memory.tokens import estimate_tokens
+from monitoring.metrics import metrics_collector
+
+from .cache import ResponseCache
+from .circuit import CircuitBreakerRegistry
+from .deadline import Deadline, current_deadline, fits_deadline, use_deadline
+from .hedging import Hedger
+from .limiter import request_limiter
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy
+from .router import ModelRouter
+from .singleflight import SingleFlight
+from .summary import SUMMARY_MAX_CHARS, Turn, build_summary_messages
+from .timeouts import llm_timeouts
+from .usage import TokenUsage, current_usage_owner, parse_usage, usage_owner
 
 logger = logging.getLogger(__name__)
 
+# Получает весь накопленный к этому моменту текст ответа
+DeltaCallback = Callable[[str], Awaitable[None]]
+
 
 class LLMError(Exception):
     """Исключение для ошибок LLM."""
     pass
 
 
-async def create_llm_client(api_key: str, base_url: str = "https://openrouter.ai/api/v1") -> AsyncOpenAI:
-    """Создание асинхронного клиента OpenRouter."""
+class CircuitOpenError(LLMError):
+    """Запрос не отправлен: предохранитель модели разомкнут."""
+    pass
+
+
+class DeadlineExceededError(LLMError):
+    """Время на ответ пользователю истекло, дальнейшие попытки бессмысленны."""
+    pass
+
+
+def _request_budget(model: str, timeout: float) -> Tuple[Optional[Deadline], float]:
+    """Дедлайн апдейта и таймаут запроса с его учетом (для метрик).
+
+    Если время уже вышло, запрос не отправляется.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return None, timeout
+    remaining = deadline.remaining()
+    if not remaining:
+        raise _deadline_exceeded(deadline, model)
+    return deadline, min(timeout, remaining)
+
+
+def _record_usage(model: str, usage: Optional[TokenUsage], duration: float) -> None:
+    """Токены запроса в метрики: по модели и по пользователю из контекста (llm.usage)."""
+    if usage is None:
+        return
+    metrics_collector.record_token_usage(
+        model, usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens, duration, current_usage_owner()
+    )
+
+
+def _deadline_exceeded(deadline: Deadline, model: str) -> DeadlineExceededError:
+    deadline.exceeded = True
+    logger.warning(f"Deadline exceeded before model {model} answered")
+    return DeadlineExceededError("Время ожидания ответа истекло")
+
+
+@lru_cache(maxsize=8)
+def _system_message(system_prompt: str) -> Dict[str, str]:
+    """Сообщение с системным промптом, создается один раз на промпт."""
+    return {"role": "system", "content": system_prompt}
+
+
+async def create_llm_client(
+    api_key: str,
+    base_url: str = "https://openrouter.ai/api/v1",
+    max_connections: int = 0,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 60.0,
+    http2: bool = False,
+    prewarm: bool = False
+) -> AsyncOpenAI:
+    """Создание асинхронного клиента OpenRouter.
+
+    При max_connections > 0 клиент получает настроенный пул соединений
+    (см. llm.transport), а при prewarm соединение открывается сразу.
+    Встроенные повторы SDK отключены: повторами управляет llm.retry
+    (паузы с jitter, бюджет повторов), а таймауты и дедлайн рассчитаны
+    на одну попытку.
+    """
     logger.info("Creating LLM client for OpenRouter API")
-    return AsyncOpenAI(
+    if not max_connections:
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0
+        )
+    
+    from .transport import create_http_client, prewarm_http_client
+    http_client = create_http_client(max_connections, max_keepalive_connections, keepalive_expiry, http2)
+    client = AsyncOpenAI(
         api_key=api_key,
-        base_url=base_url
+        base_url=base_url,
+        max_retries=0,
+        http_client=http_client
     )
+    if prewarm:
+        await prewarm_http_client(http_client, base_url)
+    return client
 
 
 async def send_request(
@@ -29,29 +123,117 @@ async def send_request(
     max_tokens: int = 1500,
     top_p: float = 0.9
 ) -> str:
-    """Отправка запроса к LLM модели."""
+    """Отправка запроса к LLM модели (в пределах общего лимита запросов).
+
+    Таймаут подбирается по наблюдаемой задержке модели (см. llm.timeouts).
+    Ожидание в очереди и сам запрос обрываются дедлайном апдейта
+    (см. llm.deadline) с DeadlineExceededError.
+    """
+    timeout = llm_timeouts.timeout(model)
+    deadline, budget = _request_budget(model, timeout)
     try:
-        logger.info(f"Sending request to model {model}")
-        
-        response = await client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=top_p,
-            timeout=30.0
-        )
+        async with asyncio.timeout_at(deadline.at if deadline else None), request_limiter.slot(model, budget):
+            logger.info(f"Sending request to model {model}, timeout {timeout:.1f}s")
+            
+            started = time.perf_counter()
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                timeout=timeout
+            )
+            duration = time.perf_counter() - started
+            llm_timeouts.observe(model, duration)
         
         content = response.choices[0].message.content
         if not content:
             raise LLMError("Пустой ответ от LLM")
-            
+        
+        _record_usage(model, parse_usage(getattr(response, "usage", None)), duration)
         logger.info(f"LLM response received, length: {len(content)}")
         return content
         
     except Exception as e:
+        if isinstance(e, TimeoutError) and deadline is not None and not deadline.remaining():
+            raise _deadline_exceeded(deadline, model) from e
         logger.error(f"LLM request failed: {e}")
-        raise LLMError(f"Ошибка запроса к LLM: {e}")
+        if isinstance(e, APITimeoutError):
+            llm_timeouts.observe_timeout(model, timeout)
+            metrics_collector.record_llm_timeout(model)
+        request_limiter.on_error(model, e)
+        raise LLMError(f"Ошибка запроса к LLM: {e}") from e
+
+
+async def stream_request(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, str]],
+    model: str,
+    on_delta: DeltaCallback,
+    temperature: float = 0.7,
+    max_tokens: int = 1500,
+    top_p: float = 0.9
+) -> str:
+    """Потоковый запрос к LLM: on_delta вызывается с текстом по мере генерации.
+
+    Место в общем лимите запросов занято до конца потока. Таймаут
+    подбирается по времени до первого токена и действует между фрагментами.
+    Поток, как и обычный запрос, обрывается дедлайном апдейта.
+    """
+    timeout = llm_timeouts.timeout(model, stream=True)
+    deadline, budget = _request_budget(model, timeout)
+    try:
+        logger.info(f"Sending streaming request to model {model}, timeout {timeout:.1f}s")
+        started = time.perf_counter()
+        first_token_at = None
+        parts: List[str] = []
+        usage: Optional[TokenUsage] = None
+        
+        async with asyncio.timeout_at(deadline.at if deadline else None), request_limiter.slot(model, budget):
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout
+            )
+            async for chunk in stream:
+                # usage приходит последним фрагментом, без choices
+                usage = parse_usage(getattr(chunk, "usage", None)) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                await on_delta("".join(parts))
+        
+        content = "".join(parts)
+        if not content:
+            raise LLMError("Пустой ответ от LLM")
+        
+        finished = time.perf_counter()
+        llm_timeouts.observe(model, first_token_at - started, stream=True)
+        _record_usage(model, usage, finished - started)
+        metrics_collector.record_stream_timing(model, first_token_at - started, finished - started)
+        logger.info(f"LLM stream finished, length: {len(content)}, first token after {first_token_at - started:.2f}s")
+        return content
+        
+    except Exception as e:
+        if isinstance(e, TimeoutError) and deadline is not None and not deadline.remaining():
+            raise _deadline_exceeded(deadline, model) from e
+        logger.error(f"LLM streaming request failed: {e}")
+        if isinstance(e, APITimeoutError):
+            llm_timeouts.observe_timeout(model, timeout, stream=True)
+            metrics_collector.record_llm_timeout(model)
+        request_limiter.on_error(model, e)
+        raise LLMError(f"Ошибка запроса к LLM: {e}") from e
 
 
 async def generate_response(
@@ -61,67 +243,246 @@ async def generate_response(
     primary_model: str,
     fallback_model: str,
     retry_attempts: int = 3,
+    retry_policy: Optional[RetryPolicy] = None,
     **llm_params
 ) -> str:
     """Генерация ответа с retry-логикой и fallback (без истории)."""
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_message}
-    ]
-    
-    # Попытки с основной моделью
-    for attempt in range(retry_attempts):
-        try:
-            return await send_request(client, messages, primary_model, **llm_params)
-        except LLMError as e:
-            logger.warning(f"Primary model attempt {attempt + 1} failed: {e}")
-            if attempt < retry_attempts - 1:
-                await asyncio.sleep(1.0 * (attempt + 1))  # Exponential backoff
-    
-    # Fallback на резервную модель
-    logger.warning(f"Switching to fallback model: {fallback_model}")
-    try:
-        return await send_request(client, messages, fallback_model, **llm_params)
-    except LLMError as e:
-        logger.error(f"Fallback model failed: {e}")
-        raise LLMError("Все модели LLM недоступны. Попробуйте позже.")
+    return await _generate_with_history(
+        client, system_prompt, user_message, (), primary_model, fallback_model, retry_attempts,
+        retry_policy=retry_policy, **llm_params
+    )
 
 
 async def generate_response_with_history(
     client: AsyncOpenAI,
     system_prompt: str,
     user_message: str,
-    message_history: List[Dict[str, str]],
+    message_history: Sequence[Dict[str, str]],
+    primary_model: str,
+    fallback_model: str,
+    retry_attempts: int = 3,
+    cache: Optional[ResponseCache] = None,
+    on_delta: Optional[DeltaCallback] = None,
+    hedger: Optional[Hedger] = None,
+    breakers: Optional[CircuitBreakerRegistry] = None,
+    flights: Optional[SingleFlight] = None,
+    router: Optional[ModelRouter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    **llm_params
+) -> str:
+    """Генерация ответа с учетом истории диалога.
+
+    message_history передается как есть (например, готовое неизменяемое
+    представление из хранилища): сообщения истории не копируются.
+    При переданном cache одинаковый контекст обслуживается из кэша.
+    При переданном on_delta ответ запрашивается потоком; ответ из кэша
+    возвращается целиком без вызова on_delta. При переданном hedger первая
+    попытка основной модели хеджируется запросом к резервной. При
+    переданном breakers модели с разомкнутым предохранителем пропускаются.
+    При переданном flights одинаковые одновременные запросы (тот же ключ,
+    что и у кэша) выполняются одним обращением к LLM. При переданном
+    router основная и резервная модели выбираются из пула на каждый запрос
+    (модели с разомкнутым предохранителем не выбираются), а primary_model
+    остается только ключом кэша. retry_policy задает паузы между
+    попытками и бюджет повторов (по умолчанию - без бюджета).
+    """
+    async def fetch(on_delta: Optional[DeltaCallback] = None) -> str:
+        primary, fallback = primary_model, fallback_model
+        if router is not None:
+            excluded = [model for model in router.models if breakers is not None and breakers.get(model).is_open()]
+            primary, fallback = router.route(exclude=excluded)
+        return await _generate_with_history(
+            client, system_prompt, user_message, message_history,
+            primary, fallback, retry_attempts, on_delta, hedger, breakers, router, retry_policy, **llm_params
+        )
+
+    if cache is None and flights is None:
+        return await fetch(on_delta)
+
+    key = ResponseCache.make_key(primary_model, system_prompt, user_message, message_history)
+    if cache is not None:
+        entry, stale = cache.get(key)
+        if entry is not None:
+            if stale:
+                cache.revalidate(key, fetch)
+            metrics_collector.record_response_cache(hit=True, latency_saved=entry.cost, stale=stale, warm=entry.warm)
+            logger.info(f"Response cache hit ({'stale' if stale else 'fresh'}), saved {entry.cost:.2f}s")
+            return entry.value
+
+    async def fetch_and_cache(on_delta: Optional[DeltaCallback] = None) -> str:
+        # Ответ кладется в кэш внутри запроса: склеенный запрос сохранит его,
+        # даже если все ожидающие отменены
+        started = time.perf_counter()
+        response = await fetch(on_delta)
+        if cache is not None:
+            cache.put(key, response, time.perf_counter() - started)
+            # Промах считается один раз на обращение к LLM, без склеенных ожидающих
+            metrics_collector.record_response_cache(hit=False)
+        return response
+
+    if flights is None:
+        return await fetch_and_cache(on_delta)
+
+    deadline = current_deadline()
+    owner = current_usage_owner()
+
+    async def fetch_as_leader(on_delta: Optional[DeltaCallback] = None) -> str:
+        # Задача склеенного запроса идет в пустом контексте (см. SingleFlight):
+        # дедлайн и владелец токенов запустившего ее вызывающего передаются явно
+        with use_deadline(deadline), usage_owner(owner):
+            return await fetch_and_cache(on_delta)
+
+    # Присоединившийся ожидающий ограничивает ожидание своим дедлайном сам
+    scope = asyncio.timeout_at(deadline.at if deadline else None)
+    try:
+        async with scope:
+            return await flights.do(key, fetch_as_leader, on_delta)
+    except TimeoutError:
+        if not scope.expired():
+            raise
+        raise _deadline_exceeded(deadline, primary_model)
+    except DeadlineExceededError:
+        # Склеенный запрос оборван дедлайном запустившего его: ответа нет и
+        # у присоединившихся, исчерпание учитывается в их дедлайне тоже
+        if deadline is not None:
+            deadline.exceeded = True
+        raise
+
+
+async def _generate_with_history(
+    client: AsyncOpenAI,
+    system_prompt: str,
+    user_message: str,
+    message_history: Sequence[Dict[str, str]],
     primary_model: str,
     fallback_model: str,
     retry_attempts: int = 3,
+    on_delta: Optional[DeltaCallback] = None,
+    hedger: Optional[Hedger] = None,
+    breakers: Optional[CircuitBreakerRegistry] = None,
+    router: Optional[ModelRouter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
     **llm_params
 ) -> str:
-    """Генерация ответа с учетом истории диалога."""
-    # Формирование полного контекста
-    messages = [{"role": "system", "content": system_prompt}]
+    """Запрос к LLM: retry основной модели и fallback.
+
+    Основная модель повторяется, пока ошибка повторяемая и бюджет
+    повторов не исчерпан (llm.retry); иначе запрос сразу уходит к
+    резервной модели. При дедлайне апдейта (llm.deadline) паузы, которые
+    его превысят, тоже не выполняются. DeadlineExceededError прерывает
+    все оставшиеся попытки.
+    """
+    policy = retry_policy or DEFAULT_RETRY_POLICY
+    policy.record_request()
+    # Формирование полного контекста: системный промпт + история + новое сообщение
+    messages = [_system_message(system_prompt), *message_history, {"role": "user", "content": user_message}]
     
-    # Добавление истории диалога
-    messages.extend(message_history)
+    logger.debug(f"Generating response with {len(message_history)} history messages")
     
-    # Добавление нового сообщения пользователя
-    messages.append({"role": "user", "content": user_message})
+    async def send_once(model: str, on_delta: Optional[DeltaCallback]) -> str:
+        if on_delta is None:
+            return await send_request(client, messages, model, **llm_params)
+        return await stream_request(client, messages, model, on_delta, **llm_params)
     
-    logger.debug(f"Generating response with {len(message_history)} history messages")
+    async def send(model: str, on_delta: Optional[DeltaCallback]) -> str:
+        if router is None:
+            return await send_once(model, on_delta)
+        
+        started = time.perf_counter()
+        try:
+            response = await send_once(model, on_delta)
+        except DeadlineExceededError:
+            raise
+        except LLMError:
+            router.observe(model, time.perf_counter() - started, ok=False)
+            raise
+        router.observe(model, time.perf_counter() - started, ok=True, tokens=estimate_tokens(response))
+        return response
+    
+    async def request(model: str, on_delta: Optional[DeltaCallback] = on_delta) -> str:
+        if breakers is None:
+            return await send(model, on_delta)
+        
+        breaker = breakers.get(model)
+        if not breaker.allow_request():
+            metrics_collector.record_circuit_rejection(model)
+            raise CircuitOpenError(f"Модель {model} временно отключена предохранителем")
+        try:
+            response = await send(model, on_delta)
+        except DeadlineExceededError:
+            breaker.record_cancelled()  # Дедлайн апдейта - не ошибка модели
+            raise
+        except LLMError:
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        breaker.record_success()
+        return response
+    
+    async def backoff(attempt: int, error: LLMError) -> bool:
+        """Пауза перед повтором основной модели; False - повторов не будет."""
+        if attempt >= retry_attempts - 1:
+            return False
+        delay = policy.backoff(attempt)
+        if not fits_deadline(delay):
+            logger.warning("Retry backoff would overrun the deadline, switching to fallback")
+            return False
+        if not policy.allow_retry(error):
+            return False
+        await asyncio.sleep(delay)
+        return True
+    
+    # Первая попытка - гонка с резервной моделью, если основная медлит
+    attempt = 0
+    if hedger is not None and retry_attempts > 0:
+        try:
+            return await hedger.race(request, primary_model, fallback_model, on_delta)
+        except DeadlineExceededError:
+            raise
+        except CircuitOpenError as e:
+            logger.warning(f"{e}, switching to fallback")
+            attempt = retry_attempts
+        except LLMError as e:
+            logger.warning(f"Hedged attempt failed: {e}")
+            attempt = 1 if await backoff(0, e) else retry_attempts
     
     # Попытки с основной моделью
-    for attempt in range(retry_attempts):
+    while attempt < retry_attempts:
         try:
-            return await send_request(client, messages, primary_model, **llm_params)
+            return await request(primary_model)
+        except DeadlineExceededError:
+            raise
+        except CircuitOpenError as e:
+            logger.warning(f"{e}, switching to fallback")
+            break
         except LLMError as e:
             logger.warning(f"Primary model attempt {attempt + 1} failed: {e}")
-            if attempt < retry_attempts - 1:
-                await asyncio.sleep(1.0 * (attempt + 1))  # Exponential backoff
+            if not await backoff(attempt, e):
+                break
+            attempt += 1
     
     # Fallback на резервную модель
     logger.warning(f"Switching to fallback model: {fallback_model}")
     try:
-        return await send_request(client, messages, fallback_model, **llm_params)
+        return await request(fallback_model)
+    except DeadlineExceededError:
+        raise
     except LLMError as e:
         logger.error(f"Fallback model failed: {e}")
         raise LLMError("Все модели LLM недоступны. Попробуйте позже.")
+
+
+async def generate_summary(
+    client: AsyncOpenAI,
+    previous_summary: Optional[str],
+    turns: Sequence[Turn],
+    model: str,
+    max_tokens: int = 300
+) -> str:
+    """Сжатие реплик диалога в резюме дешевой моделью (без retry и fallback)."""
+    messages = build_summary_messages(previous_summary, turns)
+    logger.debug(f"Summarizing {len(turns)} messages with model {model}")
+    summary = await send_request(client, messages, model, temperature=0.3, max_tokens=max_tokens)
+    return summary.strip()[:SUMMARY_MAX_CHARS]
@@ -0,0 +1,75 @@
+"""Дедлайн обработки апдейта, общий для всех попыток запроса к LLM."""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class Deadline:
+    """Момент (по time.monotonic), к которому ответ должен быть готов.
+
+    exceeded отмечается, когда запрос к LLM оборван дедлайном: объект
+    общий для задач, скопировавших контекст (например, хедж),
+    поэтому middleware видит отметку и считает исчерпание один раз.
+    """
+    __slots__ = ("seconds", "at", "exceeded")
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    def restart(self) -> None:
+        """Отсчет заново с текущего момента."""
+        self.at = time.monotonic() + self.seconds
+
+
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Optional[Deadline]]:
+    """Дедлайн через seconds секунд для кода внутри блока; seconds <= 0 - без дедлайна."""
+    deadline = Deadline(seconds) if seconds > 0 else None
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[None]:
+    """Уже созданный дедлайн (например, из контекста другой задачи) для кода внутри блока."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def restart_deadline() -> None:
+    """Перезапуск текущего дедлайна: ожидание до начала работы не тратит его."""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.restart()
+
+
+def fits_deadline(seconds: float) -> bool:
+    """Остается ли больше seconds секунд до дедлайна (без дедлайна - всегда)."""
+    deadline = _deadline.get()
+    return deadline is None or deadline.remaining() > seconds
+
+
+def without_deadline() -> contextvars.Context:
+    """Копия текущего контекста без дедлайна - для фоновых задач, переживающих апдейт."""
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
@@ -0,0 +1,153 @@
+"""Хеджирование запросов: гонка основной и резервной модели."""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Задержка хеджа, пока для модели не накоплено достаточно замеров
+DEFAULT_HEDGE_DELAY = 5.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 0.95
+
+DeltaCallback = Callable[[str], Awaitable[None]]
+# Запрос к модели: (модель, on_delta или None) -> ответ
+ModelRequest = Callable[[str, Optional[DeltaCallback]], Awaitable[str]]
+
+
+class LatencyWindow:
+    """Скользящее окно последних замеров задержки."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> float:
+        """Перцентиль q (0..1) по окну; 0.0 для пустого окна."""
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Hedger:
+    """Хеджирование запроса к основной модели резервной.
+
+    Если основная модель не ответила за задержку хеджа, тот же запрос
+    отправляется резервной; побеждает ответившая первой, запрос
+    проигравшей отменяется. При потоковой генерации ответом считается
+    первый токен: поток показывает только модель, выдавшая его первой.
+
+    Задержка задается явно или равна p95 наблюдаемой задержки основной
+    модели. Когда основная модель проигрывает, в окно пишется время до
+    ее отмены - нижняя оценка ее задержки, поэтому p95 не сползает вниз
+    из-за того, что медленные ответы больше не доживают до конца.
+    """
+
+    def __init__(self, delay: float = 0.0, window: int = 200):
+        self.delay = delay
+        self._window_size = window
+        self._latency: Dict[str, LatencyWindow] = {}  # Время до ответа по моделям
+        self._end_to_end = LatencyWindow(window)      # Время до ответа с учетом хеджа
+
+    def latency(self, model: str) -> LatencyWindow:
+        window = self._latency.get(model)
+        if window is None:
+            window = self._latency[model] = LatencyWindow(self._window_size)
+        return window
+
+    def delay_for(self, model: str) -> float:
+        """Задержка перед отправкой хеджирующего запроса."""
+        if self.delay > 0:
+            return self.delay
+        window = self.latency(model)
+        if len(window) < HEDGE_MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return window.percentile(HEDGE_PERCENTILE)
+
+    def tail_improvement(self, model: str) -> float:
+        """Насколько p95 с хеджированием ниже p95 основной модели (секунды)."""
+        return self.latency(model).percentile(HEDGE_PERCENTILE) - self._end_to_end.percentile(HEDGE_PERCENTILE)
+
+    async def race(
+        self,
+        request: ModelRequest,
+        primary_model: str,
+        fallback_model: str,
+        on_delta: Optional[DeltaCallback] = None
+    ) -> str:
+        """Запрос к основной модели с хеджем резервной после задержки."""
+        started = time.perf_counter()
+        contenders: List[Tuple[str, float, asyncio.Task]] = []
+        answered: Dict[str, float] = {}  # Момент ответа (первого токена) по моделям
+        owner: Optional[str] = None      # Модель, чей поток видит пользователь
+
+        def gated(model: str) -> Optional[DeltaCallback]:
+            if on_delta is None:
+                return None
+
+            async def forward(text: str) -> None:
+                nonlocal owner
+                if owner is None:
+                    owner = model
+                    answered[model] = time.perf_counter()
+                    for other, other_started, task in contenders:
+                        if other != model and not task.done():
+                            task.cancel()
+                            self.latency(other).add(answered[model] - other_started)
+                if owner == model:
+                    await on_delta(text)
+            return forward
+
+        def start(model: str) -> None:
+            task = asyncio.create_task(request(model, gated(model)))
+            contenders.append((model, time.perf_counter(), task))
+
+        start(primary_model)
+        done, _ = await asyncio.wait([contenders[0][2]], timeout=self.delay_for(primary_model))
+        fired = not done and owner is None
+        if fired:
+            logger.info(f"Primary model {primary_model} slow, hedging with {fallback_model}")
+            start(fallback_model)
+
+        try:
+            winner, response = await self._first_success(contenders)
+        finally:
+            for model, model_started, task in contenders:
+                if not task.done():
+                    task.cancel()
+                    self.latency(model).add(time.perf_counter() - model_started)
+            # Дожидаемся отмены проигравших, чтобы их соединения закрылись сразу
+            await asyncio.gather(*(task for _, _, task in contenders), return_exceptions=True)
+
+        finished = time.perf_counter()
+        winner_started = next(s for model, s, _ in contenders if model == winner)
+        self.latency(winner).add(answered.get(winner, finished) - winner_started)
+        self._end_to_end.add(answered.get(winner, finished) - started)
+        metrics_collector.record_hedge(fired, winner, self.tail_improvement(primary_model))
+        return response
+
+    @staticmethod
+    async def _first_success(contenders: List[Tuple[str, float, asyncio.Task]]) -> Tuple[str, str]:
+        """Первый успешный ответ; при неудаче всех - ошибка последнего."""
+        models = {task: model for model, _, task in contenders}
+        pending = set(models)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    return models[task], task.result()
+                error = task.exception()
+        raise error
@@ -0,0 +1,278 @@
+"""Ограничение параллельности и частоты запросов к OpenRouter."""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Дольше этого модель не ставится на паузу, даже если сервер просит
+MAX_PAUSE_SECONDS = 300.0
+
+# Насколько задержка может превысить базовую, прежде чем лимит снижается
+LATENCY_TOLERANCE = 2.0
+# Во сколько раз снижается лимит при перегрузке
+DECREASE_FACTOR = 0.5
+# Веса EWMA: базовая (долгая) и текущая (короткая) задержка
+BASELINE_DRIFT = 0.01
+RECENT_WEIGHT = 0.2
+
+
+class TokenBucket:
+    """Token bucket одной модели с паузой по ответам 429.
+
+    rate_per_minute=0 отключает ограничение частоты, но пауза по
+    Retry-After действует всегда.
+    """
+
+    def __init__(self, rate_per_minute: float = 0, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Приостановка выдачи токенов, например по Retry-After."""
+        self.paused_until = max(self.paused_until, self._clock() + seconds)
+
+    def try_acquire(self) -> float:
+        """Взять токен: 0.0 при успехе, иначе сколько секунд подождать."""
+        now = self._clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if not self.rate:
+            return 0.0
+
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Пауза из заголовков ответа с ошибкой: Retry-After или сброс лимита.
+
+    Понимает retry-after-ms, retry-after (секунды или HTTP-дата) и
+    x-ratelimit-reset, который OpenRouter передает в миллисекундах
+    Unix-времени. Сброс лимита учитывается только для ответа 429.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000, MAX_PAUSE_SECONDS)
+        if headers.get("retry-after"):
+            value = headers["retry-after"]
+            try:
+                seconds = float(value)
+            except ValueError:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            return min(max(seconds, 0.0), MAX_PAUSE_SECONDS)
+        if getattr(response, "status_code", None) == 429 and headers.get("x-ratelimit-reset"):
+            reset = float(headers["x-ratelimit-reset"])
+            if reset > 1e12:
+                reset /= 1000
+            seconds = reset - time.time() if reset > 1e9 else reset
+            return min(max(seconds, 0.0), MAX_PAUSE_SECONDS)
+    except (TypeError, ValueError) as e:
+        logger.debug(f"Unparseable rate limit headers: {e}")
+    return None
+
+
+class AdaptiveLimit:
+    """Лимит одновременных запросов по схеме AIMD, как окно TCP.
+
+    Задержка ответа зависит и от его длины, поэтому сравниваются не
+    отдельные замеры, а два скользящих средних: базовое (долгое) и
+    текущее (короткое). Пока текущее укладывается в LATENCY_TOLERANCE
+    базовых, лимит растет на 1/limit за ответ (примерно +1 за «круг»
+    запросов). Ошибка или рост задержки снижают лимит в DECREASE_FACTOR
+    раз, но не чаще раза за время одного запроса: серия одновременных
+    ошибок - это один сигнал перегрузки, а не несколько.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        initial: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial) if initial is not None else max_limit / 2  # Старт с середины диапазона
+        self.baseline = 0.0
+        self.recent = 0.0
+        self._clock = clock
+        self._last_decrease = float("-inf")
+
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def on_sample(self, latency: float, ok: bool) -> None:
+        """Учет завершенного запроса (отмененные не учитываются)."""
+        if ok:
+            if not self.baseline:
+                self.baseline = self.recent = latency
+            self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+            self.recent += (latency - self.recent) * RECENT_WEIGHT
+
+        if ok and self.recent <= self.baseline * LATENCY_TOLERANCE:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            return
+
+        now = self._clock()
+        if now - self._last_decrease < max(latency, self.baseline):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+        logger.info(
+            f"LLM concurrency limit cut to {self.capacity()} "
+            f"({'error' if not ok else f'latency {self.recent:.2f}s vs baseline {self.baseline:.2f}s'})"
+        )
+
+
+class RequestLimiter:
+    """Общий лимит запросов к LLM: число запросов в полете и bucket на модель.
+
+    Сначала ожидается токен модели, затем место среди запросов в полете,
+    чтобы модель на паузе не занимала места, нужные другим моделям. Число
+    мест фиксировано (max_concurrency) или подбирается AdaptiveLimit в
+    диапазоне min_concurrency..max_concurrency. Время ожидания и время
+    самого запроса пишутся в метрики раздельно.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 0,
+        rate_per_minute: float = 0,
+        burst: int = 1,
+        adaptive: bool = False,
+        min_concurrency: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.configure(max_concurrency, rate_per_minute, burst, adaptive, min_concurrency, clock)
+
+    def configure(
+        self,
+        max_concurrency: int = 0,
+        rate_per_minute: float = 0,
+        burst: int = 1,
+        adaptive: bool = False,
+        min_concurrency: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Новые лимиты; max_concurrency=0 и rate_per_minute=0 снимают ограничения."""
+        self.max_concurrency = max_concurrency
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self._clock = clock
+        self.adaptive = AdaptiveLimit(min_concurrency, max_concurrency, clock=clock) \
+            if adaptive and max_concurrency else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.in_flight = 0
+
+    def capacity(self) -> Optional[int]:
+        """Текущее число мест; None - без ограничения."""
+        if self.adaptive is not None:
+            return self.adaptive.capacity()
+        return self.max_concurrency or None
+
+    def snapshot(self) -> Dict[str, Optional[int]]:
+        """Состояние для healthcheck."""
+        return {"limit": self.capacity(), "in_flight": self.in_flight, "queued": len(self._waiters)}
+
+    def bucket(self, model: str) -> TokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = TokenBucket(self.rate_per_minute, self.burst, self._clock)
+        return bucket
+
+    def pause(self, model: str, seconds: float) -> None:
+        logger.warning(f"Model {model} rate limited, pausing requests for {seconds:.1f}s")
+        self.bucket(model).pause(seconds)
+        metrics_collector.record_rate_limit_pause(model, seconds)
+
+    def on_error(self, model: str, error: BaseException) -> None:
+        """Пауза модели, если ответ с ошибкой указал, когда повторять."""
+        seconds = retry_after_seconds(error)
+        if seconds:
+            self.pause(model, seconds)
+
+    @asynccontextmanager
+    async def slot(self, model: str, timeout: float = 0.0) -> AsyncIterator[None]:
+        """Место для одного запроса к модели; timeout - таймаут запроса для метрик."""
+        started = time.perf_counter()
+        await self.bucket(model).acquire()
+        await self._enter()
+        acquired = time.perf_counter()
+        outcome: Optional[bool] = None  # None - запрос отменен
+        try:
+            yield
+            outcome = True
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            outcome = False
+            raise
+        finally:
+            latency = time.perf_counter() - acquired
+            if self.adaptive is not None and outcome is not None:
+                previous = self.adaptive.capacity()
+                self.adaptive.on_sample(latency, outcome)
+                if self.adaptive.capacity() != previous:
+                    metrics_collector.record_concurrency_limit(self.adaptive.capacity())
+            self._release()
+            metrics_collector.record_llm_call(model, acquired - started, latency, timeout)
+
+    async def _enter(self) -> None:
+        capacity = self.capacity()
+        if capacity is None or (self.in_flight < capacity and not self._waiters):
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # Место уже выдано - возвращаем его
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        """Освобождение места и передача свободных мест ожидающим."""
+        self.in_flight -= 1
+        capacity = self.capacity()
+        while self._waiters and (capacity is None or self.in_flight < capacity):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+
+
+# Общий для всех запросов лимитер, настраивается в init_llm
+request_limiter = RequestLimiter()
@@ -0,0 +1,117 @@
+"""Политика повторов запросов к LLM: паузы, классификация ошибок, бюджет."""
+import logging
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from openai import APIConnectionError
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Коды ответа, при которых повтор имеет смысл
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Стоит ли повторять запрос после ошибки.
+
+    Повторяются 429, 5xx, таймауты и обрывы соединения. Прочие 4xx
+    (неверный запрос, нет доступа к модели) при повторе не исправятся.
+    Ошибка ищется по цепочке причин: LLMError оборачивает ошибку API.
+    Ошибки без кода ответа (например, пустой ответ) повторяются.
+    """
+    cause: Optional[BaseException] = error
+    while cause is not None:
+        if isinstance(cause, APIConnectionError):  # Включая APITimeoutError
+            return True
+        status = getattr(cause, "status_code", None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS_CODES or status >= 500
+        cause = cause.__cause__
+    return True
+
+
+class RetryBudget:
+    """Бюджет повторов на весь процесс.
+
+    За последние window секунд повторов может быть не больше ratio от
+    числа запросов (но не меньше min_retries). Во время сбоя провайдера
+    это не дает повторам умножить нагрузку на него: сверх бюджета запрос
+    сразу идет к резервной модели или завершается ошибкой.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_retries: int = 3,
+        window: float = 10.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._clock = clock
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+    def record_request(self) -> None:
+        self._requests.append(self._clock())
+
+    def try_spend(self) -> bool:
+        """Взять повтор из бюджета; False - бюджет исчерпан."""
+        now = self._clock()
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+        if len(self._retries) >= max(self.min_retries, self.ratio * len(self._requests)):
+            return False
+        self._retries.append(now)
+        return True
+
+
+class RetryPolicy:
+    """Повторы запросов: экспоненциальная пауза с полным jitter и бюджет.
+
+    Пауза перед повтором attempt (с нуля) - случайная величина от 0 до
+    min(max_delay, base_delay * 2^attempt): пользователи, получившие
+    ошибку одновременно, не повторяют запросы синхронно.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 1.0,
+        max_delay: float = 10.0,
+        budget: Optional[RetryBudget] = None,
+        rng: Callable[[], float] = random.random
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self._rng = rng
+
+    def backoff(self, attempt: int) -> float:
+        return self._rng() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+    def record_request(self) -> None:
+        """Учет нового запроса пользователя (основа бюджета повторов)."""
+        if self.budget is not None:
+            self.budget.record_request()
+
+    def allow_retry(self, error: BaseException) -> bool:
+        """Повторять ли запрос после ошибки: ошибка повторяемая и бюджет не исчерпан."""
+        if not is_retryable(error):
+            logger.warning(f"Error is not retryable: {error}")
+            return False
+        if self.budget is not None and not self.budget.try_spend():
+            logger.warning("Retry budget exhausted, not retrying")
+            metrics_collector.record_retry(allowed=False)
+            return False
+        metrics_collector.record_retry(allowed=True)
+        return True
+
+
+# Политика без бюджета для вызовов, которым он не передан
+DEFAULT_RETRY_POLICY = RetryPolicy()
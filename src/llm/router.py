@@ -0,0 +1,132 @@
+"""Выбор модели из пула по задержке и успешности ответов."""
+import logging
+import random
+from typing import Any, Callable, Dict, List, Sequence
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Вес нового замера в скользящих средних
+EWMA_WEIGHT = 0.2
+
+# Средняя задержка ответа, при которой оценка модели снижается вдвое
+LATENCY_HALF_SCORE_SECONDS = 10.0
+
+
+class ModelStats:
+    """Скользящие средние одной модели по реальным запросам."""
+    __slots__ = ("latency", "success_rate", "tokens_per_second", "requests")
+
+    def __init__(self):
+        self.latency = 0.0
+        self.success_rate = 1.0
+        self.tokens_per_second = 0.0
+        self.requests = 0
+
+    def observe(self, latency: float, ok: bool, tokens: int = 0) -> None:
+        self.requests += 1
+        self.success_rate += ((1.0 if ok else 0.0) - self.success_rate) * EWMA_WEIGHT
+        if not ok:
+            return
+        speed = tokens / latency if latency > 0 else 0.0
+        if not self.latency:
+            self.latency, self.tokens_per_second = latency, speed
+            return
+        self.latency += (latency - self.latency) * EWMA_WEIGHT
+        self.tokens_per_second += (speed - self.tokens_per_second) * EWMA_WEIGHT
+
+    def score(self) -> float:
+        """Полезных токенов в секунду с учетом доли ошибок, сниженных за задержку.
+
+        При равной скорости генерации выше оценка модели, которая раньше
+        отдает ответ: пользователь ждет весь ответ, а не только токены.
+        """
+        return self.success_rate * self.tokens_per_second / (1 + self.latency / LATENCY_HALF_SCORE_SECONDS)
+
+
+class ModelRouter:
+    """Маршрутизатор запросов по пулу моделей.
+
+    Для каждого запроса модели упорядочиваются по оценке ModelStats.score:
+    первая становится основной, вторая - резервной. Длина ответа
+    нормируется (токены в секунду), поэтому короткие ответы не делают
+    модель «быстрее», а средняя задержка снижает оценку, чтобы при равной
+    скорости выбиралась модель, быстрее отдающая ответ. Модель без успешных ответов сначала пробуется вне
+    очереди, чтобы получить оценку; дальше с вероятностью exploration
+    основной ставится случайная другая модель пула, чтобы оценки не
+    устаревали и восстановившаяся модель снова получала трафик.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[str] = (),
+        exploration: float = 0.1,
+        rng: Callable[[], float] = random.random
+    ):
+        self.configure(models, exploration, rng)
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def configure(
+        self,
+        models: Sequence[str] = (),
+        exploration: float = 0.1,
+        rng: Callable[[], float] = random.random
+    ) -> None:
+        """Новый пул моделей; накопленные оценки сбрасываются."""
+        self.models = list(dict.fromkeys(models))
+        self.exploration = exploration
+        self._rng = rng
+        self._stats: Dict[str, ModelStats] = {model: ModelStats() for model in self.models}
+
+    def stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def rank(self, exclude: Sequence[str] = ()) -> List[str]:
+        """Модели пула от лучшей к худшей, без exclude (если осталась хоть одна)."""
+        models = [model for model in self.models if model not in exclude] or list(self.models)
+        # Модели без замеров вперед, затем по убыванию оценки
+        ranked = sorted(models, key=lambda model: (self.stats(model).requests > 0, -self.stats(model).score()))
+        if len(ranked) > 1 and self.stats(ranked[0]).requests and self._rng() < self.exploration:
+            explored = ranked[1 + int(self._rng() * (len(ranked) - 1))]
+            ranked.remove(explored)
+            ranked.insert(0, explored)
+        return ranked
+
+    def route(self, exclude: Sequence[str] = ()) -> List[str]:
+        """Основная и резервная модель для запроса; при одной модели - она же дважды."""
+        ranked = self.rank(exclude)
+        primary = ranked[0]
+        fallback = ranked[1] if len(ranked) > 1 else primary
+        metrics_collector.record_route(primary)
+        logger.debug(f"Routed request to {primary} (fallback {fallback})")
+        return [primary, fallback]
+
+    def observe(self, model: str, latency: float, ok: bool, tokens: int = 0) -> None:
+        """Исход запроса к модели; отмененные запросы не учитываются."""
+        stats = self.stats(model)
+        stats.observe(latency, ok, tokens)
+        metrics_collector.record_model_score(model, stats.score())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Оценки моделей для healthcheck."""
+        return {
+            model: {
+                "score": round(stats.score(), 2),
+                "latency": round(stats.latency, 2),
+                "success_rate": round(stats.success_rate, 3),
+                "tokens_per_second": round(stats.tokens_per_second, 1),
+                "requests": stats.requests
+            }
+            for model, stats in self._stats.items()
+        }
+
+
+# Общий маршрутизатор, пул задается в init_llm (MODEL_POOL)
+model_router = ModelRouter()
+
@@ -0,0 +1,77 @@
+"""Склейка одинаковых одновременных запросов к LLM (singleflight)."""
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+DeltaCallback = Callable[[str], Awaitable[None]]
+# Запрос: (on_delta или None) -> ответ
+FlightRequest = Callable[[Optional[DeltaCallback]], Awaitable[str]]
+
+
+class _Flight:
+    """Запрос в полете и подписчики на его поток."""
+    __slots__ = ("task", "subscribers")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[DeltaCallback] = []
+
+    async def broadcast(self, text: str) -> None:
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber(text)
+            except Exception as e:
+                logger.warning(f"Coalesced stream subscriber failed: {e}")
+
+
+class SingleFlight:
+    """Один запрос к LLM на ключ, сколько бы вызывающих его ни ждали.
+
+    Первый вызов с ключом запускает запрос отдельной задачей, остальные
+    ждут ту же задачу. Каждый ждет ее через asyncio.shield, поэтому отмена
+    одного вызывающего (пользователь ушел, проиграл хедж) не отменяет
+    запрос для остальных; запрос доводится до конца, даже если все
+    ожидающие отменены. При потоковой генерации фрагменты получают все
+    подписавшиеся вызывающие: присоединившийся позже увидит весь текст
+    со следующим фрагментом. Задача запроса общая, поэтому запускается в
+    пустом контексте и не зависит от переменных контекста вызывающих;
+    нужные ей значения (дедлайн, владельца токенов) request задает сам.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, request: FlightRequest, on_delta: Optional[DeltaCallback] = None) -> str:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(
+                request(flight.broadcast if on_delta else None), context=contextvars.Context()
+            )
+            flight.task.add_done_callback(lambda task: self._finish(key, flight, task))
+        else:
+            metrics_collector.record_coalesced_request()
+            logger.info("Identical LLM request in flight, awaiting its result")
+
+        if on_delta is not None:
+            flight.subscribers.append(on_delta)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_delta is not None:
+                flight.subscribers.remove(on_delta)
+
+    def _finish(self, key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Ошибку забираем здесь: если все ожидающие отменены, ее больше никто не прочитает
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced LLM request failed: {task.exception()}")
@@ -0,0 +1,62 @@
+"""Сжатие ранней части диалога в краткое резюме."""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Системная инструкция для модели, составляющей резюме
+SUMMARY_PROMPT = (
+    "Ты сжимаешь историю диалога консультанта по целям обучения (таксономия Блума). "
+    "Составь краткое резюме на русском языке: тематика, аудитория, выбранные уровни Блума, "
+    "согласованные формулировки целей и открытые вопросы. Не более 5 предложений, без вступлений."
+)
+
+# Максимальная длина резюме в символах
+SUMMARY_MAX_CHARS = 800
+
+# Подписи ролей в тексте резюме
+ROLE_LABELS = {"user": "Пользователь", "assistant": "Ассистент"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# Тип реплики диалога: (роль, текст)
+Turn = Tuple[str, str]
+
+
+def format_turns(turns: Sequence[Turn]) -> str:
+    """Текст диалога с подписями ролей."""
+    return "\n".join(f"{ROLE_LABELS.get(role, role)}: {content}" for role, content in turns)
+
+
+def build_summary_messages(previous_summary: Optional[str], turns: Sequence[Turn]) -> List[Dict[str, str]]:
+    """Сообщения запроса к модели: предыдущее резюме дополняется новыми репликами."""
+    parts = []
+    if previous_summary:
+        parts.append(f"Предыдущее резюме:\n{previous_summary}")
+    parts.append(f"Новые реплики:\n{format_turns(turns)}")
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)}
+    ]
+
+
+def extractive_summary(
+    previous_summary: Optional[str],
+    turns: Sequence[Turn],
+    max_chars: int = SUMMARY_MAX_CHARS
+) -> str:
+    """Резюме без обращения к LLM: первое предложение каждой реплики.
+
+    Если текст не помещается в max_chars, отбрасываются самые старые
+    фрагменты - свежая часть диалога важнее.
+    """
+    lines = [previous_summary] if previous_summary else []
+    for role, content in turns:
+        text = " ".join(content.split())
+        if not text:
+            continue
+        first = _SENTENCE_END.split(text, maxsplit=1)[0]
+        lines.append(f"{ROLE_LABELS.get(role, role)}: {first}")
+
+    summary = " ".join(lines)
+    if len(summary) > max_chars:
+        summary = "…" + summary[len(summary) - max_chars + 1:]
+    return summary
@@ -0,0 +1,90 @@
+"""Таймауты запросов к LLM по наблюдаемой задержке моделей."""
+import logging
+from typing import Dict, Tuple
+
+from .hedging import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# Таймаут, пока для модели не накоплено достаточно замеров
+DEFAULT_TIMEOUT = 30.0
+TIMEOUT_MIN_SAMPLES = 20
+TIMEOUT_PERCENTILE = 0.99
+
+
+class AdaptiveTimeouts:
+    """Таймаут запроса на модель: p99 задержки × factor в границах min..max.
+
+    Быстрая модель получает короткий таймаут, и переход на резервную
+    не ждет лишнего; медленная, но рабочая модель не обрывается. Обычный
+    запрос ограничивается временем до полного ответа, потоковый - временем
+    до первого токена (дальше таймаут действует между фрагментами), поэтому
+    их задержки копятся в разных окнах. Запрос, оборванный по таймауту,
+    пишется в окно со значением таймаута - нижней оценкой его задержки,
+    чтобы p99 рос, если модель стала медленнее. При enabled=False всегда
+    используется DEFAULT_TIMEOUT.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        factor: float = 2.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 60.0,
+        window: int = 200
+    ):
+        self.configure(enabled, factor, min_timeout, max_timeout, window)
+
+    def configure(
+        self,
+        enabled: bool = True,
+        factor: float = 2.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 60.0,
+        window: int = 200
+    ) -> None:
+        """Новые параметры; накопленные замеры сбрасываются."""
+        self.enabled = enabled
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._window_size = window
+        self._latency: Dict[Tuple[str, bool], LatencyWindow] = {}
+
+    def latency(self, model: str, stream: bool = False) -> LatencyWindow:
+        window = self._latency.get((model, stream))
+        if window is None:
+            window = self._latency[(model, stream)] = LatencyWindow(self._window_size)
+        return window
+
+    def observe(self, model: str, latency: float, stream: bool = False) -> None:
+        """Замер успешного запроса (для потока - время до первого токена)."""
+        if self.enabled:
+            self.latency(model, stream).add(latency)
+
+    def observe_timeout(self, model: str, timeout: float, stream: bool = False) -> None:
+        """Запрос оборван по таймауту: его задержка не меньше таймаута."""
+        logger.warning(f"Model {model} timed out after {timeout:.1f}s")
+        self.observe(model, timeout, stream)
+
+    def timeout(self, model: str, stream: bool = False) -> float:
+        """Таймаут для следующего запроса к модели."""
+        if not self.enabled:
+            return DEFAULT_TIMEOUT
+        window = self.latency(model, stream)
+        if len(window) < TIMEOUT_MIN_SAMPLES:
+            estimate = DEFAULT_TIMEOUT
+        else:
+            estimate = window.percentile(TIMEOUT_PERCENTILE) * self.factor
+        return min(max(estimate, self.min_timeout), self.max_timeout)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Текущие таймауты по моделям для healthcheck."""
+        result: Dict[str, Dict[str, float]] = {}
+        for model, stream in self._latency:
+            result.setdefault(model, {})["stream" if stream else "request"] = round(self.timeout(model, stream), 2)
+        return result
+
+
+# Общие для всех запросов таймауты, настраиваются в init_llm
+llm_timeouts = AdaptiveTimeouts()
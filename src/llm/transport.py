@@ -0,0 +1,85 @@
+"""HTTP-транспорт для OpenRouter: пул соединений, keep-alive, HTTP/2."""
+import logging
+import time
+from typing import Any, Dict
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+from monitoring.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Имя пула в метриках
+POOL_NAME = "openrouter"
+
+
+def http2_available() -> bool:
+    """Установлен ли пакет h2, без которого httpx не умеет HTTP/2."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def _trace_request(request: httpx.Request) -> None:
+    """Хук запроса: трассировка httpcore для замера установки соединения.
+
+    Новое соединение проходит connect_tcp и start_tls; запрос,
+    отправленный без них, использовал соединение из пула.
+    """
+    state: Dict[str, Any] = {"connect_started": None, "connected": False}
+    connected_event = "connection.start_tls.complete" if request.url.scheme == "https" \
+        else "connection.connect_tcp.complete"
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            state["connect_started"] = time.perf_counter()
+        elif event_name == connected_event and state["connect_started"] is not None:
+            state["connected"] = True
+            metrics_collector.record_http_connection(POOL_NAME, time.perf_counter() - state["connect_started"])
+        elif event_name.endswith("send_request_headers.started"):
+            metrics_collector.record_http_request(POOL_NAME, reused=not state["connected"])
+
+    request.extensions["trace"] = trace
+
+
+def create_http_client(
+    max_connections: int = 20,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 60.0,
+    http2: bool = False
+) -> httpx.AsyncClient:
+    """HTTP-клиент для AsyncOpenAI с настроенным пулом соединений.
+
+    HTTP/2 включается, только если установлен h2 (pip install httpx[http2]);
+    без него используется HTTP/1.1 с keep-alive.
+    """
+    if http2 and not http2_available():
+        logger.warning("HTTP/2 requested for OpenRouter but h2 is not installed, using HTTP/1.1")
+        http2 = False
+
+    logger.info(
+        f"OpenRouter transport: max_connections={max_connections}, "
+        f"keepalive={max_keepalive_connections} for {keepalive_expiry}s, http2={http2}"
+    )
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        http2=http2,
+        event_hooks={"request": [_trace_request]}
+    )
+
+
+async def prewarm_http_client(http_client: httpx.AsyncClient, base_url: str) -> None:
+    """Открытие соединения с API заранее, чтобы первый запрос не ждал TLS."""
+    started = time.perf_counter()
+    try:
+        await http_client.head(base_url, timeout=10.0)
+        logger.info(f"OpenRouter connection pre-warmed in {time.perf_counter() - started:.2f}s")
+    except httpx.HTTPError as e:
+        logger.warning(f"OpenRouter connection pre-warm failed: {e}")
@@ -0,0 +1,50 @@
+"""Токены, потраченные на запросы к LLM, по данным ответа API."""
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+
+@dataclass
+class TokenUsage:
+    """Токены одного запроса; cached_tokens - часть prompt_tokens из кэша провайдера."""
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def parse_usage(usage: Any) -> Optional[TokenUsage]:
+    """TokenUsage из поля usage ответа; None, если провайдер его не прислал."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+        return None
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    return TokenUsage(prompt_tokens, completion_tokens, cached_tokens if isinstance(cached_tokens, int) else 0)
+
+
+# Пользователь, которому относятся токены запросов в текущем контексте
+_usage_owner: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("llm_usage_owner", default=None)
+
+
+def current_usage_owner() -> Optional[int]:
+    return _usage_owner.get()
+
+
+@contextmanager
+def usage_owner(user_id: Optional[int]) -> Iterator[None]:
+    """Токены запросов внутри блока относятся к user_id.
+
+    Задачи, скопировавшие контекст, наследуют владельца; склеенный запрос
+    (SingleFlight) идет в пустом контексте, и client передает ему владельца
+    явно - токены относятся к пользователю, запустившему запрос.
+    """
+    token = _usage_owner.set(user_id)
+    try:
+        yield
+    finally:
+        _usage_owner.reset(token)
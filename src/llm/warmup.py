@@ -0,0 +1,62 @@
+"""Прогрев кэша ответов для шести уровней таксономии Блума."""
+import asyncio
+import logging
+import time
+from typing import Dict, Sequence
+
+from openai import AsyncOpenAI
+
+from .cache import ResponseCache
+from .client import LLMError, generate_response_with_history
+
+logger = logging.getLogger(__name__)
+
+# Уровни в том виде, в каком их выбирают после /start: номер и название
+BLOOM_LEVELS = (
+    ("1", "Знание"),
+    ("2", "Понимание"),
+    ("3", "Применение"),
+    ("4", "Анализ"),
+    ("5", "Синтез"),
+    ("6", "Оценка"),
+)
+
+
+async def warm_up_cache(
+    cache: ResponseCache,
+    client: AsyncOpenAI,
+    system_prompt: str,
+    history: Sequence[Dict[str, str]],
+    primary_model: str,
+    fallback_model: str,
+    concurrency: int = 2,
+    **llm_params
+) -> int:
+    """Генерация ответов на выбор каждого уровня и запись их в кэш.
+
+    Один ответ на уровень сохраняется под ключами и номера, и названия.
+    Одновременно выполняется не более concurrency запросов к LLM, чтобы
+    прогрев не занимал лимиты, нужные живым пользователям. Возвращает
+    число записанных в кэш ключей.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm_level(number: str, name: str) -> int:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await generate_response_with_history(
+                    client, system_prompt, name, history, primary_model, fallback_model,
+                    retry_attempts=1, **llm_params
+                )
+            except LLMError as e:
+                logger.warning(f"Cache warm-up failed for level {name}: {e}")
+                return 0
+            cost = time.perf_counter() - started
+            return sum(
+                cache.put(cache.make_key(primary_model, system_prompt, text, history), response, cost, warm=True)
+                for text in (number, name)
+            )
+
+    results = await asyncio.gather(*(warm_level(number, name) for number, name in BLOOM_LEVELS))
+    return sum(results)
@@ -7,8 +7,11 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from config.settings import load_config
-from bot.handlers import router, init_llm
-from bot.middleware import ErrorHandlingMiddleware, MetricsMiddleware
+from bot.handlers import router, init_llm, start_cache_warmup
+from bot.middleware import DeadlineMiddleware, ErrorHandlingMiddleware, MetricsMiddleware
+from bot.transport import TunedAiohttpSession
+from memory.storage import init_session_store, close_session_store
+from memory.snapshot import load_session_snapshot, save_session_snapshot
 from healthcheck import start_healthcheck_server
 
 
@@ -31,10 +34,15 @@ async def main() -> None:
         logger.info("Initializing bot...")
         bot = Bot(
             token=config.telegram_bot_token,
+            session=TunedAiohttpSession(
+                limit=config.telegram_http_max_connections,
+                keepalive_timeout=config.http_keepalive_seconds
+            ),
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         
-        # Валидация токена через проверку bot info
+        # Валидация токена через проверку bot info; заодно открывает соединение
+        # с Bot API, которое keep-alive сохраняет до начала polling
         try:
             bot_info = await bot.get_me()
             logger.info(f"Bot @{bot_info.username} connected successfully")
@@ -42,6 +50,20 @@ async def main() -> None:
             logger.error(f"Failed to connect to Telegram API: {e}")
             raise ValueError("Недействительный TELEGRAM_BOT_TOKEN или проблемы с подключением к Telegram API")
         
+        # Инициализация хранилища сессий
+        logger.info(f"Initializing session store ({config.session_backend})...")
+        init_session_store(
+            config.session_backend,
+            config.session_db_path,
+            memory_budget_bytes=config.memory_budget_mb * 1024 * 1024,
+            spill_path=config.spill_path
+        )
+        
+        # Восстановление сессий после перезапуска (SQLite хранит их сам)
+        use_snapshot = config.session_backend == "memory" and bool(config.snapshot_path)
+        if use_snapshot:
+            await load_session_snapshot(config.snapshot_path, config.memory_ttl_hours)
+        
         # Инициализация LLM
         logger.info("Initializing LLM...")
         await init_llm(config)
@@ -55,12 +77,16 @@ async def main() -> None:
         # Настройка диспетчера с middleware
         dp = Dispatcher()
         
-        # Добавление middleware для обработки ошибок и метрик
+        # Добавление middleware для обработки ошибок, метрик и дедлайна ответа
         dp.message.middleware(ErrorHandlingMiddleware())
         dp.message.middleware(MetricsMiddleware())
+        dp.message.middleware(DeadlineMiddleware(config.request_deadline_seconds))
         
         dp.include_router(router)
         
+        # Прогрев кэша ответов начинается вместе с polling и не задерживает его
+        dp.startup.register(start_cache_warmup)
+        
         logger.info("Starting bot polling...")
         await dp.start_polling(bot)
         
@@ -72,6 +98,13 @@ async def main() -> None:
         if 'bot' in locals():
             await bot.session.close()
         
+        # Снимок сессий при остановке (polling завершается и по SIGTERM)
+        if 'use_snapshot' in locals() and use_snapshot:
+            await save_session_snapshot(config.snapshot_path)
+        
+        # Сохранение отложенных записей сессий
+        close_session_store()
+        
         # Остановка healthcheck сервера
         if 'healthcheck_runner' in locals():
             await healthcheck_runner.cleanup()
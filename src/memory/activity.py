@@ -0,0 +1,75 @@
+"""Счетчики активных пользователей по минутным корзинам."""
+from typing import Dict, Iterable, List, Tuple
+
+
+class ActivityCounter:
+    """Учет активных пользователей за произвольные окна.
+
+    Каждый пользователь лежит ровно в одной минутной корзине - минуте
+    своей последней активности. Для каждого запрошенного окна хранится
+    готовый счетчик и его левая граница; при движении времени из счетчика
+    вычитаются только выпавшие из окна корзины, поэтому чтение и обновление
+    выполняются за амортизированное O(1).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[int, int] = {}      # минута -> число пользователей
+        self._minute_of: Dict[int, int] = {}    # user_id -> минута активности
+        self._windows: Dict[int, List[int]] = {}  # окно в минутах -> [счетчик, первая минута окна]
+
+    def touch(self, user_id: int, timestamp: float) -> None:
+        """Отметка активности пользователя."""
+        minute = int(timestamp // 60)
+        previous = self._minute_of.get(user_id)
+        if previous == minute:
+            return
+        if previous is not None:
+            self._leave_bucket(previous)
+
+        self._minute_of[user_id] = minute
+        self._buckets[minute] = self._buckets.get(minute, 0) + 1
+        for window in self._windows.values():
+            if minute >= window[1]:
+                window[0] += 1
+
+    def remove(self, user_id: int) -> None:
+        """Удаление пользователя из учета."""
+        previous = self._minute_of.pop(user_id, None)
+        if previous is not None:
+            self._leave_bucket(previous)
+
+    def count(self, window_minutes: int, now: float) -> int:
+        """Число пользователей, активных за последние window_minutes минут."""
+        start = int(now // 60) - window_minutes + 1
+        window = self._windows.get(window_minutes)
+        if window is None:
+            total = sum(n for minute, n in self._buckets.items() if minute >= start)
+            self._windows[window_minutes] = [total, start]
+            return total
+
+        if start > window[1]:
+            if start - window[1] <= len(self._buckets):
+                expired = (self._buckets.get(minute, 0) for minute in range(window[1], start))
+            else:
+                expired = (n for minute, n in self._buckets.items() if window[1] <= minute < start)
+            window[0] -= sum(expired)
+            window[1] = start
+        return window[0]
+
+    def rebuild(self, activity: Iterable[Tuple[int, float]]) -> None:
+        """Полное перестроение по парам (user_id, timestamp)."""
+        self._buckets.clear()
+        self._minute_of.clear()
+        self._windows.clear()
+        for user_id, timestamp in activity:
+            self.touch(user_id, timestamp)
+
+    def _leave_bucket(self, minute: int) -> None:
+        remaining = self._buckets[minute] - 1
+        if remaining:
+            self._buckets[minute] = remaining
+        else:
+            del self._buckets[minute]
+        for window in self._windows.values():
+            if minute >= window[1]:
+                window[0] -= 1
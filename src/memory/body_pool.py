@@ -0,0 +1,69 @@
+"""Общий пул текстов сообщений с подсчетом ссылок."""
+import sys
+from typing import Dict, Iterable, List
+
+# Короче этого тексты не пулятся: экономия меньше накладных расходов пула
+BODY_POOL_MIN_CHARS = 256
+
+
+class BodyPool:
+    """Пул длинных текстов сообщений, адресуемый содержимым.
+
+    Одинаковые тексты (приветствие, справка, повторяющиеся ответы LLM)
+    хранятся в одном экземпляре: acquire возвращает уже имеющуюся строку
+    с тем же содержимым, и сообщения разных сессий ссылаются на нее.
+    Ключ словаря - сама строка, поэтому адрес - ее хэш, который Python
+    вычисляет один раз и кэширует в объекте. Когда последнее сообщение с
+    текстом покидает память, release удаляет запись из пула.
+    """
+
+    def __init__(self, min_chars: int = BODY_POOL_MIN_CHARS):
+        self.min_chars = min_chars
+        self._entries: Dict[str, List] = {}  # текст -> [общий экземпляр, число ссылок]
+        self.references = 0
+        self.pooled_bytes = 0  # Память уникальных текстов
+        self.saved_bytes = 0   # Память, которую заняли бы повторы без пула
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def acquire(self, text: str) -> str:
+        """Общий экземпляр текста с учетом новой ссылки."""
+        if len(text) < self.min_chars:
+            return text
+
+        self.references += 1
+        entry = self._entries.get(text)
+        if entry is None:
+            self._entries[text] = [text, 1]
+            self.pooled_bytes += sys.getsizeof(text)
+            return text
+
+        entry[1] += 1
+        self.saved_bytes += sys.getsizeof(text)
+        return entry[0]
+
+    def release(self, text: str) -> None:
+        """Снятие ссылки; текст без ссылок удаляется из пула."""
+        if len(text) < self.min_chars:
+            return
+
+        entry = self._entries.get(text)
+        if entry is None:
+            return
+        self.references -= 1
+        entry[1] -= 1
+        if entry[1]:
+            self.saved_bytes -= sys.getsizeof(text)
+        else:
+            del self._entries[text]
+            self.pooled_bytes -= sys.getsizeof(text)
+
+    def release_all(self, texts: Iterable[str]) -> None:
+        """Снятие ссылок сразу с нескольких текстов."""
+        for text in texts:
+            self.release(text)
+
+    def dedup_ratio(self) -> float:
+        """Среднее число ссылок на один уникальный текст."""
+        return self.references / len(self._entries) if self._entries else 1.0
@@ -0,0 +1,144 @@
+"""Снимок сессий в памяти для быстрого восстановления после перезапуска."""
+import asyncio
+import logging
+import marshal
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Sequence
+
+from .storage import Message, SessionSummary, UserSession, get_session_store
+
+logger = logging.getLogger(__name__)
+
+# Заголовок файла: сигнатура, версия формата marshal, время создания снимка
+_MAGIC = b"BLMSNAP1"
+_HEADER = struct.Struct("<8sBd")
+
+# Снимок пишется кадрами: длина сжатого кадра и сам кадр
+_FRAME = struct.Struct("<I")
+
+# Сессий в одном кадре: ограничивает пиковую память при записи и чтении
+_FRAME_SESSIONS = 1000
+
+# Уровень zlib: снимок пишется при остановке, важнее скорость, чем размер
+_COMPRESS_LEVEL = 1
+
+
+def session_to_record(session: UserSession) -> tuple:
+    """Сессия в виде кортежа примитивов, пригодного для marshal."""
+    summary = session["summary"]
+    return (
+        session["user_id"],
+        session["user_name"],
+        session["created_at"].timestamp(),
+        session["last_activity"].timestamp(),
+        summary.text if summary is not None else None,
+        summary.folded_tokens if summary is not None else 0,
+        tuple((m.role, m.content, m.timestamp, m.tokens) for m in session["history"]),
+    )
+
+
+def session_from_record(record: tuple) -> UserSession:
+    """Восстановление сессии из кортежа session_to_record."""
+    user_id, user_name, created_at, last_activity, summary, folded_tokens, history = record
+    return UserSession(
+        user_id=user_id,
+        user_name=user_name,
+        history=deque(Message(*message) for message in history),
+        summary=SessionSummary(summary, folded_tokens) if summary is not None else None,
+        last_activity=datetime.fromtimestamp(last_activity),
+        created_at=datetime.fromtimestamp(created_at)
+    )
+
+
+def write_snapshot(path: str, sessions: Iterable[UserSession]) -> int:
+    """Запись сессий в бинарный снимок, возвращает число записанных сессий."""
+    return write_records(path, [session_to_record(s) for s in sessions])
+
+
+def write_records(path: str, records: Sequence[tuple]) -> int:
+    """Запись кортежей session_to_record в бинарный снимок.
+
+    Записи сериализуются marshal кадрами по _FRAME_SESSIONS штук, каждый
+    кадр сжимается отдельно - в памяти не собирается полная несжатая копия
+    всех историй. Файл заменяется атомарно, поэтому прерванная запись не
+    портит предыдущий снимок.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, marshal.version, time.time()))
+        for start in range(0, len(records), _FRAME_SESSIONS):
+            _write_frame(f, records[start:start + _FRAME_SESSIONS])
+    os.replace(tmp, target)
+    return len(records)
+
+
+def _write_frame(f: BinaryIO, records: list) -> None:
+    frame = zlib.compress(marshal.dumps(records), _COMPRESS_LEVEL)
+    f.write(_FRAME.pack(len(frame)))
+    f.write(frame)
+
+
+def read_snapshot(path: str, ttl_hours: int) -> List[UserSession]:
+    """Чтение снимка с пропуском сессий, истекших по TTL.
+
+    Отсутствующий снимок - обычный первый запуск, возвращается пустой список.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+
+    cutoff = time.time() - ttl_hours * 3600
+    sessions: List[UserSession] = []
+    with f:
+        magic, version, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"Неизвестный формат снимка сессий: {path}")
+        if version != marshal.version:
+            raise ValueError(f"Снимок сессий записан другой версией marshal ({version}): {path}")
+
+        while header := f.read(_FRAME.size):
+            (size,) = _FRAME.unpack(header)
+            records = marshal.loads(zlib.decompress(f.read(size)))
+            sessions.extend(session_from_record(record) for record in records if record[3] >= cutoff)
+    return sessions
+
+
+async def save_session_snapshot(path: str) -> None:
+    """Сохранение всех сессий текущего хранилища в снимок.
+
+    Сессии копируются в кортежи в event loop, пока их никто не меняет;
+    сериализация копии и запись на диск выполняются в рабочем потоке.
+    """
+    started = time.perf_counter()
+    records = [session_to_record(s) for s in get_session_store().snapshot_sessions()]
+    try:
+        count = await asyncio.to_thread(write_records, path, records)
+    except Exception as e:
+        logger.error(f"Failed to write session snapshot {path}: {e}")
+        return
+    logger.info(f"Session snapshot saved: {count} sessions in {time.perf_counter() - started:.2f}s")
+
+
+async def load_session_snapshot(path: str, ttl_hours: int) -> int:
+    """Восстановление сессий из снимка в текущее хранилище, возвращает их число."""
+    started = time.perf_counter()
+    try:
+        sessions = await asyncio.to_thread(read_snapshot, path, ttl_hours)
+    except Exception as e:
+        logger.error(f"Failed to read session snapshot {path}, starting empty: {e}")
+        return 0
+
+    restored = get_session_store().restore_sessions(sessions)
+    if restored:
+        logger.info(f"Session snapshot loaded: {restored} sessions in {time.perf_counter() - started:.2f}s")
+    return restored
@@ -0,0 +1,78 @@
+"""Выгрузка вытесненных из памяти сессий на диск."""
+import logging
+import marshal
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+from .snapshot import session_from_record, session_to_record
+from .storage import UserSession
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spill (
+    user_id INTEGER PRIMARY KEY,
+    last_activity REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_spill_activity ON spill (last_activity);
+"""
+
+
+class SessionSpill:
+    """Файл вытесненных сессий: SQLite-таблица user_id -> запись снимка.
+
+    Сессия лежит либо в памяти, либо здесь: при возврате в память запись
+    удаляется. Файл - кэш, а не журнал, поэтому запись идет без fsync;
+    при потере файла пользователи лишь начинают диалог заново.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(_SCHEMA)
+        # Число записей поддерживается в put/take/purge, чтобы не считать их запросом
+        self._count = self._conn.execute("SELECT COUNT(*) FROM spill").fetchone()[0]
+        logger.info(f"Session spill file opened: {path}")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def put(self, sessions: List[UserSession]) -> None:
+        """Запись сессий одной транзакцией."""
+        rows = [
+            (s["user_id"], s["last_activity"].timestamp(), zlib.compress(marshal.dumps(session_to_record(s)), 1))
+            for s in sessions
+        ]
+        self._conn.execute("BEGIN")
+        try:
+            replaced = self._conn.executemany("DELETE FROM spill WHERE user_id = ?", [row[:1] for row in rows]).rowcount
+            self._conn.executemany("INSERT INTO spill (user_id, last_activity, data) VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._count += len(rows) - replaced
+
+    def take(self, user_id: int) -> Optional[UserSession]:
+        """Извлечение сессии с удалением из файла."""
+        row = self._conn.execute("SELECT data FROM spill WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("DELETE FROM spill WHERE user_id = ?", (user_id,))
+        self._count -= 1
+        return session_from_record(marshal.loads(zlib.decompress(row[0])))
+
+    def purge(self, cutoff: float) -> int:
+        """Удаление сессий, неактивных с момента cutoff."""
+        purged = self._conn.execute("DELETE FROM spill WHERE last_activity < ?", (cutoff,)).rowcount
+        self._count -= purged
+        return purged
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,284 @@
+"""Персистентное хранилище сессий на SQLite с отложенной записью."""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .storage import InMemorySessionStore, Message, SessionSummary, UserSession
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_activity REAL NOT NULL,
+    summary TEXT,
+    summary_folded_tokens INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_sessions_activity ON sessions (last_activity);
+"""
+
+# Колонки, добавленные после первой версии схемы: (имя, определение)
+_MIGRATIONS = (
+    ("summary", "TEXT"),
+    ("summary_folded_tokens", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Маркер остановки фонового писателя
+_STOP = ("stop",)
+
+
+class SQLiteSessionStore(InMemorySessionStore):
+    """Хранилище сессий в SQLite (WAL) с кэшем в памяти.
+
+    Чтения обслуживаются из памяти, изменения ставятся в очередь и
+    записываются фоновым потоком пачками в одной транзакции, поэтому
+    event loop не ждет диск. При промахе кэша сессия подгружается из базы.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        db_path: str,
+        sessions: Optional[Dict[int, UserSession]] = None,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        memory_budget_bytes: int = 0
+    ):
+        super().__init__(sessions, memory_budget_bytes=memory_budget_bytes)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        self._migrate()
+
+        # Сессии, удаление которых еще не записано: их нельзя подгружать из базы
+        self._pending_deletes: set = set()
+        # Вытесненные сессии, изменения которых еще в очереди:
+        # user_id -> (номер вытеснения, сессия в состоянии на момент вытеснения)
+        self._unsynced: Dict[int, Tuple[int, UserSession]] = {}
+        self._unsynced_lock = threading.Lock()
+        self._spill_seq = 0
+        self._queue: "queue.SimpleQueue[Tuple[Any, ...]]" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"SQLite session store opened: {db_path}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание записи всех поставленных в очередь изменений."""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        if not self._writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._reader.close()
+        logger.info(f"SQLite session store closed: {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self) -> None:
+        """Добавление недостающих колонок в базу, созданную прежней версией."""
+        columns = {row[1] for row in self._reader.execute("PRAGMA table_info(sessions)")}
+        for name, definition in _MIGRATIONS:
+            if name not in columns:
+                self._reader.execute(f"ALTER TABLE sessions ADD COLUMN {name} {definition}")
+                logger.info(f"SQLite sessions table migrated: added column {name}")
+
+    def _load_session(self, user_id: int) -> Optional[UserSession]:
+        if user_id in self._pending_deletes:
+            return None
+        with self._unsynced_lock:
+            pending = self._unsynced.pop(user_id, None)
+        if pending is not None:
+            # Сессия вытеснена недавно и база может еще не догнать ее:
+            # возвращаем сохраненный объект, не дожидаясь писателя
+            return pending[1]
+
+        row = self._reader.execute(
+            "SELECT user_name, created_at, last_activity, summary, summary_folded_tokens FROM sessions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        rows = self._reader.execute(
+            "SELECT role, content, timestamp FROM messages WHERE user_id = ? ORDER BY id",
+            (user_id,)
+        ).fetchall()
+        logger.debug(f"Loaded session for user {user_id} from SQLite: {len(rows)} messages")
+        return UserSession(
+            user_id=user_id,
+            user_name=row[0],
+            history=deque(Message(role, content, ts) for role, content, ts in rows),
+            summary=SessionSummary(row[3], row[4]) if row[3] is not None else None,
+            last_activity=datetime.fromtimestamp(row[2]),
+            created_at=datetime.fromtimestamp(row[1])
+        )
+
+    def _spill_sessions(self, sessions: List[UserSession]) -> None:
+        # Сессии уже в базе или в очереди записи: из памяти их можно просто
+        # забыть. Пока писатель не догнал очередь, подгрузка берет их отсюда
+        user_ids = [session["user_id"] for session in sessions]
+        with self._unsynced_lock:
+            self._spill_seq += 1
+            seq = self._spill_seq
+            self._unsynced.update((session["user_id"], (seq, session)) for session in sessions)
+        self._queue.put(("spilled", seq, user_ids))
+
+    def _on_session_touched(self, session: UserSession) -> None:
+        self._queue.put((
+            "session",
+            session["user_id"],
+            session["user_name"],
+            session["created_at"].timestamp(),
+            session["last_activity"].timestamp()
+        ))
+
+    def _on_message_added(self, session: UserSession, message: Message, removed_count: int) -> None:
+        user_id = session["user_id"]
+        self._queue.put(("message", user_id, message.role, message.content, message.timestamp))
+        if removed_count:
+            self._queue.put(("trim", user_id, len(session["history"])))
+
+    def _on_history_cleared(self, session: UserSession) -> None:
+        self._queue.put(("clear", session["user_id"]))
+        self._on_session_touched(session)
+
+    def _on_summary_applied(self, session: UserSession) -> None:
+        summary = session["summary"]
+        user_id = session["user_id"]
+        self._queue.put(("summary", user_id, summary.text, summary.folded_tokens))
+        self._queue.put(("trim", user_id, len(session["history"])))
+
+    def _on_sessions_removed(self, user_ids: List[int], cutoff_time: datetime) -> None:
+        self._pending_deletes.update(user_ids)
+        self._queue.put(("delete", list(user_ids)))
+
+    def purge_offloaded(self, ttl_hours: float) -> int:
+        # Сессии, истекшие в базе, но не лежащие в памяти: вытесненные по
+        # бюджету или не загружавшиеся с запуска. Удаляются фоновым писателем,
+        # поэтому в возвращаемое число не входят
+        cutoff_time = datetime.now() - timedelta(hours=ttl_hours)
+        self._queue.put(("purge", cutoff_time.timestamp()))
+        return super().purge_offloaded(ttl_hours)
+
+    def _writer_loop(self) -> None:
+        """Фоновая запись изменений пачками."""
+        conn = self._connect()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            running = _STOP not in batch
+            self._apply_batch(conn, batch)
+        conn.close()
+
+    def _apply_batch(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]) -> None:
+        """Применение пачки изменений в одной транзакции."""
+        waiters = []
+        deleted: List[int] = []
+        synced: List[Tuple[int, List[int]]] = []
+        try:
+            conn.execute("BEGIN")
+            for op in batch:
+                kind = op[0]
+                if kind == "session":
+                    conn.execute(
+                        "INSERT INTO sessions (user_id, user_name, created_at, last_activity) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET user_name = excluded.user_name, "
+                        "last_activity = excluded.last_activity",
+                        op[1:]
+                    )
+                elif kind == "message":
+                    conn.execute(
+                        "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                        op[1:]
+                    )
+                    conn.execute(
+                        "UPDATE sessions SET last_activity = ? WHERE user_id = ?",
+                        (op[4], op[1])
+                    )
+                elif kind == "trim":
+                    conn.execute(
+                        "DELETE FROM messages WHERE user_id = ? AND id <= "
+                        "(SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (op[1], op[1], op[2])
+                    )
+                elif kind == "summary":
+                    conn.execute(
+                        "UPDATE sessions SET summary = ?, summary_folded_tokens = ? WHERE user_id = ?",
+                        (op[2], op[3], op[1])
+                    )
+                elif kind == "clear":
+                    conn.execute("DELETE FROM messages WHERE user_id = ?", (op[1],))
+                    conn.execute(
+                        "UPDATE sessions SET summary = NULL, summary_folded_tokens = 0 WHERE user_id = ?",
+                        (op[1],)
+                    )
+                elif kind == "delete":
+                    deleted.extend(op[1])
+                    for user_id in op[1]:
+                        conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+                        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                elif kind == "purge":
+                    conn.execute(
+                        "DELETE FROM messages WHERE user_id IN (SELECT user_id FROM sessions WHERE last_activity < ?)",
+                        (op[1],)
+                    )
+                    conn.execute("DELETE FROM sessions WHERE last_activity < ?", (op[1],))
+                elif kind == "spilled":
+                    synced.append(op[1:])
+                elif kind == "flush":
+                    waiters.append(op[1])
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"SQLite session write failed, {len(batch)} operations dropped: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        finally:
+            self._pending_deletes.difference_update(deleted)
+            with self._unsynced_lock:
+                for seq, user_ids in synced:
+                    for user_id in user_ids:
+                        # Сессию могли снова подгрузить и вытеснить: ее метку снимет следующее вытеснение
+                        pending = self._unsynced.get(user_id)
+                        if pending is not None and pending[0] == seq:
+                            del self._unsynced[user_id]
+            for done in waiters:
+                done.set()
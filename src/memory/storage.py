@@ -1,24 +1,89 @@
 """Хранение и управление историей диалогов."""
+import heapq
 import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, TypedDict
+from typing import Deque, Dict, List, Optional, Tuple, TypedDict
 import asyncio
+import sys
+import time
+
+from .activity import ActivityCounter
+from .body_pool import BodyPool
+from .tokens import estimate_message_tokens
 
 logger = logging.getLogger(__name__)
 
+# Сколько сессий держат готовое представление истории для LLM
+HISTORY_VIEW_CACHE_SIZE = 1000
+
+# При превышении бюджета памяти сессии вытесняются до этой доли бюджета,
+# чтобы следующее сообщение не запускало вытеснение снова
+EVICTION_TARGET_RATIO = 0.9
+
+# Префикс сообщения со сжатым содержанием ранней части диалога
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога: "
+
+
+class Message:
+    """Запись сообщения в истории."""
+    __slots__ = ("role", "content", "timestamp", "tokens")
+
+    def __init__(self, role: str, content: str, timestamp: float, tokens: Optional[int] = None):
+        self.role = role            # "user" или "assistant"
+        self.content = content      # Текст сообщения
+        self.timestamp = timestamp  # Unix-время
+        # Оценка размера в токенах (готовая - при восстановлении из снимка)
+        self.tokens = tokens if tokens is not None else estimate_message_tokens(content)
+
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content!r}, timestamp={self.timestamp})"
+
+
+class HistoryMessage(dict):
+    """Сообщение истории в формате OpenAI, защищенное от изменения."""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("История диалога доступна только для чтения")
 
-class Message(TypedDict):
-    """Структура сообщения в истории."""
-    role: str          # "user" или "assistant"
-    content: str       # Текст сообщения
-    timestamp: datetime
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self) -> Dict[str, str]:
+        """Изменяемая копия сообщения."""
+        return dict(self)
+
+
+HistoryView = Tuple[HistoryMessage, ...]
+
+# Размер записи сообщения без текста: объект со __slots__, время и число токенов
+_MESSAGE_RECORD_BYTES = sys.getsizeof(Message("", "", 0.0, 0)) + sys.getsizeof(0.0) + sys.getsizeof(0)
+
+
+class SessionSummary:
+    """Сжатое содержание свернутой ранней части диалога."""
+    __slots__ = ("text", "message", "tokens", "folded_tokens")
+
+    def __init__(self, text: str, folded_tokens: int):
+        self.text = text
+        self.message = HistoryMessage(role="system", content=SUMMARY_PREFIX + text)
+        self.tokens = estimate_message_tokens(self.message["content"])
+        self.folded_tokens = folded_tokens  # Токены всех свернутых сообщений
+
+    @property
+    def saved_tokens(self) -> int:
+        """Сколько токенов экономит отправка резюме вместо исходных сообщений."""
+        return max(0, self.folded_tokens - self.tokens)
 
 
 class UserSession(TypedDict):
     """Структура сессии пользователя."""
     user_id: int
     user_name: str
-    history: List[Message]
+    history: Deque[Message]  # Кольцевой буфер последних сообщений
+    summary: Optional[SessionSummary]  # Резюме свернутых сообщений
     last_activity: datetime
     created_at: datetime
 
@@ -27,109 +92,701 @@ class UserSession(TypedDict):
 user_sessions: Dict[int, UserSession] = {}
 
 
-def get_user_session(user_id: int, user_name: str) -> UserSession:
-    """Получение или создание сессии пользователя."""
-    if user_id not in user_sessions:
-        logger.info(f"Creating new session for user {user_id}")
-        user_sessions[user_id] = UserSession(
-            user_id=user_id,
-            user_name=user_name,
-            history=[],
-            last_activity=datetime.now(),
-            created_at=datetime.now()
+def message_bytes(message: Message) -> int:
+    """Оценка памяти, занимаемой сообщением истории."""
+    return _MESSAGE_RECORD_BYTES + sys.getsizeof(message.content)
+
+
+def session_bytes(session: UserSession) -> int:
+    """Оценка памяти, занимаемой сессией вместе с историей и резюме."""
+    size = (
+        sys.getsizeof(session)
+        + sys.getsizeof(session["history"])
+        + sys.getsizeof(session["user_name"])
+        + sys.getsizeof(session["last_activity"])
+        + sys.getsizeof(session["created_at"])
+    )
+    summary = session["summary"]
+    if summary is not None:
+        size += sys.getsizeof(summary.text) + sys.getsizeof(summary.message) + sys.getsizeof(summary.message["content"])
+    return size + sum(message_bytes(msg) for msg in session["history"])
+
+
+class SessionStore(ABC):
+    """Интерфейс хранилища сессий.
+
+    Все публичные функции модуля работают через активное хранилище,
+    поэтому бэкенд можно заменить без изменений в обработчиках.
+    """
+
+    @abstractmethod
+    def get_session(self, user_id: int, user_name: str) -> UserSession:
+        """Получение или создание сессии пользователя."""
+
+    @abstractmethod
+    def add_message(self, user_id: int, role: str, content: str, max_history_size: int) -> None:
+        """Добавление сообщения в историю пользователя."""
+
+    def get_history(self, user_id: int) -> List[Dict[str, str]]:
+        """Получение истории пользователя в формате OpenAI."""
+        return list(self.get_view(user_id))
+
+    @abstractmethod
+    def get_view(self, user_id: int) -> HistoryView:
+        """Неизменяемое представление истории в формате OpenAI без копирования."""
+
+    @abstractmethod
+    def get_context(self, user_id: int, token_budget: int) -> HistoryView:
+        """Резюме и последние сообщения истории, суммарно укладывающиеся в token_budget."""
+
+    @abstractmethod
+    def get_summary(self, user_id: int) -> Optional[SessionSummary]:
+        """Текущее резюме диалога пользователя."""
+
+    @abstractmethod
+    def needs_compaction(self, user_id: int, threshold_tokens: int, keep_recent: int) -> bool:
+        """Превышает ли история порог и есть ли что сворачивать."""
+
+    @abstractmethod
+    def get_compaction_batch(self, user_id: int, keep_recent: int) -> Optional[Tuple[Optional[str], Tuple[Message, ...]]]:
+        """Предыдущее резюме и сообщения, которые нужно свернуть."""
+
+    @abstractmethod
+    def apply_summary(self, user_id: int, text: str, folded: Tuple[Message, ...]) -> bool:
+        """Замена свернутых сообщений новым резюме."""
+
+    @abstractmethod
+    def clear_history(self, user_id: int) -> None:
+        """Очистка истории диалога пользователя."""
+
+    @abstractmethod
+    def expire(self, ttl_hours: float, limit: int) -> int:
+        """Удаление не более limit истекших сессий, возвращает количество удаленных."""
+
+    @abstractmethod
+    def has_expired(self, ttl_hours: float) -> bool:
+        """Есть ли еще истекшие сессии."""
+
+    def purge_offloaded(self, ttl_hours: float) -> int:
+        """Удаление истекших сессий, которые есть только вне памяти (на диске)."""
+        return 0
+
+    def cleanup(self, ttl_hours: float) -> int:
+        """Удаление всех неактивных сессий, возвращает количество удаленных."""
+        removed = 0
+        while self.has_expired(ttl_hours):
+            removed += self.expire(ttl_hours, 1000)
+        return removed + self.purge_offloaded(ttl_hours)
+
+    def rebuild_indexes(self) -> None:
+        """Перестроение индексов истечения и активности по текущему состоянию сессий."""
+
+    @abstractmethod
+    def snapshot_sessions(self) -> List[UserSession]:
+        """Список сессий для сохранения в снимок."""
+
+    @abstractmethod
+    def restore_sessions(self, sessions: List[UserSession]) -> int:
+        """Добавление сессий из снимка; уже существующие сессии не заменяются."""
+
+    @abstractmethod
+    def session_count(self) -> int:
+        """Количество сессий в памяти."""
+
+    @abstractmethod
+    def active_users(self, window_minutes: int) -> int:
+        """Количество пользователей, активных за последние window_minutes минут."""
+
+    @abstractmethod
+    def memory_stats(self) -> Dict[str, float]:
+        """Учет памяти сессий, вытеснения на диск и возврата в память."""
+
+    def close(self) -> None:
+        """Освобождение ресурсов хранилища."""
+
+
+class InMemorySessionStore(SessionStore):
+    """Хранилище сессий в памяти процесса.
+
+    Истечение TTL отслеживается min-heap по last_activity с ленивой
+    инвалидацией: у каждой сессии одна запись в куче, обновление активности
+    ее не трогает, а устаревший ключ переставляется, когда запись оказывается
+    на вершине. Стоимость очистки пропорциональна числу истекающих сессий.
+    Активность пользователей дополнительно учитывается в минутных корзинах
+    для чтения числа активных пользователей за O(1).
+
+    Для view_cache_size последних активных сессий хранится готовое
+    представление истории в формате OpenAI, которое обновляется
+    инкрементально при добавлении, вытеснении и очистке сообщений.
+
+    Размер каждой сессии в байтах поддерживается при изменениях. Если
+    суммарный размер превышает memory_budget_bytes, давно неактивные
+    сессии (та же куча, что и для TTL) выгружаются в spill и
+    возвращаются в память при следующем обращении. Без spill бюджет
+    действует только для бэкендов, которые сами хранят все сессии.
+
+    Длинные тексты сообщений берутся из общего пула bodies: одинаковые
+    тексты разных сессий хранятся в одном экземпляре, а ссылки снимаются,
+    когда сообщение покидает память (обрезка, очистка, сворачивание,
+    истечение, вытеснение). Учет размера сессий пул не учитывает и
+    остается оценкой сверху.
+    """
+
+    # Бэкенд хранит все сессии сам: вытесненную сессию можно просто забыть
+    persistent = False
+
+    def __init__(
+        self,
+        sessions: Optional[Dict[int, UserSession]] = None,
+        view_cache_size: int = HISTORY_VIEW_CACHE_SIZE,
+        memory_budget_bytes: int = 0,
+        spill=None
+    ):
+        self.sessions = user_sessions if sessions is None else sessions
+        self.view_cache_size = view_cache_size
+        self._spill = spill
+        self.memory_budget_bytes = memory_budget_bytes
+        if memory_budget_bytes and spill is None and not self.persistent:
+            logger.warning("Memory budget ignored: no spill file for in-memory session store")
+            self.memory_budget_bytes = 0
+        self._views: "OrderedDict[int, HistoryView]" = OrderedDict()
+        self._expiry_heap: List[Tuple[datetime, int]] = []
+        self._bytes: Dict[int, int] = {}
+        self.memory_bytes = 0
+        self._evictions = 0
+        self._eviction_seconds = 0.0
+        self._rehydrations = 0
+        self._rehydration_seconds = 0.0
+        self.activity = ActivityCounter()
+        self.bodies = BodyPool()
+        for session in self.sessions.values():
+            self._pool_history(session)
+        self.rebuild_indexes()
+
+    def get_session(self, user_id: int, user_name: str) -> UserSession:
+        session = self._lookup(user_id)
+        if session is None:
+            logger.info(f"Creating new session for user {user_id}")
+            now = datetime.now()
+            session = UserSession(
+                user_id=user_id,
+                user_name=user_name,
+                history=deque(),
+                summary=None,
+                last_activity=now,
+                created_at=now
+            )
+            self.sessions[user_id] = session
+            self._views.pop(user_id, None)
+            heapq.heappush(self._expiry_heap, (now, user_id))
+            self._account(session)
+            self._enforce_budget(user_id)
+        else:
+            # Обновление времени активности и имени
+            session["last_activity"] = datetime.now()
+            session["user_name"] = user_name
+
+        self.activity.touch(user_id, session["last_activity"].timestamp())
+        self._on_session_touched(session)
+        return session
+
+    def add_message(self, user_id: int, role: str, content: str, max_history_size: int) -> None:
+        session = self._lookup(user_id)
+        if session is None:
+            logger.warning(f"Session not found for user {user_id}")
+            return
+
+        now = time.time()
+        message = Message(role, self.bodies.acquire(content), now)
+
+        # Ограничение размера истории: deque(maxlen) вытесняет старые сообщения за O(1)
+        history = session["history"]
+        removed_count = max(0, len(history) + 1 - max_history_size)
+        removed = [history[i] for i in range(removed_count)]
+        delta = message_bytes(message) - sum(message_bytes(msg) for msg in removed)
+        if history.maxlen != max_history_size:
+            history = session["history"] = deque(history, maxlen=max_history_size)
+        if removed_count:
+            logger.debug(f"Trimmed {removed_count} old messages for user {user_id}")
+
+        history.append(message)
+        self.bodies.release_all(msg.content for msg in removed)
+        session["last_activity"] = datetime.fromtimestamp(now)
+
+        view = self._views.get(user_id)
+        if view is not None:
+            view += (HistoryMessage(role=role, content=message.content),)
+            self._cache_view(user_id, view[-len(history):])
+        self.activity.touch(user_id, now)
+        self._bytes[user_id] = self._bytes.get(user_id, 0) + delta
+        self.memory_bytes += delta
+
+        self._on_message_added(session, message, removed_count)
+        logger.debug(f"Added {role} message for user {user_id}, history size: {len(history)}")
+        self._enforce_budget(user_id)
+
+    def get_view(self, user_id: int) -> HistoryView:
+        view = self._views.get(user_id)
+        if view is not None:
+            self._views.move_to_end(user_id)
+            return view
+
+        session = self._lookup(user_id)
+        if session is None:
+            return ()
+
+        view = tuple(HistoryMessage(role=msg.role, content=msg.content) for msg in session["history"])
+        self._cache_view(user_id, view)
+        logger.debug(f"Built history view for user {user_id}: {len(view)} messages")
+        return view
+
+    def clear_history(self, user_id: int) -> None:
+        session = self._lookup(user_id)
+        if session is None:
+            logger.warning(f"Session not found for user {user_id} during clear")
+            return
+
+        self.bodies.release_all(msg.content for msg in session["history"])
+        session["history"].clear()
+        session["summary"] = None
+        self._views.pop(user_id, None)
+        self._account(session)
+        session["last_activity"] = datetime.now()
+        self.activity.touch(user_id, session["last_activity"].timestamp())
+        self._on_history_cleared(session)
+        logger.info(f"Cleared history for user {user_id}")
+
+    def expire(self, ttl_hours: float, limit: int) -> int:
+        cutoff_time = datetime.now() - timedelta(hours=ttl_hours)
+        heap = self._expiry_heap
+        old_sessions = []
+        steps = 0
+
+        while heap and heap[0][0] < cutoff_time and steps < limit:
+            steps += 1
+            _, user_id = heapq.heappop(heap)
+            session = self.sessions.get(user_id)
+            if session is None:
+                continue
+            if session["last_activity"] >= cutoff_time:
+                # Сессия была активна после постановки в кучу: переставляем ключ
+                heapq.heappush(heap, (session["last_activity"], user_id))
+                continue
+
+            del self.sessions[user_id]
+            self._views.pop(user_id, None)
+            self.activity.remove(user_id)
+            self.memory_bytes -= self._bytes.pop(user_id, 0)
+            self.bodies.release_all(msg.content for msg in session["history"])
+            old_sessions.append(user_id)
+            logger.info(f"Cleaned up old session for user {user_id}")
+
+        if old_sessions:
+            self._on_sessions_removed(old_sessions, cutoff_time)
+        return len(old_sessions)
+
+    def has_expired(self, ttl_hours: float) -> bool:
+        heap = self._expiry_heap
+        cutoff_time = datetime.now() - timedelta(hours=ttl_hours)
+        return bool(heap) and heap[0][0] < cutoff_time
+
+    def purge_offloaded(self, ttl_hours: float) -> int:
+        if self._spill is None:
+            return 0
+        cutoff_time = datetime.now() - timedelta(hours=ttl_hours)
+        purged = self._spill.purge(cutoff_time.timestamp())
+        if purged:
+            logger.info(f"Cleaned up {purged} old spilled sessions")
+        return purged
+
+    def rebuild_indexes(self) -> None:
+        self._expiry_heap = [(s["last_activity"], user_id) for user_id, s in self.sessions.items()]
+        heapq.heapify(self._expiry_heap)
+        self.activity.rebuild(
+            (user_id, s["last_activity"].timestamp()) for user_id, s in self.sessions.items()
         )
+        self._bytes = {user_id: session_bytes(s) for user_id, s in self.sessions.items()}
+        self.memory_bytes = sum(self._bytes.values())
+
+    def snapshot_sessions(self) -> List[UserSession]:
+        return list(self.sessions.values())
+
+    def restore_sessions(self, sessions: List[UserSession]) -> int:
+        restored = 0
+        for session in sessions:
+            user_id = session["user_id"]
+            if user_id in self.sessions:
+                continue
+            self._pool_history(session)
+            self.sessions[user_id] = session
+            self._views.pop(user_id, None)
+            restored += 1
+        if restored:
+            self.rebuild_indexes()
+            self._enforce_budget()
+        return restored
+
+    def session_count(self) -> int:
+        return len(self.sessions)
+
+    def active_users(self, window_minutes: int) -> int:
+        return self.activity.count(window_minutes, time.time())
+
+    def memory_stats(self) -> Dict[str, float]:
+        return {
+            "memory_bytes": self.memory_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "spilled_sessions": len(self._spill) if self._spill is not None else 0,
+            "evictions": self._evictions,
+            "eviction_avg_ms": self._eviction_seconds / self._evictions * 1000 if self._evictions else 0.0,
+            "rehydrations": self._rehydrations,
+            "rehydration_avg_ms": (
+                self._rehydration_seconds / self._rehydrations * 1000 if self._rehydrations else 0.0
+            ),
+            "body_pool_unique": len(self.bodies),
+            "body_pool_references": self.bodies.references,
+            "body_pool_dedup_ratio": self.bodies.dedup_ratio(),
+            "body_pool_saved_bytes": self.bodies.saved_bytes,
+        }
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+
+    def get_context(self, user_id: int, token_budget: int) -> HistoryView:
+        view = self.get_view(user_id)
+        session = self.sessions.get(user_id)
+        if session is None:
+            return view
+
+        summary = session["summary"]
+        if summary is not None and summary.tokens <= token_budget:
+            token_budget -= summary.tokens
+        else:
+            summary = None
+
+        used = 0
+        count = 0
+        for msg in reversed(session["history"]):
+            used += msg.tokens
+            if used > token_budget:
+                break
+            count += 1
+
+        if count < len(view):
+            logger.debug(f"Context for user {user_id} trimmed to {count}/{len(view)} messages by {token_budget} token budget")
+            view = view[len(view) - count:]
+        if summary is not None:
+            view = (summary.message,) + view
+        return view
+
+    def get_summary(self, user_id: int) -> Optional[SessionSummary]:
+        session = self.sessions.get(user_id)
+        return session["summary"] if session is not None else None
+
+    def needs_compaction(self, user_id: int, threshold_tokens: int, keep_recent: int) -> bool:
+        session = self.sessions.get(user_id)
+        if session is None or len(session["history"]) <= keep_recent:
+            return False
+        return sum(msg.tokens for msg in session["history"]) > threshold_tokens
+
+    def get_compaction_batch(self, user_id: int, keep_recent: int) -> Optional[Tuple[Optional[str], Tuple[Message, ...]]]:
+        session = self.sessions.get(user_id)
+        if session is None or len(session["history"]) <= keep_recent:
+            return None
+        history = session["history"]
+        folded = tuple(history[i] for i in range(len(history) - keep_recent))
+        previous = session["summary"].text if session["summary"] is not None else None
+        return previous, folded
+
+    def apply_summary(self, user_id: int, text: str, folded: Tuple[Message, ...]) -> bool:
+        session = self.sessions.get(user_id)
+        if session is None:
+            return False
+
+        # За время построения резюме история могла измениться: сворачиваем,
+        # только если свернутые сообщения по-прежнему идут первыми
+        history = session["history"]
+        if len(history) < len(folded) or not all(history[i] is msg for i, msg in enumerate(folded)):
+            logger.debug(f"History changed during compaction for user {user_id}, summary discarded")
+            return False
+
+        for _ in folded:
+            history.popleft()
+        self.bodies.release_all(msg.content for msg in folded)
+        view = self._views.get(user_id)
+        if view is not None:
+            self._views[user_id] = view[len(folded):]
+
+        previous_tokens = session["summary"].folded_tokens if session["summary"] is not None else 0
+        session["summary"] = SessionSummary(text, previous_tokens + sum(msg.tokens for msg in folded))
+        self._account(session)
+        self._on_summary_applied(session)
+        logger.info(f"Folded {len(folded)} messages into summary for user {user_id}")
+        return True
+
+    def _cache_view(self, user_id: int, view: HistoryView) -> None:
+        """Сохранение представления с вытеснением самой давней сессии."""
+        self._views[user_id] = view
+        self._views.move_to_end(user_id)
+        if len(self._views) > self.view_cache_size:
+            self._views.popitem(last=False)
+
+    def _lookup(self, user_id: int) -> Optional[UserSession]:
+        """Поиск сессии в памяти с подгрузкой из бэкенда при промахе."""
+        session = self.sessions.get(user_id)
+        if session is None:
+            started = time.perf_counter()
+            session = self._load_session(user_id)
+            if session is not None:
+                self._pool_history(session)
+                self.sessions[user_id] = session
+                self._views.pop(user_id, None)
+                heapq.heappush(self._expiry_heap, (session["last_activity"], user_id))
+                self.activity.touch(user_id, session["last_activity"].timestamp())
+                self._account(session)
+                self._rehydrations += 1
+                self._rehydration_seconds += time.perf_counter() - started
+                self._enforce_budget(user_id)
+        return session
+
+    def _pool_history(self, session: UserSession) -> None:
+        """Перевод текстов загруженной истории на общие экземпляры пула."""
+        for msg in session["history"]:
+            msg.content = self.bodies.acquire(msg.content)
+
+    def _account(self, session: UserSession) -> None:
+        """Пересчет размера сессии после изменения ее структуры."""
+        size = session_bytes(session)
+        self.memory_bytes += size - self._bytes.get(session["user_id"], 0)
+        self._bytes[session["user_id"]] = size
+
+    def _enforce_budget(self, keep_user_id: Optional[int] = None) -> None:
+        """Вытеснение давно неактивных сессий при превышении бюджета памяти.
+
+        Сессия keep_user_id только что выдана вызывающему коду и не
+        вытесняется, иначе он продолжил бы работать с оторванным объектом.
+        """
+        if not self.memory_budget_bytes or self.memory_bytes <= self.memory_budget_bytes:
+            return
+
+        started = time.perf_counter()
+        target = self.memory_budget_bytes * EVICTION_TARGET_RATIO
+        heap = self._expiry_heap
+        evicted: List[UserSession] = []
+        kept = None
+        while heap and self.memory_bytes > target:
+            last_activity, user_id = heapq.heappop(heap)
+            session = self.sessions.get(user_id)
+            if session is None:
+                continue
+            if user_id == keep_user_id:
+                kept = (last_activity, user_id)
+                continue
+            if session["last_activity"] != last_activity:
+                # Сессия была активна после постановки в кучу: переставляем ключ
+                heapq.heappush(heap, (session["last_activity"], user_id))
+                continue
+
+            del self.sessions[user_id]
+            self._views.pop(user_id, None)
+            self.activity.remove(user_id)
+            self.memory_bytes -= self._bytes.pop(user_id, 0)
+            self.bodies.release_all(msg.content for msg in session["history"])
+            evicted.append(session)
+        if kept is not None:
+            heapq.heappush(heap, kept)
+        if not evicted:
+            return
+
+        self._spill_sessions(evicted)
+        self._evictions += len(evicted)
+        self._eviction_seconds += time.perf_counter() - started
+        logger.info(
+            f"Evicted {len(evicted)} sessions over memory budget in {(time.perf_counter() - started) * 1000:.1f}ms, "
+            f"{self.memory_bytes} bytes in memory"
+        )
+
+    # Точки расширения для персистентных бэкендов
+
+    def _load_session(self, user_id: int) -> Optional[UserSession]:
+        return self._spill.take(user_id) if self._spill is not None else None
+
+    def _spill_sessions(self, sessions: List[UserSession]) -> None:
+        self._spill.put(sessions)
+
+    def _on_session_touched(self, session: UserSession) -> None:
+        pass
+
+    def _on_message_added(self, session: UserSession, message: Message, removed_count: int) -> None:
+        pass
+
+    def _on_history_cleared(self, session: UserSession) -> None:
+        pass
+
+    def _on_summary_applied(self, session: UserSession) -> None:
+        pass
+
+    def _on_sessions_removed(self, user_ids: List[int], cutoff_time: datetime) -> None:
+        pass
+
+
+# Активное хранилище сессий
+_session_store: SessionStore = InMemorySessionStore(user_sessions)
+
+
+def get_session_store() -> SessionStore:
+    """Получение активного хранилища сессий."""
+    return _session_store
+
+
+def set_session_store(store: SessionStore) -> None:
+    """Замена активного хранилища сессий."""
+    global _session_store
+    _session_store = store
+
+
+def init_session_store(
+    backend: str = "memory",
+    db_path: str = "data/sessions.db",
+    memory_budget_bytes: int = 0,
+    spill_path: str = "data/sessions.spill"
+) -> SessionStore:
+    """Создание и активация хранилища сессий по имени бэкенда.
+
+    При memory_budget_bytes > 0 бэкенд memory выгружает вытесненные
+    сессии в spill_path, а sqlite подгружает их из своей базы.
+    """
+    if backend == "memory":
+        spill = None
+        if memory_budget_bytes:
+            from .spill import SessionSpill
+            spill = SessionSpill(spill_path)
+        store = InMemorySessionStore(user_sessions, memory_budget_bytes=memory_budget_bytes, spill=spill)
+    elif backend == "sqlite":
+        from .sqlite_store import SQLiteSessionStore
+        store = SQLiteSessionStore(db_path, user_sessions, memory_budget_bytes=memory_budget_bytes)
     else:
-        # Обновление времени активности и имени
-        user_sessions[user_id]["last_activity"] = datetime.now()
-        user_sessions[user_id]["user_name"] = user_name
-        
-    return user_sessions[user_id]
+        raise ValueError(f"Неизвестный бэкенд хранилища сессий: {backend}")
+
+    logger.info(f"Session store initialized: {backend}")
+    set_session_store(store)
+    return store
+
+
+def close_session_store() -> None:
+    """Закрытие активного хранилища с сохранением отложенных записей."""
+    _session_store.close()
+
+
+def get_user_session(user_id: int, user_name: str) -> UserSession:
+    """Получение или создание сессии пользователя."""
+    return _session_store.get_session(user_id, user_name)
 
 
 def add_message(user_id: int, role: str, content: str, max_history_size: int = 10) -> None:
     """Добавление сообщения в историю пользователя."""
-    if user_id not in user_sessions:
-        logger.warning(f"Session not found for user {user_id}")
-        return
-    
-    message = Message(
-        role=role,
-        content=content,
-        timestamp=datetime.now()
-    )
-    
-    session = user_sessions[user_id]
-    session["history"].append(message)
-    session["last_activity"] = datetime.now()
-    
-    # Ограничение размера истории
-    if len(session["history"]) > max_history_size:
-        removed_count = len(session["history"]) - max_history_size
-        session["history"] = session["history"][-max_history_size:]
-        logger.debug(f"Trimmed {removed_count} old messages for user {user_id}")
-    
-    logger.debug(f"Added {role} message for user {user_id}, history size: {len(session['history'])}")
+    _session_store.add_message(user_id, role, content, max_history_size)
 
 
 def get_user_history(user_id: int) -> List[Dict[str, str]]:
     """Получение истории пользователя в формате OpenAI."""
-    if user_id not in user_sessions:
-        return []
-    
-    history = []
-    for msg in user_sessions[user_id]["history"]:
-        history.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
-    
-    logger.debug(f"Retrieved history for user {user_id}: {len(history)} messages")
-    return history
-
-
-def cleanup_old_sessions(ttl_hours: int = 24) -> int:
+    return _session_store.get_history(user_id)
+
+
+def get_user_history_view(user_id: int) -> HistoryView:
+    """Готовая к отправке в LLM история пользователя (только для чтения)."""
+    return _session_store.get_view(user_id)
+
+
+def get_user_context(user_id: int, token_budget: int) -> HistoryView:
+    """История пользователя для LLM, обрезанная по бюджету токенов."""
+    return _session_store.get_context(user_id, token_budget)
+
+
+def get_user_summary(user_id: int) -> Optional[SessionSummary]:
+    """Текущее резюме диалога пользователя."""
+    return _session_store.get_summary(user_id)
+
+
+def history_needs_compaction(user_id: int, threshold_tokens: int, keep_recent: int) -> bool:
+    """Нужно ли свернуть раннюю часть истории в резюме."""
+    return _session_store.needs_compaction(user_id, threshold_tokens, keep_recent)
+
+
+def get_compaction_batch(user_id: int, keep_recent: int) -> Optional[Tuple[Optional[str], Tuple[Message, ...]]]:
+    """Предыдущее резюме и сообщения для сворачивания (все, кроме keep_recent последних)."""
+    return _session_store.get_compaction_batch(user_id, keep_recent)
+
+
+def apply_history_summary(user_id: int, text: str, folded: Tuple[Message, ...]) -> bool:
+    """Замена свернутых сообщений резюме; False, если история успела измениться."""
+    return _session_store.apply_summary(user_id, text, folded)
+
+
+def cleanup_old_sessions(ttl_hours: float = 24) -> int:
     """Очистка неактивных сессий."""
-    cutoff_time = datetime.now() - timedelta(hours=ttl_hours)
-    old_sessions = []
-    
-    for user_id, session in user_sessions.items():
-        if session["last_activity"] < cutoff_time:
-            old_sessions.append(user_id)
-    
-    for user_id in old_sessions:
-        del user_sessions[user_id]
-        logger.info(f"Cleaned up old session for user {user_id}")
-    
-    logger.info(f"Cleanup completed: removed {len(old_sessions)} sessions, {len(user_sessions)} active")
-    return len(old_sessions)
-
-
-async def start_cleanup_task(cleanup_interval_hours: int = 6, ttl_hours: int = 24):
-    """Запуск фоновой задачи очистки."""
-    logger.info(f"Starting cleanup task: every {cleanup_interval_hours}h, TTL {ttl_hours}h")
-    
+    removed = _session_store.cleanup(ttl_hours)
+    logger.info(f"Cleanup completed: removed {removed} sessions, {len(user_sessions)} active")
+    return removed
+
+
+def expire_sessions(ttl_hours: float = 24, limit: int = 500) -> int:
+    """Удаление не более limit истекших сессий за один шаг."""
+    return _session_store.expire(ttl_hours, limit)
+
+
+async def start_cleanup_task(
+    cleanup_interval_hours: float = 6,
+    ttl_hours: float = 24,
+    expiry_interval_seconds: float = 60,
+    expiry_batch_size: int = 500
+):
+    """Запуск фоновой задачи очистки.
+
+    Истекшие сессии удаляются каждые expiry_interval_seconds порциями по
+    expiry_batch_size с возвратом управления event loop между порциями;
+    сессии, выгруженные из памяти на диск, чистятся тем же таймером.
+    Раз в cleanup_interval_hours индексы истечения и активности перестраиваются,
+    чтобы учесть изменения last_activity в обход API хранилища.
+    """
+    logger.info(
+        f"Starting cleanup task: expiry every {expiry_interval_seconds}s "
+        f"(batch {expiry_batch_size}), index rebuild every {cleanup_interval_hours}h, TTL {ttl_hours}h"
+    )
+    loop = asyncio.get_running_loop()
+    next_rebuild = loop.time() + cleanup_interval_hours * 3600
+
     while True:
         try:
-            await asyncio.sleep(cleanup_interval_hours * 3600)  # часы в секунды
-            cleanup_old_sessions(ttl_hours)
+            await asyncio.sleep(expiry_interval_seconds)
+            if loop.time() >= next_rebuild:
+                _session_store.rebuild_indexes()
+                next_rebuild = loop.time() + cleanup_interval_hours * 3600
+
+            removed = 0
+            while _session_store.has_expired(ttl_hours):
+                removed += _session_store.expire(ttl_hours, expiry_batch_size)
+                await asyncio.sleep(0)  # Отдаем управление между порциями
+            # Выгруженные сессии чистятся один раз за проход, а не в каждой порции
+            removed += _session_store.purge_offloaded(ttl_hours)
+            if removed:
+                logger.info(f"Expired {removed} sessions, {len(user_sessions)} active")
         except Exception as e:
             logger.error(f"Cleanup task error: {e}")
 
 
 def clear_user_history(user_id: int) -> None:
     """Очистка истории диалога пользователя."""
-    if user_id in user_sessions:
-        user_sessions[user_id]["history"] = []
-        user_sessions[user_id]["last_activity"] = datetime.now()
-        logger.info(f"Cleared history for user {user_id}")
-    else:
-        logger.warning(f"Session not found for user {user_id} during clear")
+    _session_store.clear_history(user_id)
 
 
-def get_session_stats() -> Dict[str, int]:
+def get_session_stats() -> Dict[str, float]:
     """Статистика сессий для мониторинга."""
     return {
-        "total_sessions": len(user_sessions),
-        "active_users": len([s for s in user_sessions.values() 
-                           if s["last_activity"] > datetime.now() - timedelta(hours=1)])
+        "total_sessions": _session_store.session_count(),
+        "active_users": _session_store.active_users(60),
+        "active_users_5m": _session_store.active_users(5),
+        "active_users_24h": _session_store.active_users(24 * 60),
+        **_session_store.memory_stats()
     }
@@ -0,0 +1,21 @@
+"""Локальная оценка количества токенов без обращения к API."""
+
+# Служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Средний размер токена в байтах UTF-8. Для латиницы токен ~4 символа,
+# для кириллицы ~2.5-3 символа по 2 байта, поэтому оценка по байтам
+# получается с запасом - бюджет контекста не будет превышен.
+BYTES_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка количества токенов в тексте."""
+    if not text:
+        return 0
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+
+def estimate_message_tokens(content: str) -> int:
+    """Оценка количества токенов сообщения чата с учетом служебных токенов."""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
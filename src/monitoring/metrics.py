@@ -2,7 +2,7 @@
 import logging
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from collections import defaultdict
 
@@ -40,8 +40,56 @@ class MetricsCollector:
             'llm_success_rate': 0.0,
             'avg_response_time': 0.0,
             'total_tokens': 0,
-            'errors_count': 0
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'cached_tokens': 0,
+            'generation_time': 0.0,
+            'tokens_by_model': {},
+            'tokens_by_user': {},
+            'errors_count': 0,
+            'summary_hits': 0,
+            'summary_misses': 0,
+            'summary_tokens_saved': 0,
+            'summary_compactions': 0,
+            'cache_hits': 0,
+            'cache_stale_hits': 0,
+            'cache_misses': 0,
+            'cache_latency_saved': 0.0,
+            'cache_warm_hits': 0,
+            'first_turn_requests': 0,
+            'warmup_runs': 0,
+            'warmup_entries': 0,
+            'warmup_duration': 0.0,
+            'stream_requests': 0,
+            'ttft_total': 0.0,
+            'ttlt_total': 0.0,
+            'hedge_requests': 0,
+            'hedges_fired': 0,
+            'hedge_wins': {},
+            'hedge_tail_improvement': 0.0,
+            'circuit_opens': 0,
+            'circuit_closes': 0,
+            'circuit_rejections': 0,
+            'llm_calls': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'llm_latency_total': 0.0,
+            'llm_timeout_total': 0.0,
+            'llm_timeouts': 0,
+            'llm_timeout_by_model': {},
+            'deadline_exceeded': 0,
+            'retries': 0,
+            'retries_denied': 0,
+            'rate_limit_pauses': 0,
+            'concurrency_limit': 0,
+            'concurrency_limit_min': 0,
+            'concurrency_limit_max': 0,
+            'coalesced_requests': 0,
+            'route_counts': {},
+            'http_pools': {}
         })
+        self.circuit_states: Dict[str, str] = {}  # Последнее состояние предохранителя по моделям
+        self.model_scores: Dict[str, float] = {}  # Последняя оценка маршрутизатора по моделям
         self._cleanup_threshold_hours = 24  # Очистка метрик старше 24 часов
     
     def record_message(self, user_id: int, message_length: int, processed: bool = True) -> None:
@@ -84,6 +132,328 @@ class MetricsCollector:
         
         logger.debug(f"LLM metric recorded: success={success}, model={model}, response_time={response_time:.2f}s")
     
+    def record_token_usage(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        duration: float,
+        user_id: Optional[int] = None
+    ) -> None:
+        """Запись токенов запроса к LLM по данным usage из ответа API.
+
+        duration - время запроса, по нему считается скорость генерации.
+        Токены суммируются за час, по модели и по пользователю (если известен).
+        """
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        targets = [stats, self._usage_stats(stats['tokens_by_model'], model)]
+        if user_id is not None:
+            targets.append(self._usage_stats(stats['tokens_by_user'], user_id))
+        for target in targets:
+            target['prompt_tokens'] += prompt_tokens
+            target['completion_tokens'] += completion_tokens
+            target['cached_tokens'] += cached_tokens
+            target['generation_time'] += duration
+        stats['total_tokens'] += prompt_tokens + completion_tokens
+        
+        logger.debug(
+            f"Token usage recorded: model={model}, user={user_id}, prompt={prompt_tokens}, "
+            f"completion={completion_tokens}, cached={cached_tokens}, duration={duration:.2f}s"
+        )
+    
+    def get_tokens_per_second(self) -> float:
+        """Скорость генерации за текущий час: токенов ответа в секунду запроса."""
+        stats = self.get_current_hour_stats()
+        return stats['completion_tokens'] / stats['generation_time'] if stats['generation_time'] else 0.0
+    
+    def get_token_usage_by_model(self) -> Dict[str, Dict[str, float]]:
+        """Токены и скорость генерации по моделям за текущий час."""
+        return self._usage_summary(self.get_current_hour_stats()['tokens_by_model'])
+    
+    def get_top_token_users(self, limit: int = 5) -> Dict[int, Dict[str, float]]:
+        """Пользователи, потратившие больше всего токенов за текущий час."""
+        by_user = self.get_current_hour_stats()['tokens_by_user']
+        top = sorted(
+            by_user.items(), key=lambda item: item[1]['prompt_tokens'] + item[1]['completion_tokens'], reverse=True
+        )[:limit]
+        return self._usage_summary(dict(top))
+    
+    @staticmethod
+    def _usage_stats(groups: Dict[Any, Dict[str, Any]], key: Any) -> Dict[str, Any]:
+        usage = groups.get(key)
+        if usage is None:
+            usage = groups[key] = {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'generation_time': 0.0
+            }
+        usage['requests'] += 1
+        return usage
+    
+    @staticmethod
+    def _usage_summary(groups: Dict[Any, Dict[str, Any]]) -> Dict[Any, Dict[str, float]]:
+        return {
+            key: {
+                'requests': usage['requests'],
+                'prompt_tokens': usage['prompt_tokens'],
+                'completion_tokens': usage['completion_tokens'],
+                'cached_tokens': usage['cached_tokens'],
+                'total_tokens': usage['prompt_tokens'] + usage['completion_tokens'],
+                'tokens_per_second': round(usage['completion_tokens'] / usage['generation_time'], 1)
+                if usage['generation_time'] else 0.0,
+                'generation_time': round(usage['generation_time'], 2)
+            }
+            for key, usage in groups.items()
+        }
+    
+    def record_summary_usage(self, hit: bool, tokens_saved: int = 0) -> None:
+        """Запись использования резюме диалога при формировании контекста.
+
+        hit - в контекст ушло резюме вместо свернутых сообщений,
+        промах - история длиннее порога, но резюме еще не готово.
+        """
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        if hit:
+            stats['summary_hits'] += 1
+            stats['summary_tokens_saved'] += tokens_saved
+        else:
+            stats['summary_misses'] += 1
+        
+        logger.debug(f"Summary usage recorded: hit={hit}, tokens_saved={tokens_saved}")
+    
+    def record_summary_compaction(self, folded_messages: int) -> None:
+        """Запись сворачивания части истории в резюме."""
+        self.hourly_stats[self._get_hour_key(time.time())]['summary_compactions'] += 1
+        logger.debug(f"Summary compaction recorded: folded_messages={folded_messages}")
+    
+    def record_response_cache(
+        self, hit: bool, latency_saved: float = 0.0, stale: bool = False, warm: bool = False
+    ) -> None:
+        """Запись обращения к кэшу ответов LLM.
+
+        latency_saved - время исходного запроса к LLM, которое сэкономил ответ из кэша;
+        warm - ответ взят из записи, созданной прогревом кэша.
+        """
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        if hit:
+            stats['cache_hits'] += 1
+            stats['cache_latency_saved'] += latency_saved
+            if stale:
+                stats['cache_stale_hits'] += 1
+            if warm:
+                stats['cache_warm_hits'] += 1
+        else:
+            stats['cache_misses'] += 1
+        
+        logger.debug(
+            f"Response cache metric recorded: hit={hit}, stale={stale}, warm={warm}, latency_saved={latency_saved:.2f}s"
+        )
+    
+    def record_stream_timing(self, model: str, ttft: float, ttlt: float) -> None:
+        """Запись потокового ответа: время до первого и до последнего токена."""
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['stream_requests'] += 1
+        stats['ttft_total'] += ttft
+        stats['ttlt_total'] += ttlt
+        
+        logger.debug(f"Stream timing recorded: model={model}, ttft={ttft:.2f}s, ttlt={ttlt:.2f}s")
+    
+    def get_stream_latency(self) -> Tuple[float, float]:
+        """Среднее время до первого и до последнего токена за текущий час."""
+        stats = self.get_current_hour_stats()
+        streams = stats['stream_requests']
+        if not streams:
+            return 0.0, 0.0
+        return stats['ttft_total'] / streams, stats['ttlt_total'] / streams
+    
+    def record_hedge(self, fired: bool, winner: str, tail_improvement: float) -> None:
+        """Запись хеджированного запроса.
+
+        fired - был ли отправлен запрос к резервной модели, winner - модель,
+        чей ответ использован, tail_improvement - снижение p95 за счет хеджа.
+        """
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['hedge_requests'] += 1
+        if fired:
+            stats['hedges_fired'] += 1
+        stats['hedge_wins'][winner] = stats['hedge_wins'].get(winner, 0) + 1
+        stats['hedge_tail_improvement'] = tail_improvement
+        
+        logger.debug(f"Hedge recorded: fired={fired}, winner={winner}, tail_improvement={tail_improvement:.2f}s")
+    
+    def get_hedge_rate(self) -> float:
+        """Доля запросов за текущий час, для которых сработал хедж."""
+        stats = self.get_current_hour_stats()
+        return stats['hedges_fired'] / stats['hedge_requests'] if stats['hedge_requests'] else 0.0
+    
+    def get_hedge_win_rates(self) -> Dict[str, float]:
+        """Доля побед каждой модели в хеджированных запросах за текущий час."""
+        stats = self.get_current_hour_stats()
+        total = stats['hedge_requests']
+        return {model: wins / total for model, wins in stats['hedge_wins'].items()} if total else {}
+    
+    def record_circuit_transition(self, model: str, state: str) -> None:
+        """Запись смены состояния предохранителя модели."""
+        self.circuit_states[model] = state
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        if state == "open":
+            stats['circuit_opens'] += 1
+        elif state == "closed":
+            stats['circuit_closes'] += 1
+        
+        logger.debug(f"Circuit transition recorded: model={model}, state={state}")
+    
+    def record_circuit_rejection(self, model: str) -> None:
+        """Запись запроса, не отправленного из-за разомкнутого предохранителя."""
+        self.hourly_stats[self._get_hour_key(time.time())]['circuit_rejections'] += 1
+    
+    def record_llm_call(self, model: str, queue_wait: float, latency: float, timeout: float = 0.0) -> None:
+        """Запись вызова LLM: ожидание в очереди лимитера отдельно от самого запроса.
+
+        timeout - таймаут, с которым запрос был отправлен.
+        """
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['llm_calls'] += 1
+        stats['queue_wait_total'] += queue_wait
+        stats['queue_wait_max'] = max(stats['queue_wait_max'], queue_wait)
+        stats['llm_latency_total'] += latency
+        stats['llm_timeout_total'] += timeout
+        if timeout:
+            stats['llm_timeout_by_model'][model] = timeout
+        
+        logger.debug(
+            f"LLM call recorded: model={model}, queue_wait={queue_wait:.2f}s, latency={latency:.2f}s, "
+            f"timeout={timeout:.1f}s"
+        )
+    
+    def record_llm_timeout(self, model: str) -> None:
+        """Запись запроса к LLM, оборванного по таймауту."""
+        self.hourly_stats[self._get_hour_key(time.time())]['llm_timeouts'] += 1
+        logger.debug(f"LLM timeout recorded: model={model}")
+    
+    def record_deadline_exceeded(self) -> None:
+        """Запись апдейта, для которого LLM не успела ответить до дедлайна."""
+        self.hourly_stats[self._get_hour_key(time.time())]['deadline_exceeded'] += 1
+        logger.debug("Deadline exhaustion recorded")
+    
+    def record_retry(self, allowed: bool) -> None:
+        """Запись повтора запроса к LLM; allowed=False - повтор не пропущен бюджетом."""
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['retries' if allowed else 'retries_denied'] += 1
+    
+    def get_avg_llm_timeout(self) -> float:
+        """Средний таймаут вызовов LLM за текущий час."""
+        stats = self.get_current_hour_stats()
+        return stats['llm_timeout_total'] / stats['llm_calls'] if stats['llm_calls'] else 0.0
+    
+    def record_rate_limit_pause(self, model: str, seconds: float) -> None:
+        """Запись паузы модели по Retry-After или сбросу лимита."""
+        self.hourly_stats[self._get_hour_key(time.time())]['rate_limit_pauses'] += 1
+        logger.debug(f"Rate limit pause recorded: model={model}, seconds={seconds:.1f}")
+    
+    def get_queue_wait_stats(self) -> Tuple[float, float]:
+        """Среднее ожидание в очереди и среднее время запроса к LLM за текущий час."""
+        stats = self.get_current_hour_stats()
+        calls = stats['llm_calls']
+        if not calls:
+            return 0.0, 0.0
+        return stats['queue_wait_total'] / calls, stats['llm_latency_total'] / calls
+    
+    def record_concurrency_limit(self, limit: int) -> None:
+        """Запись текущего лимита одновременных запросов к LLM (gauge) и его диапазона за час."""
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['concurrency_limit'] = limit
+        stats['concurrency_limit_min'] = min(stats['concurrency_limit_min'] or limit, limit)
+        stats['concurrency_limit_max'] = max(stats['concurrency_limit_max'], limit)
+        
+        logger.debug(f"Concurrency limit recorded: {limit}")
+    
+    def record_coalesced_request(self) -> None:
+        """Запись запроса, дождавшегося уже идущего одинакового запроса к LLM."""
+        self.hourly_stats[self._get_hour_key(time.time())]['coalesced_requests'] += 1
+    
+    def record_route(self, model: str) -> None:
+        """Запись выбора модели маршрутизатором."""
+        route_counts = self.hourly_stats[self._get_hour_key(time.time())]['route_counts']
+        route_counts[model] = route_counts.get(model, 0) + 1
+    
+    def record_model_score(self, model: str, score: float) -> None:
+        """Запись текущей оценки модели маршрутизатором (gauge)."""
+        self.model_scores[model] = score
+        logger.debug(f"Model score recorded: model={model}, score={score:.2f}")
+    
+    def get_route_shares(self) -> Dict[str, float]:
+        """Доля запросов, направленных на каждую модель за текущий час."""
+        route_counts = self.get_current_hour_stats()['route_counts']
+        total = sum(route_counts.values())
+        if not total:
+            return {}
+        return {model: count / total for model, count in route_counts.items()}
+    
+    def record_http_request(self, pool: str, reused: bool) -> None:
+        """Запись HTTP-запроса пула: reused - через уже открытое соединение."""
+        pool_stats = self._http_pool_stats(pool)
+        pool_stats['requests'] += 1
+        if reused:
+            pool_stats['reused'] += 1
+    
+    def record_http_connection(self, pool: str, connect_time: float) -> None:
+        """Запись нового соединения пула и времени его установки (TCP + TLS)."""
+        pool_stats = self._http_pool_stats(pool)
+        pool_stats['connections'] += 1
+        pool_stats['connect_time_total'] += connect_time
+        pool_stats['connect_time_max'] = max(pool_stats['connect_time_max'], connect_time)
+        
+        logger.debug(f"HTTP connection recorded: pool={pool}, connect_time={connect_time:.3f}s")
+    
+    def get_http_pool_stats(self) -> Dict[str, Dict[str, float]]:
+        """Доля запросов через открытые соединения и время установки соединений по пулам."""
+        result = {}
+        for pool, pool_stats in self.get_current_hour_stats()['http_pools'].items():
+            requests = pool_stats['requests']
+            connections = pool_stats['connections']
+            result[pool] = {
+                'requests': requests,
+                'connections': connections,
+                'reuse_ratio': round(pool_stats['reused'] / requests, 3) if requests else 0.0,
+                'avg_connect_time': round(pool_stats['connect_time_total'] / connections, 3) if connections else 0.0,
+                'max_connect_time': round(pool_stats['connect_time_max'], 3)
+            }
+        return result
+    
+    def _http_pool_stats(self, pool: str) -> Dict[str, Any]:
+        pools = self.hourly_stats[self._get_hour_key(time.time())]['http_pools']
+        pool_stats = pools.get(pool)
+        if pool_stats is None:
+            pool_stats = pools[pool] = {
+                'requests': 0, 'reused': 0, 'connections': 0, 'connect_time_total': 0.0, 'connect_time_max': 0.0
+            }
+        return pool_stats
+    
+    def record_first_turn(self) -> None:
+        """Запись первого сообщения диалога после /start (выбора уровня)."""
+        self.hourly_stats[self._get_hour_key(time.time())]['first_turn_requests'] += 1
+    
+    def record_cache_warmup(self, duration: float, entries: int) -> None:
+        """Запись прогона прогрева кэша: длительность и число записанных ключей."""
+        stats = self.hourly_stats[self._get_hour_key(time.time())]
+        stats['warmup_runs'] += 1
+        stats['warmup_entries'] += entries
+        stats['warmup_duration'] = duration
+        
+        logger.debug(f"Cache warm-up metric recorded: duration={duration:.2f}s, entries={entries}")
+    
+    def get_warm_first_turn_ratio(self) -> float:
+        """Доля первых сообщений за текущий час, обслуженных из прогретых записей."""
+        stats = self.get_current_hour_stats()
+        first_turns = stats['first_turn_requests']
+        return min(stats['cache_warm_hits'] / first_turns, 1.0) if first_turns else 0.0
+    
+    def get_cache_hit_ratio(self) -> float:
+        """Доля ответов из кэша за текущий час."""
+        stats = self.get_current_hour_stats()
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        return stats['cache_hits'] / lookups if lookups else 0.0
+    
     def get_hourly_stats(self) -> Dict[str, Dict[str, Any]]:
         """Получение почасовой статистики."""
         self._cleanup_old_metrics()
@@ -104,6 +474,97 @@ class MetricsCollector:
         logger.info(f"Успешность LLM: {current_stats['llm_success_rate']:.1%}")
         logger.info(f"Среднее время ответа: {current_stats['avg_response_time']:.2f}s")
         logger.info(f"Ошибок: {current_stats['errors_count']}")
+        if current_stats['total_tokens']:
+            logger.info(
+                f"Токены: всего {current_stats['total_tokens']} (запрос {current_stats['prompt_tokens']}, "
+                f"из них из кэша {current_stats['cached_tokens']}; ответ {current_stats['completion_tokens']}), "
+                f"генерация {self.get_tokens_per_second():.1f} ток/с"
+            )
+            for model, usage in self.get_token_usage_by_model().items():
+                logger.info(
+                    f"Токены модели {model}: {usage['total_tokens']} за {usage['requests']} запросов, "
+                    f"{usage['tokens_per_second']:.1f} ток/с"
+                )
+            top_users = ", ".join(
+                f"{user_id}: {usage['total_tokens']}" for user_id, usage in self.get_top_token_users().items()
+            )
+            if top_users:
+                logger.info(f"Больше всего токенов: {top_users}")
+        logger.info(
+            f"Резюме диалога: попаданий {current_stats['summary_hits']}, "
+            f"промахов {current_stats['summary_misses']}, "
+            f"сэкономлено токенов {current_stats['summary_tokens_saved']}, "
+            f"сворачиваний {current_stats['summary_compactions']}"
+        )
+        logger.info(
+            f"Кэш ответов: попаданий {current_stats['cache_hits']} "
+            f"(устаревших {current_stats['cache_stale_hits']}), промахов {current_stats['cache_misses']}, "
+            f"доля {self.get_cache_hit_ratio():.1%}, сэкономлено {current_stats['cache_latency_saved']:.1f}s"
+        )
+        avg_wait, avg_latency = self.get_queue_wait_stats()
+        logger.info(
+            f"Вызовы LLM: {current_stats['llm_calls']}, ожидание в очереди в среднем {avg_wait:.2f}s "
+            f"(макс. {current_stats['queue_wait_max']:.2f}s), запрос {avg_latency:.2f}s, "
+            f"пауз по 429: {current_stats['rate_limit_pauses']}, "
+            f"склеено одинаковых запросов: {current_stats['coalesced_requests']}"
+        )
+        route_shares = self.get_route_shares()
+        if route_shares:
+            routes = ", ".join(
+                f"{model} {share:.1%} (оценка {self.model_scores.get(model, 0.0):.1f})"
+                for model, share in route_shares.items()
+            )
+            logger.info(f"Маршрутизация моделей: {routes}")
+        if current_stats['llm_timeout_by_model']:
+            timeouts = ", ".join(
+                f"{model} {timeout:.1f}s" for model, timeout in current_stats['llm_timeout_by_model'].items()
+            )
+            logger.info(
+                f"Таймауты LLM: в среднем {self.get_avg_llm_timeout():.1f}s, "
+                f"оборвано запросов {current_stats['llm_timeouts']}, текущие: {timeouts}"
+            )
+        if current_stats['retries'] or current_stats['retries_denied']:
+            logger.info(
+                f"Повторы запросов: {current_stats['retries']}, "
+                f"отклонено бюджетом повторов: {current_stats['retries_denied']}"
+            )
+        if current_stats['deadline_exceeded']:
+            logger.info(f"Ответов не успели к дедлайну: {current_stats['deadline_exceeded']}")
+        for pool, pool_stats in self.get_http_pool_stats().items():
+            logger.info(
+                f"HTTP {pool}: запросов {pool_stats['requests']}, новых соединений {pool_stats['connections']}, "
+                f"повторное использование {pool_stats['reuse_ratio']:.1%}, "
+                f"установка соединения в среднем {pool_stats['avg_connect_time']:.3f}s"
+            )
+        if current_stats['concurrency_limit']:
+            logger.info(
+                f"Лимит параллельных запросов: {current_stats['concurrency_limit']} "
+                f"(за час {current_stats['concurrency_limit_min']}-{current_stats['concurrency_limit_max']})"
+            )
+        avg_ttft, avg_ttlt = self.get_stream_latency()
+        logger.info(
+            f"Потоковые ответы: {current_stats['stream_requests']}, "
+            f"первый токен в среднем {avg_ttft:.2f}s, последний {avg_ttlt:.2f}s"
+        )
+        if current_stats['hedge_requests']:
+            win_rates = ", ".join(f"{model} {rate:.0%}" for model, rate in self.get_hedge_win_rates().items())
+            logger.info(
+                f"Хеджирование: запросов {current_stats['hedge_requests']}, "
+                f"хедж в {self.get_hedge_rate():.1%}, победы: {win_rates}, "
+                f"снижение p95 {current_stats['hedge_tail_improvement']:.2f}s"
+            )
+        if current_stats['circuit_opens'] or current_stats['circuit_rejections'] or self.circuit_states:
+            states = ", ".join(f"{model} {state}" for model, state in self.circuit_states.items())
+            logger.info(
+                f"Предохранители: размыканий {current_stats['circuit_opens']}, "
+                f"замыканий {current_stats['circuit_closes']}, "
+                f"отклонено запросов {current_stats['circuit_rejections']}; {states}"
+            )
+        logger.info(
+            f"Прогрев кэша: прогонов {current_stats['warmup_runs']}, "
+            f"последний {current_stats['warmup_duration']:.1f}s, "
+            f"первых сообщений из прогретых записей {self.get_warm_first_turn_ratio():.1%}"
+        )
         logger.info(f"==========================")
     
     def _get_hour_key(self, timestamp: float) -> str:
@@ -139,11 +600,10 @@ class MetricsCollector:
         self.llm_metrics = [m for m in self.llm_metrics if m.timestamp > cutoff_time]
         
         # Очистка почасовой статистики
+        # (на месте, чтобы hourly_stats оставался defaultdict)
         cutoff_hour = self._get_hour_key(cutoff_time)
-        self.hourly_stats = {
-            hour: stats for hour, stats in self.hourly_stats.items() 
-            if hour >= cutoff_hour
-        }
+        for hour in [hour for hour in self.hourly_stats if hour < cutoff_hour]:
+            del self.hourly_stats[hour]
         
         logger.debug(f"Cleaned up metrics older than {self._cleanup_threshold_hours} hours")
 
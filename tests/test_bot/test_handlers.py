@@ -2,7 +2,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from aiogram.types import Message, User, Chat
-from src.bot.handlers import init_llm, handle_start, handle_help, handle_message
+from src.bot.handlers import init_llm, handle_start, handle_help, handle_message, is_first_turn, welcome_text
 
 
 class TestInitLLM:
@@ -80,7 +80,8 @@ class TestHandleStart:
         
         with patch('src.bot.handlers.get_user_session') as mock_get_session, \
              patch('src.bot.handlers.add_message') as mock_add_message, \
-             patch('src.bot.handlers.config') as mock_config:
+             patch('src.bot.handlers.config') as mock_config, \
+             patch.object(Message, 'answer', new_callable=AsyncMock) as mock_answer:
             
             mock_config.max_history_size = 10
             mock_session = {"user_id": 123, "user_name": "TestUser"}
@@ -94,8 +95,10 @@ class TestHandleStart:
             # Проверяем что сообщения были добавлены в историю
             assert mock_add_message.call_count == 2
             mock_add_message.assert_any_call(123, "user", "/start", 10)
-            mock_add_message.assert_any_call(123, "assistant", 
-                "Добро пожаловать, TestUser! 👋", 10)
+            sent_text = mock_answer.await_args.args[0]
+            assert sent_text.startswith("Добро пожаловать, TestUser! 👋")
+            # В историю сохраняется ровно тот текст, который получил пользователь
+            mock_add_message.assert_any_call(123, "assistant", sent_text, 10)
     
     @pytest.mark.asyncio
     async def test_handle_start_without_first_name(self):
@@ -116,6 +119,17 @@ class TestHandleStart:
             mock_get_session.assert_called_once_with(123, "друг")
 
 
+def test_first_turn_detected_with_personal_welcome():
+    """Первый ход узнается по сохраненному приветствию с любым именем."""
+    history = (
+        {"role": "user", "content": "/start"},
+        {"role": "assistant", "content": welcome_text("Анна")},
+    )
+    assert is_first_turn(history)
+    assert not is_first_turn(history + ({"role": "user", "content": "3"},))
+    assert not is_first_turn(({"role": "user", "content": "/start"}, {"role": "assistant", "content": "Привет"}))
+
+
 class TestHandleHelp:
     """Тесты обработчика команды /help."""
     
@@ -140,7 +154,8 @@ class TestHandleHelp:
         
         with patch('src.bot.handlers.get_user_session') as mock_get_session, \
              patch('src.bot.handlers.add_message') as mock_add_message, \
-             patch('src.bot.handlers.config') as mock_config:
+             patch('src.bot.handlers.config') as mock_config, \
+             patch.object(Message, 'answer', new_callable=AsyncMock) as mock_answer:
             
             mock_config.max_history_size = 10
             mock_session = {"user_id": 123, "user_name": "TestUser"}
@@ -212,6 +227,28 @@ class TestHandleMessage:
             # Проверяем что метрика была записана
             mock_metrics.record_message.assert_called_once_with(123, 1001, False)
     
+    @pytest.mark.asyncio
+    async def test_merged_messages_too_long(self):
+        """Склеенная серия сообщений проверяется на лимит длины."""
+        message = self.create_mock_message("x" * 600)
+        
+        mock_config = MagicMock()
+        mock_config.max_message_length = 1000
+        
+        with patch('src.bot.handlers.llm_client', MagicMock()), \
+             patch('src.bot.handlers.system_prompt', "Test prompt"), \
+             patch('src.bot.handlers.config', mock_config), \
+             patch('src.bot.handlers.user_mailbox.collect', AsyncMock(return_value="x" * 1201)), \
+             patch('src.bot.handlers.generate_response_with_history') as mock_generate, \
+             patch('src.bot.handlers.metrics_collector') as mock_metrics, \
+             patch.object(Message, 'answer', new_callable=AsyncMock) as mock_answer:
+            
+            await handle_message(message)
+            
+            mock_answer.assert_awaited_once_with("Сообщения слишком длинные. Максимум 1000 символов.")
+            mock_metrics.record_message.assert_called_once_with(123, 1201, processed=False)
+            mock_generate.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_handle_message_success(self):
         """Тест успешной обработки сообщения."""
@@ -0,0 +1,76 @@
+"""Тесты последовательной обработки сообщений пользователя."""
+import asyncio
+
+from bot.mailbox import UserMailbox
+
+
+async def test_same_user_processed_in_order():
+    """Сообщения одного пользователя не обрабатываются одновременно."""
+    mailbox = UserMailbox()
+    events = []
+
+    async def handle(name):
+        async with mailbox.lock(123):
+            events.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {name}")
+
+    await asyncio.gather(handle("a"), handle("b"), handle("c"))
+
+    assert events == ["start a", "end a", "start b", "end b", "start c", "end c"]
+
+
+async def test_different_users_run_concurrently():
+    """Разные пользователи не ждут друг друга."""
+    mailbox = UserMailbox()
+    inside = []
+
+    async def handle(user_id):
+        async with mailbox.lock(user_id):
+            inside.append(user_id)
+            await asyncio.sleep(0.01)
+            assert len(inside) == 2
+
+    await asyncio.gather(handle(1), handle(2))
+
+
+async def test_lock_released_and_removed():
+    """Запись пользователя удаляется, когда у него не остается задач, в том числе после ошибки."""
+    mailbox = UserMailbox()
+
+    async with mailbox.lock(123):
+        assert len(mailbox) == 1
+    assert len(mailbox) == 0
+
+    try:
+        async with mailbox.lock(123):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert len(mailbox) == 0
+
+
+async def test_collect_without_debounce_passes_through():
+    """Без окна склейки текст возвращается как есть."""
+    assert await UserMailbox().collect(123, "Анализ") == "Анализ"
+
+
+async def test_burst_merged_into_first_message():
+    """Серия сообщений в пределах окна склеивается в одно."""
+    mailbox = UserMailbox(debounce_ms=30)
+
+    async def send(text, delay):
+        await asyncio.sleep(delay)
+        return await mailbox.collect(123, text)
+
+    results = await asyncio.gather(send("Уровень Анализ", 0), send("для сварщиков", 0.005), send("5 целей", 0.01))
+
+    assert results == ["Уровень Анализ\nдля сварщиков\n5 целей", None, None]
+
+
+async def test_message_after_window_starts_new_burst():
+    """Сообщение после закрытия окна открывает новую пачку."""
+    mailbox = UserMailbox(debounce_ms=10)
+
+    assert await mailbox.collect(123, "первое") == "первое"
+    assert await mailbox.collect(123, "второе") == "второе"
@@ -248,3 +248,26 @@ class TestMetricsMiddleware:
                 response_time=2.5,
                 error_type=""
             )
+
+
+class TestDeadlineMiddleware:
+    """Тесты middleware дедлайна."""
+    
+    @pytest.mark.asyncio
+    async def test_deadline_visible_in_handler_and_exhaustion_counted(self):
+        """Обработчик видит дедлайн; исчерпание записывается в метрики один раз."""
+        from bot.middleware import DeadlineMiddleware
+        from llm.deadline import current_deadline
+        
+        async def handler(event, data):
+            deadline = current_deadline()
+            assert 0 < deadline.remaining() <= 30
+            deadline.exceeded = True
+            return "done"
+        
+        with patch('bot.middleware.metrics_collector') as metrics:
+            result = await DeadlineMiddleware(30)(handler, MagicMock(), {})
+        
+        assert result == "done"
+        assert current_deadline() is None
+        metrics.record_deadline_exceeded.assert_called_once()
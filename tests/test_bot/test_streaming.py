@@ -0,0 +1,147 @@
+"""Тесты постепенного вывода потокового ответа."""
+from unittest.mock import AsyncMock, MagicMock
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+from bot.streaming import TELEGRAM_MAX_MESSAGE_CHARS, StreamingReply
+
+
+class FakeClock:
+    """Управляемые часы для проверки интервала правок."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_reply(interval=1.0):
+    message = MagicMock()
+    sent = MagicMock()
+    sent.edit_text = AsyncMock()
+    message.answer = AsyncMock(return_value=sent)
+    clock = FakeClock()
+
+    async def sleep(seconds):
+        clock.now += seconds
+
+    return StreamingReply(message, interval, clock, sleep), message, sent, clock
+
+
+class TestStreamingReply:
+    """Тесты StreamingReply."""
+
+    async def test_first_fragment_sent_then_edited(self):
+        """Первый фрагмент отправляется сообщением, следующие - правками."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("Глаголы")
+        clock.now = 1.0
+        await reply.update("Глаголы: назвать")
+
+        message.answer.assert_awaited_once_with("Глаголы")
+        sent.edit_text.assert_awaited_once_with("Глаголы: назвать")
+        assert reply.started
+
+    async def test_edits_coalesced_within_interval(self):
+        """Фрагменты внутри интервала не редактируют сообщение, finish выводит итог."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("a")
+        for text in ("ab", "abc", "abcd"):
+            clock.now += 0.1
+            await reply.update(text)
+        sent.edit_text.assert_not_awaited()
+
+        await reply.finish("abcde")
+        sent.edit_text.assert_awaited_once_with("abcde")
+
+    async def test_finish_without_stream_sends_message(self):
+        """Ответ без потока (например, из кэша) отправляется одним сообщением."""
+        reply, message, sent, clock = make_reply()
+        await reply.finish("готовый ответ")
+
+        message.answer.assert_awaited_once_with("готовый ответ")
+        sent.edit_text.assert_not_awaited()
+
+    async def test_finish_skips_unchanged_text(self):
+        """Уже показанный итоговый текст не редактируется повторно."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("ответ")
+        await reply.finish("ответ")
+
+        sent.edit_text.assert_not_awaited()
+
+    async def test_long_answer_split(self):
+        """Текст длиннее лимита Telegram продолжается новыми сообщениями."""
+        reply, message, sent, clock = make_reply()
+        text = "x" * (TELEGRAM_MAX_MESSAGE_CHARS + 10)
+        await reply.update(text)
+        await reply.finish(text)
+
+        assert message.answer.await_args_list[0].args[0] == "x" * TELEGRAM_MAX_MESSAGE_CHARS
+        assert message.answer.await_args_list[1].args[0] == "x" * 10
+        sent.edit_text.assert_not_awaited()
+
+    async def test_retry_after_pauses_edits(self):
+        """После ограничения частоты правки откладываются на retry_after."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("a")
+        sent.edit_text.side_effect = TelegramRetryAfter(method=MagicMock(), message="Too Many Requests", retry_after=5)
+        clock.now = 1.0
+        await reply.update("ab")
+        sent.edit_text.side_effect = None
+
+        clock.now = 3.0
+        await reply.update("abc")
+        assert sent.edit_text.await_count == 1
+
+        clock.now = 6.5
+        await reply.update("abcd")
+        sent.edit_text.assert_awaited_with("abcd")
+
+    async def test_finish_waits_edit_interval(self):
+        """Окончательная правка не отправляется раньше разрешенного момента."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("a")
+        clock.now = 0.3
+
+        await reply.finish("ab")
+
+        sent.edit_text.assert_awaited_once_with("ab")
+        assert clock.now == 1.0
+
+    async def test_finish_retries_after_rate_limit(self):
+        """Окончательная правка повторяется после retry_after и сетевых ошибок."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("a")
+        sent.edit_text.side_effect = [
+            TelegramRetryAfter(method=MagicMock(), message="Too Many Requests", retry_after=5),
+            TelegramNetworkError(method=MagicMock(), message="Connection reset"),
+            None,
+        ]
+
+        await reply.finish("ab")
+
+        assert sent.edit_text.await_count == 3
+        assert clock.now >= 6.0
+        message.answer.assert_awaited_once_with("a")
+
+    async def test_finish_falls_back_to_new_message(self):
+        """Если сообщение нельзя отредактировать, итог уходит новым сообщением."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("a")
+        sent.edit_text.side_effect = TelegramBadRequest(method=MagicMock(), message="message to edit not found")
+
+        await reply.finish("ab")
+
+        message.answer.assert_awaited_with("ab")
+
+    async def test_fail_replaces_partial_answer(self):
+        """Ошибка посреди потока заменяет начатый ответ, а не приходит отдельно."""
+        reply, message, sent, clock = make_reply()
+        await reply.update("Глаголы")
+
+        await reply.fail("Сервис недоступен")
+
+        sent.edit_text.assert_awaited_once_with("Сервис недоступен")
+        message.answer.assert_awaited_once_with("Глаголы")
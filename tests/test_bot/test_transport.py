@@ -0,0 +1,65 @@
+"""Тесты HTTP-сессии Telegram."""
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from bot.transport import TunedAiohttpSession, _on_connection_create_end, _on_connection_create_start
+from monitoring.metrics import metrics_collector
+
+
+async def handle_ok(request):
+    return web.Response(text="ok")
+
+
+def pool_stats():
+    return metrics_collector.get_http_pool_stats().get("telegram", {"requests": 0, "connections": 0})
+
+
+class TestTunedAiohttpSession:
+    """Тесты TunedAiohttpSession."""
+
+    async def test_connector_settings(self):
+        session = TunedAiohttpSession(limit=7, keepalive_timeout=45)
+        try:
+            client_session = await session.create_session()
+            assert client_session.connector.limit == 7
+            assert client_session.connector._keepalive_timeout == 45
+            assert len(client_session.trace_configs) == 1
+
+            # Повторное получение сессии возвращает тот же пул
+            assert await session.create_session() is client_session
+        finally:
+            await session.close()
+        assert client_session.closed
+
+    async def test_connection_reuse_recorded(self):
+        """Первый запрос открывает соединение, второй использует его повторно."""
+        app = web.Application()
+        app.router.add_get('/', handle_ok)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        session = TunedAiohttpSession()
+        before = pool_stats()
+        try:
+            client_session = await session.create_session()
+            for _ in range(2):
+                async with client_session.get(f"http://127.0.0.1:{port}/") as response:
+                    await response.read()
+        finally:
+            await session.close()
+            await runner.cleanup()
+
+        after = pool_stats()
+        assert after["requests"] == before["requests"] + 2
+        assert after["connections"] == before["connections"] + 1
+
+    async def test_connect_time_recorded(self):
+        context = SimpleNamespace()
+        before = pool_stats()["connections"]
+        await _on_connection_create_start(None, context, None)
+        await _on_connection_create_end(None, context, None)
+        assert pool_stats()["connections"] == before + 1
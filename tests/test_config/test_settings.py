@@ -115,6 +115,17 @@ class TestConfigValidation:
         with pytest.raises(ValueError, match="MAX_MESSAGE_LENGTH должен быть > 0"):
             validate_config(config)
 
+    def test_invalid_session_backend_raises_error(self):
+        """Тест что неизвестный бэкенд сессий вызывает ошибку."""
+        config = Config(
+            telegram_bot_token="test_token",
+            openrouter_api_key="test_key",
+            session_backend="redis"
+        )
+
+        with pytest.raises(ValueError, match="SESSION_BACKEND должен быть memory или sqlite"):
+            validate_config(config)
+
 
 class TestLoadConfig:
     """Тесты загрузки конфигурации."""
@@ -161,3 +172,14 @@ class TestLoadConfig:
         assert config.temperature == 0.7
         assert config.max_tokens == 1500
         assert config.enable_metrics is True
+    
+    @patch.dict(os.environ, {
+        'TELEGRAM_BOT_TOKEN': 'env_test_token',
+        'OPENROUTER_API_KEY': 'env_test_key',
+        'MODEL_POOL': 'model/a:free, model/b:free,,'
+    })
+    def test_load_config_model_pool(self):
+        """Тест разбора пула моделей через запятую."""
+        config = load_config()
+        
+        assert config.model_pool == ["model/a:free", "model/b:free"]
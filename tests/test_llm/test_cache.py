@@ -0,0 +1,146 @@
+"""Тесты кэша ответов LLM."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from llm.cache import ResponseCache, normalize_text
+from llm.client import LLMError, generate_response_with_history
+from llm.deadline import current_deadline, deadline_scope
+from llm.usage import current_usage_owner, usage_owner
+from monitoring.metrics import metrics_collector
+
+HISTORY = ({"role": "user", "content": "/start"}, {"role": "assistant", "content": "Я - эксперт..."})
+
+
+class FakeClock:
+    """Управляемые часы для проверки TTL."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_key(user_message="Анализ", history=HISTORY, model="model"):
+    return ResponseCache.make_key(model, "system prompt", user_message, history)
+
+
+class TestResponseCache:
+    """Тесты LRU, TTL и лимита размера."""
+
+    def test_key_normalizes_user_text(self):
+        """Регистр и пробелы в тексте пользователя не влияют на ключ."""
+        assert normalize_text("  Анализ \n") == "анализ"
+        assert make_key("  АНАЛИЗ ") == make_key("анализ")
+
+    def test_key_depends_on_context(self):
+        """Модель и история входят в ключ."""
+        assert make_key(model="other") != make_key()
+        assert make_key(history=HISTORY[:1]) != make_key()
+        assert make_key(history=[dict(m) for m in HISTORY]) == make_key()
+
+    def test_ttl_expiry(self):
+        """Запись отдается до истечения TTL и удаляется после."""
+        clock = FakeClock()
+        cache = ResponseCache(ttl_seconds=10, clock=clock)
+        cache.put(make_key(), "ответ", cost=2.0)
+
+        clock.now = 9
+        entry, stale = cache.get(make_key())
+        assert (entry.value, entry.cost, stale) == ("ответ", 2.0, False)
+
+        clock.now = 10
+        assert cache.get(make_key()) == (None, False)
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованная запись."""
+        cache = ResponseCache(max_entries=2)
+        cache.put(make_key("1"), "один", 1.0)
+        cache.put(make_key("2"), "два", 1.0)
+        cache.get(make_key("1"))
+        cache.put(make_key("3"), "три", 1.0)
+
+        assert cache.get(make_key("2")) == (None, False)
+        assert cache.get(make_key("1"))[0].value == "один"
+
+    def test_entry_size_limit(self):
+        """Ответы длиннее лимита не кэшируются."""
+        cache = ResponseCache(max_entry_chars=5)
+
+        assert not cache.put(make_key(), "слишком длинный", 1.0)
+        assert len(cache) == 0
+
+    async def test_stale_while_revalidate(self):
+        """Устаревшая запись отдается, а обновление идет в фоне один раз."""
+        clock = FakeClock()
+        cache = ResponseCache(ttl_seconds=10, stale_seconds=5, clock=clock)
+        cache.put(make_key(), "старый", 1.0)
+        clock.now = 12
+
+        entry, stale = cache.get(make_key())
+        assert (entry.value, stale) == ("старый", True)
+
+        fetch = AsyncMock(return_value="новый")
+        cache.revalidate(make_key(), fetch)
+        cache.revalidate(make_key(), fetch)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        fetch.assert_awaited_once()
+        assert cache.get(make_key())[0].value == "новый"
+
+
+    async def test_revalidation_runs_in_fresh_context(self):
+        """Фоновое обновление не наследует дедлайн и владельца токенов апдейта."""
+        cache = ResponseCache()
+        seen = []
+
+        async def fetch():
+            seen.append((current_deadline(), current_usage_owner()))
+            return "новый"
+
+        with deadline_scope(5), usage_owner(42):
+            cache.revalidate(make_key(), fetch)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert seen == [(None, None)]
+
+
+class TestCachedGeneration:
+    """Тесты кэша в generate_response_with_history."""
+
+    async def call(self, cache, user_message="3"):
+        return await generate_response_with_history(
+            client=AsyncMock(),
+            system_prompt="system prompt",
+            user_message=user_message,
+            message_history=HISTORY,
+            primary_model="model",
+            fallback_model="fallback",
+            cache=cache
+        )
+
+    async def test_repeated_context_served_from_cache(self):
+        """Повторный запрос с тем же контекстом не обращается к LLM."""
+        cache = ResponseCache()
+        hits_before = metrics_collector.get_current_hour_stats()['cache_hits']
+        with patch('llm.client.send_request', AsyncMock(return_value="Глаголы уровня Применение")) as send:
+            assert await self.call(cache, "3") == "Глаголы уровня Применение"
+            assert await self.call(cache, " 3 ") == "Глаголы уровня Применение"
+
+        send.assert_awaited_once()
+        assert metrics_collector.get_current_hour_stats()['cache_hits'] == hits_before + 1
+
+    async def test_errors_not_cached(self):
+        """Ошибка LLM не попадает в кэш."""
+        cache = ResponseCache()
+        with patch('llm.client.send_request', AsyncMock(side_effect=LLMError("boom"))), \
+             patch('llm.client.asyncio.sleep', AsyncMock()):
+            with pytest.raises(LLMError):
+                await self.call(cache)
+
+        assert len(cache) == 0
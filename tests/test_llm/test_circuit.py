@@ -0,0 +1,139 @@
+"""Тесты предохранителей моделей."""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from llm.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from llm.client import LLMError, generate_response_with_history
+from monitoring.metrics import metrics_collector
+
+
+class FakeClock:
+    """Управляемые часы для проверки паузы предохранителя."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(**params):
+    clock = FakeClock()
+    params = {"window": 10, "failure_rate": 0.5, "min_requests": 4, "open_seconds": 30, **params}
+    return CircuitBreaker("model", clock=clock, **params), clock
+
+
+class TestCircuitBreaker:
+    """Тесты переходов closed -> open -> half_open."""
+
+    def test_opens_on_failure_rate(self):
+        """Предохранитель размыкается, когда доля ошибок достигает порога."""
+        breaker, _ = make_breaker()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow_request()
+
+    def test_min_requests_required(self):
+        """Единичная ошибка не размыкает предохранитель."""
+        breaker, _ = make_breaker()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        assert breaker.allow_request()
+
+    def test_probe_after_pause(self):
+        """После паузы пропускается ровно один пробный запрос."""
+        breaker, clock = make_breaker(min_requests=1)
+        breaker.record_failure()
+        clock.now = 29.0
+        assert not breaker.allow_request()
+
+        clock.now = 30.0
+        assert breaker.allow_request()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow_request()
+
+    def test_probe_success_closes(self):
+        breaker, clock = make_breaker(min_requests=1)
+        breaker.record_failure()
+        clock.now = 30.0
+        breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.current_failure_rate() == 0.0
+
+    def test_probe_failure_reopens(self):
+        breaker, clock = make_breaker(min_requests=1)
+        breaker.record_failure()
+        clock.now = 30.0
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        clock.now = 50.0
+        assert not breaker.allow_request()
+        assert breaker.snapshot()["retry_in_seconds"] == 10.0
+
+    def test_cancelled_probe_released(self):
+        """Отмененный пробный запрос не блокирует следующую пробу."""
+        breaker, clock = make_breaker(min_requests=1)
+        breaker.record_failure()
+        clock.now = 30.0
+        breaker.allow_request()
+        breaker.record_cancelled()
+        assert breaker.allow_request()
+
+    def test_transitions_recorded(self):
+        opens_before = metrics_collector.get_current_hour_stats()['circuit_opens']
+        breaker, _ = make_breaker(min_requests=1)
+        breaker.record_failure()
+        assert metrics_collector.get_current_hour_stats()['circuit_opens'] == opens_before + 1
+        assert metrics_collector.circuit_states["model"] == OPEN
+
+
+class TestCircuitInGeneration:
+    """Тесты предохранителей в generate_response_with_history."""
+
+    async def call(self, breakers):
+        return await generate_response_with_history(
+            AsyncMock(), "system", "3", [], "primary", "fallback", retry_attempts=3, breakers=breakers
+        )
+
+    async def test_open_primary_skipped_without_sleep(self):
+        """При разомкнутом предохранителе основной модели запрос сразу идет к резервной."""
+        breakers = CircuitBreakerRegistry(min_requests=1)
+        breakers.get("primary").record_failure()
+
+        send = AsyncMock(return_value="ответ")
+        with patch('llm.client.send_request', send), patch('llm.client.asyncio.sleep', AsyncMock()) as sleep:
+            assert await self.call(breakers) == "ответ"
+
+        assert [c.args[2] for c in send.await_args_list] == ["fallback"]
+        sleep.assert_not_awaited()
+
+    async def test_failures_open_circuit(self):
+        """Ошибки основной модели размыкают ее предохранитель."""
+        breakers = CircuitBreakerRegistry(min_requests=2)
+
+        async def send(client, messages, model, **params):
+            if model == "primary":
+                raise LLMError("rate limited")
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send), patch('llm.client.asyncio.sleep', AsyncMock()):
+            assert await self.call(breakers) == "ответ"
+
+        assert breakers.get("primary").state == OPEN
+        assert breakers.states()["fallback"]["state"] == CLOSED
+
+    async def test_all_open_raises(self):
+        breakers = CircuitBreakerRegistry(min_requests=1)
+        breakers.get("primary").record_failure()
+        breakers.get("fallback").record_failure()
+        with patch('llm.client.send_request', AsyncMock()) as send:
+            with pytest.raises(LLMError):
+                await self.call(breakers)
+        send.assert_not_awaited()
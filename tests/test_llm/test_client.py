@@ -1,7 +1,7 @@
 """Тесты LLM клиента."""
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-from src.llm.client import create_llm_client, generate_response_with_history, LLMError
+from src.llm.client import create_llm_client, generate_response_with_history, stream_request, LLMError
 
 
 class TestCreateLLMClient:
@@ -19,7 +19,8 @@ class TestCreateLLMClient:
             assert client == mock_client
             mock_openai.assert_called_once_with(
                 api_key="test_api_key",
-                base_url="https://openrouter.ai/api/v1"
+                base_url="https://openrouter.ai/api/v1",
+                max_retries=0
             )
     
     @pytest.mark.asyncio
@@ -30,6 +31,15 @@ class TestCreateLLMClient:
             
             with pytest.raises(LLMError, match="Failed to create LLM client"):
                 await create_llm_client("invalid_key")
+    
+    @pytest.mark.asyncio
+    async def test_create_llm_client_disables_sdk_retries(self):
+        """Повторы SDK отключены: ими управляет RetryPolicy."""
+        client = await create_llm_client("test_api_key")
+        try:
+            assert client.max_retries == 0
+        finally:
+            await client.close()
 
 
 class TestGenerateResponseWithHistory:
@@ -99,6 +109,43 @@ class TestGenerateResponseWithHistory:
         assert messages[2]['role'] == 'assistant'
         assert messages[3]['role'] == 'user'
     
+    @pytest.mark.asyncio
+    async def test_generate_response_passes_history_without_copying(self):
+        """Тест что сообщения истории передаются в запрос без копирования."""
+        mock_client = AsyncMock()
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_client.chat.completions.create.return_value = mock_response
+        
+        history = (
+            {"role": "user", "content": "Previous message"},
+            {"role": "assistant", "content": "Previous response"}
+        )
+        
+        await generate_response_with_history(
+            client=mock_client,
+            system_prompt="Test system prompt",
+            user_message="Current message",
+            message_history=history,
+            primary_model="test-model",
+            fallback_model="fallback-model"
+        )
+        await generate_response_with_history(
+            client=mock_client,
+            system_prompt="Test system prompt",
+            user_message="Next message",
+            message_history=history,
+            primary_model="test-model",
+            fallback_model="fallback-model"
+        )
+        
+        first, second = [call[1]['messages'] for call in mock_client.chat.completions.create.call_args_list]
+        assert first[1] is history[0]
+        assert first[2] is history[1]
+        assert first[0] is second[0]  # Системное сообщение создается один раз
+        assert first[3] == {"role": "user", "content": "Current message"}
+    
     @pytest.mark.asyncio
     async def test_generate_response_primary_model_failure_fallback_success(self):
         """Тест fallback на резервную модель при сбое основной."""
@@ -225,3 +272,63 @@ class TestGenerateResponseWithHistory:
                 max_tokens=1000,
                 top_p=0.9
             )
+
+
+def make_chunk(content):
+    """Фрагмент потокового ответа OpenAI."""
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = content
+    return chunk
+
+
+async def fake_stream(*contents):
+    for content in contents:
+        yield make_chunk(content)
+
+
+class TestStreamRequest:
+    """Тесты потокового запроса к LLM."""
+    
+    @pytest.mark.asyncio
+    async def test_stream_request_accumulates_text(self):
+        """on_delta получает накопленный текст, пустые фрагменты пропускаются."""
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create.return_value = fake_stream("Глаголы", None, ": назвать", ", перечислить")
+        seen = []
+        
+        async def on_delta(text):
+            seen.append(text)
+        
+        with patch('src.llm.client.metrics_collector') as metrics:
+            result = await stream_request(mock_client, [{"role": "user", "content": "1"}], "model", on_delta)
+        
+        assert result == "Глаголы: назвать, перечислить"
+        assert seen == ["Глаголы", "Глаголы: назвать", "Глаголы: назвать, перечислить"]
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+        model, ttft, ttlt = metrics.record_stream_timing.call_args.args
+        assert model == "model"
+        assert 0 <= ttft <= ttlt
+    
+    @pytest.mark.asyncio
+    async def test_stream_request_empty_response(self):
+        """Поток без текста считается ошибкой."""
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create.return_value = fake_stream(None)
+        
+        with pytest.raises(LLMError):
+            await stream_request(mock_client, [], "model", AsyncMock())
+    
+    @pytest.mark.asyncio
+    async def test_history_generation_streams_when_callback_given(self):
+        """С on_delta ответ запрашивается потоком."""
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create.return_value = fake_stream("Ответ")
+        on_delta = AsyncMock()
+        
+        result = await generate_response_with_history(
+            mock_client, "system", "3", [], "primary", "fallback", on_delta=on_delta
+        )
+        
+        assert result == "Ответ"
+        on_delta.assert_awaited_once_with("Ответ")
@@ -0,0 +1,181 @@
+"""Тесты дедлайна обработки апдейта."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from llm.client import DeadlineExceededError, LLMError, generate_response_with_history, send_request
+from llm.circuit import CLOSED, CircuitBreakerRegistry
+from llm.deadline import current_deadline, deadline_scope, fits_deadline, restart_deadline, without_deadline
+from llm.limiter import request_limiter
+from llm.retry import RetryPolicy
+from llm.singleflight import SingleFlight
+
+
+async def hang(*args, **kwargs):
+    await asyncio.sleep(10)
+
+
+class TestDeadlineScope:
+    """Тесты contextvar дедлайна."""
+
+    def test_scope_sets_and_resets(self):
+        assert current_deadline() is None
+        assert fits_deadline(1000)
+        with deadline_scope(5) as deadline:
+            assert current_deadline() is deadline
+            assert 4 < deadline.remaining() <= 5
+            assert fits_deadline(1.0)
+            assert not fits_deadline(10.0)
+        assert current_deadline() is None
+
+    def test_zero_disables(self):
+        with deadline_scope(0) as deadline:
+            assert deadline is None
+            assert fits_deadline(1000)
+
+    async def test_restart_excludes_wait(self):
+        """Перезапуск возвращает дедлайну полный срок после ожидания."""
+        restart_deadline()  # Без дедлайна ничего не делает
+        with deadline_scope(0.2) as deadline:
+            await asyncio.sleep(0.1)
+            assert deadline.remaining() < 0.15
+            restart_deadline()
+            assert deadline.remaining() > 0.15
+
+    def test_background_context_has_no_deadline(self):
+        with deadline_scope(5):
+            assert without_deadline().run(current_deadline) is None
+            assert current_deadline() is not None
+
+
+class TestDeadlineRequests:
+    """Запросы к LLM в пределах дедлайна."""
+
+    @pytest.fixture(autouse=True)
+    def unlimited(self):
+        request_limiter.configure()
+        yield
+        request_limiter.configure()
+
+    async def test_attempt_cut_at_deadline(self):
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = hang
+        with deadline_scope(0.1) as deadline:
+            with pytest.raises(DeadlineExceededError):
+                await send_request(client, [], "model")
+        assert deadline.exceeded
+
+    async def test_exhausted_deadline_skips_request(self):
+        client = AsyncMock()
+        with deadline_scope(0.1) as deadline:
+            deadline.at -= 1
+            with pytest.raises(DeadlineExceededError):
+                await send_request(client, [], "model")
+        client.chat.completions.create.assert_not_awaited()
+
+    async def test_fast_failure_instead_of_all_attempts(self):
+        """Дедлайн прерывает все попытки и fallback; предохранитель не считает это ошибкой."""
+        breakers = CircuitBreakerRegistry(min_requests=1)
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = hang
+        with deadline_scope(0.2):
+            with pytest.raises(DeadlineExceededError):
+                await asyncio.wait_for(
+                    generate_response_with_history(
+                        client, "system", "1", [], "primary", "fallback", retry_attempts=3, breakers=breakers
+                    ),
+                    timeout=2
+                )
+        assert client.chat.completions.create.await_count == 1
+        assert breakers.get("primary").state == CLOSED
+
+    async def test_backoff_skipped_when_it_would_overrun(self):
+        """Пауза, превышающая остаток времени, не выполняется: запрос сразу идет к резервной модели."""
+        async def send(client, messages, model, **params):
+            if model == "primary":
+                raise LLMError("rate limited")
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send) as mock_send, \
+                patch('llm.client.asyncio.sleep', AsyncMock()) as sleep:
+            with deadline_scope(0.5):
+                result = await generate_response_with_history(
+                    AsyncMock(), "system", "1", [], "primary", "fallback", retry_attempts=3,
+                    retry_policy=RetryPolicy(base_delay=1.0, rng=lambda: 1.0)
+                )
+
+        assert result == "ответ"
+        assert [c.args[2] for c in mock_send.await_args_list] == ["primary", "fallback"]
+        sleep.assert_not_awaited()
+
+
+class TestCoalescedDeadline:
+    """Дедлайн для запросов, идущих через склейку (REQUEST_COALESCING)."""
+
+    @pytest.fixture(autouse=True)
+    def unlimited(self):
+        request_limiter.configure()
+        yield
+        request_limiter.configure()
+
+    async def test_flight_stops_at_deadline(self):
+        """Склеенный запрос обрывается дедлайном, а не продолжает попытки без ожидающих."""
+        flights = SingleFlight()
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = hang
+        with deadline_scope(0.2) as deadline:
+            with pytest.raises(DeadlineExceededError):
+                await asyncio.wait_for(
+                    generate_response_with_history(
+                        client, "system", "1", [], "primary", "fallback", retry_attempts=3, flights=flights
+                    ),
+                    timeout=2
+                )
+        await asyncio.sleep(0.05)
+
+        assert deadline.exceeded
+        assert client.chat.completions.create.await_count == 1
+        assert len(flights) == 0
+
+    async def test_backoff_skipped_in_flight(self):
+        """Пауза, превышающая остаток дедлайна, не выполняется и внутри склейки."""
+        async def send(client, messages, model, **params):
+            if model == "primary":
+                raise LLMError("rate limited")
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send) as mock_send, \
+                patch('llm.client.asyncio.sleep', AsyncMock()) as sleep:
+            with deadline_scope(0.5):
+                result = await generate_response_with_history(
+                    AsyncMock(), "system", "1", [], "primary", "fallback", retry_attempts=3,
+                    retry_policy=RetryPolicy(base_delay=1.0, rng=lambda: 1.0), flights=SingleFlight()
+                )
+
+        assert result == "ответ"
+        assert [c.args[2] for c in mock_send.await_args_list] == ["primary", "fallback"]
+        sleep.assert_not_awaited()
+
+    async def test_waiter_counts_leader_deadline(self):
+        """Ожидающий, которому склеенный запрос не ответил по дедлайну, отмечает исчерпание."""
+        flights = SingleFlight()
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = hang
+
+        async def leader():
+            with deadline_scope(0.1):
+                return await generate_response_with_history(
+                    client, "system", "1", [], "primary", "fallback", flights=flights
+                )
+
+        leader_task = asyncio.create_task(leader())
+        await asyncio.sleep(0)
+        with deadline_scope(5) as deadline:
+            with pytest.raises(DeadlineExceededError):
+                await generate_response_with_history(client, "system", "1", [], "primary", "fallback", flights=flights)
+        with pytest.raises(DeadlineExceededError):
+            await leader_task
+
+        assert deadline.exceeded
+        assert client.chat.completions.create.await_count == 1
@@ -0,0 +1,133 @@
+"""Тесты хеджирования запросов."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from llm.client import LLMError, generate_response_with_history
+from llm.hedging import DEFAULT_HEDGE_DELAY, HEDGE_MIN_SAMPLES, Hedger, LatencyWindow
+from monitoring.metrics import metrics_collector
+
+
+def make_request(delays, errors=(), chunks=None):
+    """Фейковый запрос: задержка ответа по модели, ошибки, потоковые фрагменты."""
+    calls = []
+    cancelled = []
+
+    async def request(model, on_delta=None):
+        calls.append(model)
+        try:
+            if on_delta is not None and chunks:
+                for chunk in chunks[model]:
+                    await asyncio.sleep(delays[model])
+                    await on_delta(chunk)
+                return chunks[model][-1]
+            await asyncio.sleep(delays[model])
+            if model in errors:
+                raise LLMError(f"{model} failed")
+            return f"ответ {model}"
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+
+    return request, calls, cancelled
+
+
+class TestLatencyWindow:
+    """Тесты скользящего окна задержек."""
+
+    def test_percentile(self):
+        window = LatencyWindow(size=100)
+        assert window.percentile(0.95) == 0.0
+        for i in range(1, 101):
+            window.add(i / 100)
+        assert window.percentile(0.95) == 0.96
+        assert window.percentile(1.0) == 1.0
+
+    def test_window_size(self):
+        window = LatencyWindow(size=3)
+        for value in (10.0, 1.0, 2.0, 3.0):
+            window.add(value)
+        assert len(window) == 3
+        assert window.percentile(1.0) == 3.0
+
+
+class TestHedger:
+    """Тесты гонки основной и резервной модели."""
+
+    async def test_fast_primary_not_hedged(self):
+        """Быстрая основная модель отвечает без запроса к резервной."""
+        request, calls, _ = make_request({"primary": 0.01, "fallback": 0.01})
+        hedger = Hedger(delay=0.2)
+        assert await hedger.race(request, "primary", "fallback") == "ответ primary"
+        assert calls == ["primary"]
+
+    async def test_slow_primary_loses_to_fallback(self):
+        """Медленная основная модель проигрывает хеджу и отменяется."""
+        request, calls, cancelled = make_request({"primary": 1.0, "fallback": 0.01})
+        hedger = Hedger(delay=0.05)
+        fired_before = metrics_collector.get_current_hour_stats()['hedges_fired']
+
+        assert await hedger.race(request, "primary", "fallback") == "ответ fallback"
+        assert calls == ["primary", "fallback"]
+        assert cancelled == ["primary"]
+        stats = metrics_collector.get_current_hour_stats()
+        assert stats['hedges_fired'] == fired_before + 1
+        assert stats['hedge_wins']['fallback'] >= 1
+
+    async def test_primary_can_still_win(self):
+        """После хеджа основная модель может ответить первой."""
+        request, calls, cancelled = make_request({"primary": 0.1, "fallback": 1.0})
+        hedger = Hedger(delay=0.05)
+        assert await hedger.race(request, "primary", "fallback") == "ответ primary"
+        assert cancelled == ["fallback"]
+
+    async def test_failed_contender_waits_for_other(self):
+        """Ошибка одной модели не прерывает гонку."""
+        request, _, _ = make_request({"primary": 0.1, "fallback": 0.01}, errors={"fallback"})
+        hedger = Hedger(delay=0.05)
+        assert await hedger.race(request, "primary", "fallback") == "ответ primary"
+
+    async def test_all_failed_raises(self):
+        request, _, _ = make_request({"primary": 0.1, "fallback": 0.01}, errors={"primary", "fallback"})
+        with pytest.raises(LLMError):
+            await Hedger(delay=0.05).race(request, "primary", "fallback")
+
+    async def test_stream_owned_by_first_token(self):
+        """Поток показывает модель, выдавшую первый токен; вторая отменяется."""
+        chunks = {"primary": ["п", "пп"], "fallback": ["р", "рр"]}
+        request, _, cancelled = make_request({"primary": 1.0, "fallback": 0.01}, chunks=chunks)
+        seen = []
+
+        async def on_delta(text):
+            seen.append(text)
+
+        response = await Hedger(delay=0.05).race(request, "primary", "fallback", on_delta)
+        assert response == "рр"
+        assert seen == ["р", "рр"]
+        assert cancelled == ["primary"]
+
+    def test_delay_from_observed_p95(self):
+        """Без явной задержки используется p95 основной модели."""
+        hedger = Hedger()
+        assert hedger.delay_for("primary") == DEFAULT_HEDGE_DELAY
+        for i in range(HEDGE_MIN_SAMPLES):
+            hedger.latency("primary").add(1.0 + i / 10)
+        assert hedger.delay_for("primary") == pytest.approx(2.9)
+
+
+class TestHedgedGeneration:
+    """Тесты хеджирования в generate_response_with_history."""
+
+    async def test_first_attempt_hedged(self):
+        """Медленная основная модель уступает резервной без retry и пауз."""
+        async def send(client, messages, model, **params):
+            await asyncio.sleep(1.0 if model == "primary" else 0.01)
+            return f"ответ {model}"
+
+        with patch('llm.client.send_request', side_effect=send):
+            response = await generate_response_with_history(
+                AsyncMock(), "system", "3", [], "primary", "fallback", hedger=Hedger(delay=0.05)
+            )
+
+        assert response == "ответ fallback"
@@ -0,0 +1,222 @@
+"""Тесты лимитера запросов к LLM."""
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from llm.client import LLMError, send_request
+from llm.limiter import (
+    MAX_PAUSE_SECONDS, AdaptiveLimit, RequestLimiter, TokenBucket, request_limiter, retry_after_seconds
+)
+from monitoring.metrics import metrics_collector
+
+
+class FakeClock:
+    """Управляемые часы для проверки token bucket."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_error(headers, status_code=429):
+    error = Exception("Too Many Requests")
+    error.response = MagicMock(headers=headers, status_code=status_code)
+    return error
+
+
+class TestTokenBucket:
+    """Тесты token bucket."""
+
+    def test_burst_then_rate(self):
+        """После burst токены выдаются со скоростью rate."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate_per_minute=60, burst=2, clock=clock)
+        assert bucket.try_acquire() == 0.0
+        assert bucket.try_acquire() == 0.0
+        assert bucket.try_acquire() == pytest.approx(1.0)
+
+        clock.now = 1.0
+        assert bucket.try_acquire() == 0.0
+
+    def test_unlimited_rate(self):
+        bucket = TokenBucket(rate_per_minute=0, clock=FakeClock())
+        assert all(bucket.try_acquire() == 0.0 for _ in range(100))
+
+    def test_pause(self):
+        """Пауза действует и без ограничения частоты."""
+        clock = FakeClock()
+        bucket = TokenBucket(clock=clock)
+        bucket.pause(10)
+        assert bucket.try_acquire() == 10.0
+        clock.now = 10.0
+        assert bucket.try_acquire() == 0.0
+
+
+class TestRetryAfter:
+    """Тесты разбора заголовков ответа 429."""
+
+    def test_retry_after_seconds(self):
+        assert retry_after_seconds(make_error({"retry-after": "7"})) == 7.0
+
+    def test_retry_after_ms(self):
+        assert retry_after_seconds(make_error({"retry-after-ms": "1500"})) == 1.5
+
+    def test_ratelimit_reset_epoch_ms(self):
+        """OpenRouter передает сброс лимита в миллисекундах Unix-времени."""
+        reset = str(int((time.time() + 20) * 1000))
+        assert retry_after_seconds(make_error({"x-ratelimit-reset": reset})) == pytest.approx(20, abs=1)
+
+    def test_reset_ignored_without_429(self):
+        assert retry_after_seconds(make_error({"x-ratelimit-reset": "5"}, status_code=500)) is None
+
+    def test_capped_and_unparseable(self):
+        assert retry_after_seconds(make_error({"retry-after": "100000"})) == MAX_PAUSE_SECONDS
+        assert retry_after_seconds(make_error({"retry-after": "скоро"})) is None
+        assert retry_after_seconds(Exception("no response")) is None
+
+
+class TestRequestLimiter:
+    """Тесты семафора и метрик ожидания."""
+
+    async def test_concurrency_bounded(self):
+        limiter = RequestLimiter(max_concurrency=2)
+        active = peak = 0
+
+        async def call():
+            nonlocal active, peak
+            async with limiter.slot("model"):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        assert peak == 2
+        assert limiter.in_flight == 0
+
+    async def test_queue_wait_recorded_separately(self):
+        """Ожидание места и время запроса пишутся раздельно."""
+        limiter = RequestLimiter(max_concurrency=1)
+        calls_before = metrics_collector.get_current_hour_stats()['llm_calls']
+
+        async def call():
+            async with limiter.slot("model"):
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(call(), call())
+        stats = metrics_collector.get_current_hour_stats()
+        assert stats['llm_calls'] == calls_before + 2
+        assert stats['queue_wait_max'] >= 0.04
+
+    async def test_429_pauses_model(self):
+        """Ответ 429 с Retry-After ставит модель на паузу."""
+        client = AsyncMock()
+        client.chat.completions.create.side_effect = make_error({"retry-after": "30"})
+        request_limiter.configure()
+        try:
+            with pytest.raises(LLMError):
+                await send_request(client, [], "model")
+            assert request_limiter.bucket("model").try_acquire() == pytest.approx(30, abs=1)
+            assert request_limiter.bucket("other").try_acquire() == 0.0
+        finally:
+            request_limiter.configure()
+
+
+class TestAdaptiveLimit:
+    """Тесты AIMD-лимита."""
+
+    def test_additive_increase_near_baseline(self):
+        """Пока задержка у базовой, лимит растет примерно на 1 за круг запросов."""
+        limit = AdaptiveLimit(min_limit=1, max_limit=10, initial=2, clock=FakeClock())
+        for _ in range(6):
+            limit.on_sample(1.0, ok=True)
+        assert limit.capacity() == 4
+        for _ in range(100):
+            limit.on_sample(1.2, ok=True)
+        assert limit.capacity() == 10
+
+    def test_multiplicative_decrease_on_error(self):
+        clock = FakeClock()
+        limit = AdaptiveLimit(min_limit=1, max_limit=10, initial=8, clock=clock)
+        limit.on_sample(1.0, ok=True)
+        limit.on_sample(1.0, ok=False)
+        assert limit.capacity() == 4
+
+    def test_decrease_on_latency_growth(self):
+        clock = FakeClock()
+        limit = AdaptiveLimit(min_limit=1, max_limit=10, initial=8, clock=clock)
+        limit.on_sample(1.0, ok=True)
+        limit.on_sample(5.0, ok=True)
+        assert limit.capacity() == 8  # Один долгий ответ - не перегрузка
+        limit.on_sample(5.0, ok=True)
+        limit.on_sample(5.0, ok=True)
+        assert limit.capacity() == 4
+
+    def test_one_decrease_per_round_trip(self):
+        """Серия одновременных ошибок снижает лимит один раз."""
+        clock = FakeClock()
+        limit = AdaptiveLimit(min_limit=1, max_limit=16, initial=16, clock=clock)
+        limit.on_sample(1.0, ok=True)
+        for _ in range(5):
+            limit.on_sample(1.0, ok=False)
+        assert limit.capacity() == 8
+
+        clock.now = 2.0
+        limit.on_sample(1.0, ok=False)
+        assert limit.capacity() == 4
+
+    def test_min_limit(self):
+        clock = FakeClock()
+        limit = AdaptiveLimit(min_limit=2, max_limit=8, initial=2, clock=clock)
+        limit.on_sample(1.0, ok=False)
+        assert limit.capacity() == 2
+
+
+class TestAdaptiveLimiter:
+    """Тесты RequestLimiter с адаптивным лимитом."""
+
+    async def test_limit_shrinks_on_errors(self):
+        """Ошибки запросов сокращают число мест, изменение попадает в метрики."""
+        limiter = RequestLimiter(max_concurrency=8, adaptive=True)
+        assert limiter.capacity() == 4
+
+        with pytest.raises(LLMError):
+            async with limiter.slot("model"):
+                raise LLMError("429")
+
+        assert limiter.capacity() == 2
+        assert metrics_collector.get_current_hour_stats()['concurrency_limit'] == 2
+        assert limiter.snapshot() == {"limit": 2, "in_flight": 0, "queued": 0}
+
+    async def test_cancelled_not_counted(self):
+        limiter = RequestLimiter(max_concurrency=8, adaptive=True)
+        task = asyncio.create_task(self._hold(limiter))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert limiter.capacity() == 4
+        assert limiter.in_flight == 0
+
+    async def test_cancelled_waiter_releases_queue(self):
+        """Отмена ожидающего запроса не теряет место."""
+        limiter = RequestLimiter(max_concurrency=1)
+        holder = asyncio.create_task(self._hold(limiter, 0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(self._hold(limiter, 0))
+        await asyncio.sleep(0)
+        assert limiter.snapshot()["queued"] == 1
+        waiter.cancel()
+        await holder
+        assert limiter.in_flight == 0
+        async with limiter.slot("model"):
+            assert limiter.in_flight == 1
+
+    @staticmethod
+    async def _hold(limiter, seconds=1.0):
+        async with limiter.slot("model"):
+            await asyncio.sleep(seconds)
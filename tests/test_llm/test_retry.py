@@ -0,0 +1,126 @@
+"""Тесты политики повторов."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from openai import APIStatusError, APITimeoutError
+
+from llm.client import LLMError, generate_response, generate_response_with_history
+from llm.retry import RetryBudget, RetryPolicy, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def api_error(status: int) -> LLMError:
+    """LLMError, обернувший ответ API с кодом status (как в send_request)."""
+    response = MagicMock(status_code=status, headers={})
+    try:
+        try:
+            raise APIStatusError("error", response=response, body=None)
+        except APIStatusError as e:
+            raise LLMError("Ошибка запроса к LLM") from e
+    except LLMError as e:
+        return e
+
+
+class TestClassification:
+    """Какие ошибки повторяются."""
+
+    def test_retryable_statuses(self):
+        assert is_retryable(api_error(429))
+        assert is_retryable(api_error(502))
+        assert not is_retryable(api_error(400))
+        assert not is_retryable(api_error(404))
+
+    def test_timeouts_and_unknown_errors_retryable(self):
+        try:
+            raise LLMError("timeout") from APITimeoutError(request=MagicMock())
+        except LLMError as e:
+            assert is_retryable(e)
+        assert is_retryable(LLMError("Пустой ответ от LLM"))
+
+
+class TestRetryPolicy:
+    """Тесты пауз и бюджета повторов."""
+
+    def test_full_jitter_exponential_backoff(self):
+        assert RetryPolicy(base_delay=1.0, max_delay=10.0, rng=lambda: 1.0).backoff(2) == 4.0
+        assert RetryPolicy(base_delay=1.0, max_delay=10.0, rng=lambda: 1.0).backoff(6) == 10.0
+        assert RetryPolicy(base_delay=1.0, rng=lambda: 0.25).backoff(1) == 0.5
+
+    def test_budget_caps_retries_by_ratio(self):
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.2, min_retries=1, window=10.0, clock=clock)
+        for _ in range(10):
+            budget.record_request()
+        assert budget.try_spend()
+        assert budget.try_spend()
+        assert not budget.try_spend()  # 2 повтора на 10 запросов
+
+        # Через окно старые запросы и повторы больше не учитываются
+        clock.now = 11.0
+        assert budget.try_spend()      # min_retries
+        assert not budget.try_spend()
+
+    def test_denied_retry_recorded(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0.0, min_retries=0))
+        with patch('llm.retry.metrics_collector') as metrics:
+            assert not policy.allow_retry(LLMError("rate limited"))
+        metrics.record_retry.assert_called_once_with(allowed=False)
+
+
+class TestRetryLoop:
+    """Повторы в generate_response и generate_response_with_history."""
+
+    async def test_non_retryable_error_goes_to_fallback(self):
+        async def send(client, messages, model, **params):
+            if model == "primary":
+                raise api_error(400)
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send) as mock_send, \
+                patch('llm.client.asyncio.sleep', AsyncMock()) as sleep:
+            result = await generate_response_with_history(
+                AsyncMock(), "system", "1", [], "primary", "fallback", retry_attempts=3
+            )
+
+        assert result == "ответ"
+        assert [c.args[2] for c in mock_send.await_args_list] == ["primary", "fallback"]
+        sleep.assert_not_awaited()
+
+    async def test_generate_response_uses_jittered_policy(self):
+        """Ответ без истории идет через ту же политику повторов."""
+        send = AsyncMock(side_effect=[LLMError("a"), LLMError("b"), "ответ"])
+        policy = RetryPolicy(base_delay=1.0, rng=lambda: 0.5)
+
+        with patch('llm.client.send_request', send), patch('llm.client.asyncio.sleep', AsyncMock()) as sleep:
+            result = await generate_response(
+                AsyncMock(), "system", "1", "primary", "fallback", retry_attempts=3, retry_policy=policy
+            )
+
+        assert result == "ответ"
+        assert [c.args[0] for c in sleep.await_args_list] == [0.5, 1.0]
+        assert send.await_args_list[0].args[1] == [
+            {"role": "system", "content": "system"}, {"role": "user", "content": "1"}
+        ]
+
+    async def test_exhausted_budget_skips_retries(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0.0, min_retries=0))
+
+        async def send(client, messages, model, **params):
+            if model == "primary":
+                raise LLMError("rate limited")
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send) as mock_send, \
+                patch('llm.client.asyncio.sleep', AsyncMock()):
+            result = await generate_response_with_history(
+                AsyncMock(), "system", "1", [], "primary", "fallback", retry_attempts=3, retry_policy=policy
+            )
+
+        assert result == "ответ"
+        assert [c.args[2] for c in mock_send.await_args_list] == ["primary", "fallback"]
@@ -0,0 +1,109 @@
+"""Тесты маршрутизатора моделей."""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from llm.circuit import CircuitBreakerRegistry
+from llm.client import LLMError, generate_response_with_history
+from llm.router import ModelRouter
+from monitoring.metrics import MetricsCollector
+
+
+def never_explore():
+    return 1.0
+
+
+class TestModelRouter:
+    """Тесты выбора модели по оценкам."""
+
+    def test_unmeasured_models_tried_first(self):
+        router = ModelRouter(["a", "b", "c"], rng=never_explore)
+        router.observe("a", 2.0, ok=True, tokens=100)
+        assert router.rank()[:2] == ["b", "c"]
+
+    def test_fastest_model_wins(self):
+        """Оценка строится по токенам в секунду: длинный ответ не штрафуется целиком."""
+        router = ModelRouter(["a", "b", "c"], rng=never_explore)
+        router.observe("a", 2.0, ok=True, tokens=100)   # 50 ток/с
+        router.observe("b", 4.0, ok=True, tokens=400)   # 100 ток/с
+        router.observe("c", 1.0, ok=True, tokens=20)    # 20 ток/с
+        assert router.route() == ["b", "a"]
+
+    def test_latency_breaks_equal_speed(self):
+        """При равной скорости генерации выше модель с меньшей задержкой."""
+        router = ModelRouter(["slow", "fast"], rng=never_explore)
+        router.observe("slow", 8.0, ok=True, tokens=400)   # 50 ток/с
+        router.observe("fast", 2.0, ok=True, tokens=100)   # 50 ток/с
+        assert router.stats("slow").tokens_per_second == router.stats("fast").tokens_per_second
+        assert router.rank() == ["fast", "slow"]
+
+    def test_failures_lower_score(self):
+        router = ModelRouter(["a", "b"], rng=never_explore)
+        router.observe("a", 1.0, ok=True, tokens=100)
+        router.observe("b", 1.0, ok=True, tokens=80)
+        for _ in range(3):
+            router.observe("a", 30.0, ok=False)
+        assert router.rank() == ["b", "a"]
+        assert router.snapshot()["a"]["success_rate"] < 0.6
+
+    def test_exploration_promotes_other_model(self):
+        router = ModelRouter(["a", "b", "c"], exploration=0.1, rng=lambda: 0.05)
+        for model, tokens in (("a", 300), ("b", 200), ("c", 100)):
+            router.observe(model, 1.0, ok=True, tokens=tokens)
+        assert router.rank() == ["b", "a", "c"]
+
+    def test_exclude_and_single_model(self):
+        router = ModelRouter(["a", "b"], rng=never_explore)
+        assert router.route(exclude=["a"]) == ["b", "b"]
+        # Если исключены все модели, выбор идет из всего пула
+        assert router.route(exclude=["a", "b"])[0] in ("a", "b")
+
+    def test_route_shares_and_scores_in_metrics(self):
+        router = ModelRouter(["a", "b"], rng=never_explore)
+        collector = MetricsCollector()
+        with patch('llm.router.metrics_collector', collector):
+            router.observe("a", 1.0, ok=True, tokens=50)
+            router.observe("b", 1.0, ok=True, tokens=10)
+            for _ in range(3):
+                router.route()
+        assert collector.get_route_shares() == {"a": 1.0}
+        assert collector.model_scores == {"a": pytest.approx(50 / 1.1), "b": pytest.approx(10 / 1.1)}
+
+
+class TestRoutedGeneration:
+    """generate_response_with_history с маршрутизатором."""
+
+    async def test_routed_models_used_and_observed(self):
+        router = ModelRouter(["slow", "fast"], rng=never_explore)
+        router.observe("slow", 1.0, ok=True, tokens=10)
+        router.observe("fast", 1.0, ok=True, tokens=100)
+
+        send = AsyncMock(return_value="ответ")
+        with patch('llm.client.send_request', send):
+            result = await generate_response_with_history(
+                AsyncMock(), "system", "1", [], "primary", "fallback", router=router
+            )
+
+        assert result == "ответ"
+        assert [c.args[2] for c in send.await_args_list] == ["fast"]
+        assert router.stats("fast").requests == 2
+
+    async def test_open_circuit_not_routed(self):
+        router = ModelRouter(["a", "b", "c"], rng=never_explore)
+        breakers = CircuitBreakerRegistry(min_requests=1)
+        breakers.get("a").record_failure()
+
+        async def send(client, messages, model, **params):
+            if model == "b":
+                raise LLMError("rate limited")
+            return model
+
+        with patch('llm.client.send_request', side_effect=send), patch('llm.client.asyncio.sleep', AsyncMock()):
+            result = await generate_response_with_history(
+                AsyncMock(), "system", "1", [], "primary", "fallback",
+                retry_attempts=1, breakers=breakers, router=router
+            )
+
+        assert result == "c"
+        assert router.stats("b").success_rate < 1.0
+        assert router.stats("a").requests == 0
@@ -0,0 +1,207 @@
+"""Тесты склейки одинаковых запросов."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from llm import client as llm_client
+from llm.cache import ResponseCache
+import pytest
+
+from llm.client import DeadlineExceededError, LLMError, generate_response_with_history
+from llm.deadline import current_deadline, deadline_scope
+from llm.limiter import request_limiter
+from llm.singleflight import SingleFlight
+from llm.usage import current_usage_owner, usage_owner
+from monitoring.metrics import MetricsCollector, metrics_collector
+
+
+def make_request(result="ответ", delay=0.02, error=None, chunks=()):
+    calls = []
+
+    async def request(on_delta=None):
+        calls.append(on_delta)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            if on_delta is not None:
+                await on_delta(chunk)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return request, calls
+
+
+class TestSingleFlight:
+    """Тесты SingleFlight."""
+
+    async def test_identical_requests_coalesced(self):
+        """Одновременные вызовы с одним ключом - один запрос."""
+        flights = SingleFlight()
+        request, calls = make_request()
+        coalesced_before = metrics_collector.get_current_hour_stats()['coalesced_requests']
+
+        results = await asyncio.gather(*(flights.do("key", request) for _ in range(5)))
+
+        assert results == ["ответ"] * 5
+        assert len(calls) == 1
+        assert len(flights) == 0
+        assert metrics_collector.get_current_hour_stats()['coalesced_requests'] == coalesced_before + 4
+
+    async def test_different_keys_not_coalesced(self):
+        flights = SingleFlight()
+        request, calls = make_request()
+        await asyncio.gather(flights.do("a", request), flights.do("b", request))
+        assert len(calls) == 2
+
+    async def test_sequential_requests_not_coalesced(self):
+        """После завершения запроса ключ освобождается."""
+        flights = SingleFlight()
+        request, calls = make_request()
+        await flights.do("key", request)
+        await flights.do("key", request)
+        assert len(calls) == 2
+
+    async def test_cancellation_isolated(self):
+        """Отмена первого вызывающего не отменяет запрос для остальных."""
+        flights = SingleFlight()
+        request, calls = make_request(delay=0.05)
+        leader = asyncio.create_task(flights.do("key", request))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", request))
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        assert await follower == "ответ"
+        assert leader.cancelled()
+        assert len(calls) == 1
+
+    async def test_error_shared(self):
+        flights = SingleFlight()
+        request, _ = make_request(error=LLMError("boom"))
+        results = await asyncio.gather(flights.do("key", request), flights.do("key", request), return_exceptions=True)
+        assert all(isinstance(r, LLMError) for r in results)
+
+    async def test_stream_broadcast(self):
+        """Фрагменты потока получают все подписчики."""
+        flights = SingleFlight()
+        request, calls = make_request(chunks=["а", "аб"])
+        first, second = AsyncMock(), AsyncMock()
+
+        await asyncio.gather(flights.do("key", request, first), flights.do("key", request, second))
+
+        assert calls[0] is not None
+        assert [c.args[0] for c in first.await_args_list] == ["а", "аб"]
+        assert [c.args[0] for c in second.await_args_list] == ["а", "аб"]
+
+
+    async def test_flight_does_not_inherit_caller_context(self):
+        """Общий запрос не получает дедлайн и владельца токенов первого вызывающего."""
+        flights = SingleFlight()
+        seen = []
+
+        async def request(on_delta=None):
+            seen.append((current_deadline(), current_usage_owner()))
+            return "ответ"
+
+        with deadline_scope(5), usage_owner(42):
+            assert await flights.do("key", request) == "ответ"
+
+        assert seen == [(None, None)]
+
+
+class TestCoalescedGeneration:
+    """Тесты склейки в generate_response_with_history."""
+
+    @pytest.fixture(autouse=True)
+    def unlimited(self):
+        request_limiter.configure()
+        yield
+        request_limiter.configure()
+
+    async def test_leader_deadline_and_usage_reach_request(self):
+        """Запрос в склейке видит дедлайн и владельца токенов вызывающего."""
+        client = AsyncMock()
+        client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ответ"))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30, prompt_tokens_details=None)
+        )
+        real_send = llm_client.send_request
+        seen = []
+
+        async def send(client, messages, model, **params):
+            seen.append(current_deadline())
+            return await real_send(client, messages, model, **params)
+
+        collector = MetricsCollector()
+        with patch('llm.client.send_request', side_effect=send), patch('llm.client.metrics_collector', collector):
+            with deadline_scope(5) as deadline, usage_owner(42):
+                await generate_response_with_history(
+                    client, "system", "3", [], "model", "fallback", flights=SingleFlight()
+                )
+
+        assert seen == [deadline]
+        assert collector.get_top_token_users()[42]["total_tokens"] == 150
+
+    async def test_cache_filled_even_if_callers_cancelled(self):
+        """Склеенный запрос доводится до конца и сохраняет ответ в кэш."""
+        cache = ResponseCache()
+
+        async def send(client, messages, model, **params):
+            await asyncio.sleep(0.05)
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send) as mock_send:
+            flights = SingleFlight()
+            calls = [
+                asyncio.create_task(generate_response_with_history(
+                    AsyncMock(), "system", text, [], "model", "fallback", cache=cache, flights=flights
+                ))
+                for text in ("3", " 3", "3 ")
+            ]
+            await asyncio.sleep(0.01)
+            for task in calls:
+                task.cancel()
+            await asyncio.sleep(0.1)
+
+        assert mock_send.await_count == 1
+        entry, _ = cache.get(ResponseCache.make_key("model", "system", "3", []))
+        assert entry.value == "ответ"
+
+    async def test_miss_recorded_once_per_request(self):
+        """Склеенные ожидающие не считаются промахами кэша."""
+        collector = MetricsCollector()
+
+        async def send(client, messages, model, **params):
+            await asyncio.sleep(0.02)
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send), patch('llm.client.metrics_collector', collector):
+            flights = SingleFlight()
+            await asyncio.gather(*(
+                generate_response_with_history(
+                    AsyncMock(), "system", "3", [], "model", "fallback", cache=ResponseCache(), flights=flights
+                )
+                for _ in range(3)
+            ))
+
+        assert collector.get_current_hour_stats()["cache_misses"] == 1
+
+    async def test_waiter_bounded_by_own_deadline(self):
+        """Ожидающий склеенного запроса получает ошибку по своему дедлайну."""
+        async def send(client, messages, model, **params):
+            await asyncio.sleep(0.2)
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=send):
+            flights = SingleFlight()
+            leader = asyncio.create_task(generate_response_with_history(
+                AsyncMock(), "system", "3", [], "model", "fallback", flights=flights
+            ))
+            await asyncio.sleep(0)
+            with deadline_scope(0.05) as deadline, pytest.raises(DeadlineExceededError):
+                await generate_response_with_history(
+                    AsyncMock(), "system", "3", [], "model", "fallback", flights=flights
+                )
+            assert deadline.exceeded
+            assert await leader == "ответ"
@@ -0,0 +1,39 @@
+"""Тесты построения резюме диалога."""
+from llm.summary import SUMMARY_PROMPT, build_summary_messages, extractive_summary
+
+
+def test_build_summary_messages_includes_previous_summary():
+    """Запрос к модели содержит предыдущее резюме и новые реплики с ролями."""
+    messages = build_summary_messages("Тема: охрана труда", [("user", "Анализ"), ("assistant", "Глаголы...")])
+
+    assert messages[0] == {"role": "system", "content": SUMMARY_PROMPT}
+    assert "Предыдущее резюме:\nТема: охрана труда" in messages[1]["content"]
+    assert "Пользователь: Анализ\nАссистент: Глаголы..." in messages[1]["content"]
+
+
+def test_build_summary_messages_without_previous_summary():
+    """Без предыдущего резюме отправляются только реплики."""
+    messages = build_summary_messages(None, [("user", "3")])
+
+    assert "Предыдущее резюме" not in messages[1]["content"]
+
+
+def test_extractive_summary_takes_first_sentences():
+    """Экстрактивное резюме берет первое предложение каждой реплики."""
+    summary = extractive_summary(
+        "Ранее: уровень Знание.",
+        [("user", "Нужен уровень Анализ. Для сварщиков."), ("assistant", "Глаголы: сравнить,\n  выделить. Примеры...")]
+    )
+
+    assert summary == "Ранее: уровень Знание. Пользователь: Нужен уровень Анализ. Ассистент: Глаголы: сравнить, выделить."
+
+
+def test_extractive_summary_keeps_recent_part():
+    """При превышении лимита отбрасывается самое старое."""
+    turns = [("user", f"Реплика {i}.") for i in range(100)]
+
+    summary = extractive_summary(None, turns, max_chars=100)
+
+    assert len(summary) == 100
+    assert summary.startswith("…")
+    assert summary.endswith("Пользователь: Реплика 99.")
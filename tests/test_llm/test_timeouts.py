@@ -0,0 +1,92 @@
+"""Тесты таймаутов запросов по наблюдаемой задержке."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from openai import APITimeoutError
+
+from llm import client as llm_client
+from llm.client import LLMError, send_request
+from llm.timeouts import DEFAULT_TIMEOUT, TIMEOUT_MIN_SAMPLES, AdaptiveTimeouts
+
+
+def fill(timeouts, model, latency, stream=False, count=TIMEOUT_MIN_SAMPLES):
+    for _ in range(count):
+        timeouts.observe(model, latency, stream)
+
+
+class TestAdaptiveTimeouts:
+    """Тесты AdaptiveTimeouts."""
+
+    def test_default_until_enough_samples(self):
+        timeouts = AdaptiveTimeouts(factor=2.0, min_timeout=5, max_timeout=60)
+        fill(timeouts, "fast", 1.0, count=TIMEOUT_MIN_SAMPLES - 1)
+        assert timeouts.timeout("fast") == DEFAULT_TIMEOUT
+
+    def test_percentile_times_factor_within_bounds(self):
+        timeouts = AdaptiveTimeouts(factor=2.0, min_timeout=5, max_timeout=60)
+        fill(timeouts, "medium", 4.0)
+        fill(timeouts, "fast", 0.5)
+        fill(timeouts, "slow", 45.0)
+
+        assert timeouts.timeout("medium") == 8.0
+        assert timeouts.timeout("fast") == 5     # Не ниже min_timeout
+        assert timeouts.timeout("slow") == 60    # Не выше max_timeout
+
+    def test_stream_tracked_separately(self):
+        """Для потока таймаут считается по времени до первого токена."""
+        timeouts = AdaptiveTimeouts(factor=2.0, min_timeout=1, max_timeout=60)
+        fill(timeouts, "model", 10.0)
+        fill(timeouts, "model", 1.0, stream=True)
+
+        assert timeouts.timeout("model") == 20.0
+        assert timeouts.timeout("model", stream=True) == 2.0
+        assert timeouts.snapshot() == {"model": {"request": 20.0, "stream": 2.0}}
+
+    def test_timeouts_raise_estimate(self):
+        """Оборванные запросы пишутся значением таймаута и поднимают p99."""
+        timeouts = AdaptiveTimeouts(factor=2.0, min_timeout=1, max_timeout=60)
+        fill(timeouts, "model", 2.0)
+        assert timeouts.timeout("model") == 4.0
+
+        for _ in range(3):
+            timeouts.observe_timeout("model", timeouts.timeout("model"))
+        assert timeouts.timeout("model") > 4.0
+
+    def test_disabled_uses_default(self):
+        timeouts = AdaptiveTimeouts(enabled=False)
+        fill(timeouts, "model", 1.0)
+        assert timeouts.timeout("model") == DEFAULT_TIMEOUT
+
+
+class TestSendRequestTimeout:
+    """send_request отправляет запрос с таймаутом модели."""
+
+    @pytest.fixture
+    def timeouts(self, monkeypatch):
+        timeouts = AdaptiveTimeouts(factor=2.0, min_timeout=1, max_timeout=60)
+        monkeypatch.setattr(llm_client, "llm_timeouts", timeouts)
+        return timeouts
+
+    async def test_timeout_passed_and_latency_observed(self, timeouts):
+        fill(timeouts, "model", 3.0)
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="Ответ"))]
+        )
+
+        with patch.object(llm_client, "metrics_collector"):
+            assert await send_request(mock_client, [], "model") == "Ответ"
+
+        assert mock_client.chat.completions.create.call_args.kwargs["timeout"] == 6.0
+        assert len(timeouts.latency("model")) == TIMEOUT_MIN_SAMPLES + 1
+
+    async def test_timeout_recorded(self, timeouts):
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create.side_effect = APITimeoutError(request=MagicMock())
+
+        with patch.object(llm_client, "metrics_collector") as metrics:
+            with pytest.raises(LLMError):
+                await send_request(mock_client, [], "model")
+
+        metrics.record_llm_timeout.assert_called_once_with("model")
+        assert timeouts.latency("model").percentile(0.5) == DEFAULT_TIMEOUT
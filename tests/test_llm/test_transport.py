@@ -0,0 +1,56 @@
+"""Тесты HTTP-транспорта OpenRouter."""
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from llm import transport
+from llm.client import create_llm_client
+from monitoring.metrics import metrics_collector
+
+
+def pool_stats():
+    return metrics_collector.get_http_pool_stats().get(transport.POOL_NAME, {"requests": 0, "connections": 0})
+
+
+class TestCreateHttpClient:
+    """Тесты create_http_client."""
+
+    async def test_http2_falls_back_without_h2(self, monkeypatch):
+        monkeypatch.setattr(transport, "http2_available", lambda: False)
+        http_client = transport.create_http_client(max_connections=5, http2=True)
+        try:
+            assert http_client._transport._pool._http2 is False
+            assert http_client._transport._pool._max_connections == 5
+        finally:
+            await http_client.aclose()
+
+    async def test_connection_reuse_recorded(self):
+        """Трассировка отличает новое соединение от взятого из пула."""
+        request = httpx.Request("GET", "https://openrouter.ai/api/v1")
+        await transport._trace_request(request)
+        trace = request.extensions["trace"]
+
+        before = pool_stats()
+        await trace("connection.connect_tcp.started", {})
+        await trace("connection.start_tls.complete", {})
+        await trace("http11.send_request_headers.started", {})
+
+        reused = httpx.Request("GET", "https://openrouter.ai/api/v1")
+        await transport._trace_request(reused)
+        await reused.extensions["trace"]("http11.send_request_headers.started", {})
+
+        after = pool_stats()
+        assert after["connections"] == before["connections"] + 1
+        assert after["requests"] == before["requests"] + 2
+
+
+class TestCreateLlmClientTransport:
+    """create_llm_client с настроенным транспортом."""
+
+    async def test_custom_http_client(self):
+        client = create_llm_client("key", "https://openrouter.ai/api/v1", max_connections=3, http2=False)
+        try:
+            assert client._client._transport._pool._max_connections == 3
+            assert client.max_retries == 0
+        finally:
+            await client.close()
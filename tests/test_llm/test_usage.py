@@ -0,0 +1,100 @@
+"""Тесты учета токенов из ответов API."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from llm import client as llm_client
+from llm.client import generate_response_with_history, send_request, stream_request
+from llm.limiter import request_limiter
+from llm.singleflight import SingleFlight
+from llm.usage import TokenUsage, current_usage_owner, parse_usage, usage_owner
+from monitoring.metrics import MetricsCollector
+
+
+def api_usage(prompt=120, completion=30, cached=None):
+    details = SimpleNamespace(cached_tokens=cached) if cached is not None else None
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, prompt_tokens_details=details)
+
+
+class TestParseUsage:
+    """Тесты parse_usage."""
+
+    def test_parse(self):
+        assert parse_usage(api_usage(cached=100)) == TokenUsage(120, 30, 100)
+        assert parse_usage(api_usage()).total_tokens == 150
+
+    def test_missing_usage(self):
+        assert parse_usage(None) is None
+        assert parse_usage(MagicMock()) is None
+
+    def test_usage_owner_scope(self):
+        with usage_owner(42):
+            assert current_usage_owner() == 42
+        assert current_usage_owner() is None
+
+
+class TestUsageRecording:
+    """send_request и stream_request записывают usage ответа."""
+
+    @pytest.fixture(autouse=True)
+    def unlimited(self):
+        request_limiter.configure()
+        yield
+        request_limiter.configure()
+
+    async def test_send_request_records_usage_for_owner(self):
+        client = AsyncMock()
+        client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Ответ"))],
+            usage=api_usage(cached=64)
+        )
+
+        with patch.object(llm_client, "metrics_collector") as metrics, usage_owner(7):
+            await send_request(client, [], "model")
+
+        model, prompt, completion, cached, duration, user_id = metrics.record_token_usage.call_args.args
+        assert (model, prompt, completion, cached, user_id) == ("model", 120, 30, 64, 7)
+        assert duration >= 0
+
+    async def test_stream_usage_from_final_chunk(self):
+        async def stream():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Ответ"))], usage=None)
+            yield SimpleNamespace(choices=[], usage=api_usage(prompt=50, completion=5))
+
+        client = AsyncMock()
+        client.chat.completions.create.return_value = stream()
+
+        with patch.object(llm_client, "metrics_collector") as metrics:
+            assert await stream_request(client, [], "model", AsyncMock()) == "Ответ"
+
+        assert client.chat.completions.create.call_args.kwargs["stream_options"] == {"include_usage": True}
+        assert metrics.record_token_usage.call_args.args[1:3] == (50, 5)
+        assert metrics.record_token_usage.call_args.args[5] is None
+
+    async def test_coalesced_stream_usage_attributed_to_leader(self):
+        """Со склейкой (по умолчанию) токены относятся к пользователю, запустившему запрос."""
+        async def stream():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Ответ"))], usage=None)
+            await asyncio.sleep(0.02)
+            yield SimpleNamespace(choices=[], usage=api_usage(prompt=50, completion=5))
+
+        client = AsyncMock()
+        client.chat.completions.create.return_value = stream()
+        flights = SingleFlight()
+        collector = MetricsCollector()
+
+        async def call(user_id):
+            with usage_owner(user_id):
+                return await generate_response_with_history(
+                    client, "system", "3", [], "model", "fallback", on_delta=AsyncMock(), flights=flights
+                )
+
+        with patch.object(llm_client, "metrics_collector", collector):
+            assert await asyncio.gather(call(7), call(8)) == ["Ответ", "Ответ"]
+
+        assert client.chat.completions.create.await_count == 1
+        by_user = collector.get_top_token_users()
+        assert list(by_user) == [7]
+        assert by_user[7]["total_tokens"] == 55
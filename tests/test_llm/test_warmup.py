@@ -0,0 +1,82 @@
+"""Тесты прогрева кэша ответов."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from llm.cache import ResponseCache
+from llm.client import LLMError, generate_response_with_history
+from llm.warmup import BLOOM_LEVELS, warm_up_cache
+from monitoring.metrics import metrics_collector
+
+HISTORY = ({"role": "user", "content": "/start"}, {"role": "assistant", "content": "Я - эксперт..."})
+
+
+async def warm(cache, concurrency=2):
+    return await warm_up_cache(cache, AsyncMock(), "system prompt", HISTORY, "model", "fallback", concurrency=concurrency)
+
+
+class TestWarmUpCache:
+    """Тесты warm_up_cache."""
+
+    async def test_all_levels_cached_by_number_and_name(self):
+        """Ответ каждого уровня доступен и по номеру, и по названию."""
+        cache = ResponseCache()
+
+        async def answer(client, messages, model, **params):
+            return f"Ответ: {messages[-1]['content']}"
+
+        with patch('llm.client.send_request', side_effect=answer) as send:
+            assert await warm(cache) == 2 * len(BLOOM_LEVELS)
+
+        assert send.await_count == len(BLOOM_LEVELS)
+        for number, name in BLOOM_LEVELS:
+            by_number, _ = cache.get(cache.make_key("model", "system prompt", number, HISTORY))
+            by_name, _ = cache.get(cache.make_key("model", "system prompt", name.lower(), HISTORY))
+            assert by_number.value == by_name.value == f"Ответ: {name}"
+            assert by_number.warm
+
+    async def test_concurrency_bounded(self):
+        """Одновременно выполняется не больше concurrency запросов."""
+        active = peak = 0
+
+        async def answer(client, messages, model, **params):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return "ответ"
+
+        with patch('llm.client.send_request', side_effect=answer):
+            await warm(ResponseCache(), concurrency=2)
+
+        assert peak == 2
+
+    async def test_failed_level_skipped(self):
+        """Ошибка одного уровня не прерывает прогрев остальных."""
+        async def answer(client, messages, model, **params):
+            if messages[-1]['content'] == "Анализ":
+                raise LLMError("boom")
+            return "ответ"
+
+        cache = ResponseCache()
+        with patch('llm.client.send_request', side_effect=answer), \
+             patch('llm.client.asyncio.sleep', AsyncMock()):
+            assert await warm(cache) == 2 * (len(BLOOM_LEVELS) - 1)
+
+        assert cache.get(cache.make_key("model", "system prompt", "4", HISTORY)) == (None, False)
+
+    async def test_warm_hit_recorded(self):
+        """Ответ из прогретой записи учитывается в метриках отдельно."""
+        cache = ResponseCache()
+        with patch('llm.client.send_request', AsyncMock(return_value="ответ")):
+            await warm(cache)
+
+        warm_hits_before = metrics_collector.get_current_hour_stats()['cache_warm_hits']
+        with patch('llm.client.send_request', AsyncMock()) as send:
+            response = await generate_response_with_history(
+                AsyncMock(), "system prompt", "Синтез", HISTORY, "model", "fallback", cache=cache
+            )
+
+        assert response == "ответ"
+        send.assert_not_awaited()
+        assert metrics_collector.get_current_hour_stats()['cache_warm_hits'] == warm_hits_before + 1
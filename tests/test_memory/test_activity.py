@@ -0,0 +1,68 @@
+"""Тесты счетчиков активных пользователей."""
+from memory.activity import ActivityCounter
+
+MINUTE = 60
+NOW = 1_700_000_000.0
+
+
+class TestActivityCounter:
+    """Тесты минутных корзин активности."""
+
+    def setup_method(self):
+        self.counter = ActivityCounter()
+
+    def test_count_by_window(self):
+        """Пользователи считаются только в окне своей последней активности."""
+        self.counter.touch(1, NOW)
+        self.counter.touch(2, NOW - 10 * MINUTE)
+        self.counter.touch(3, NOW - 2 * 3600)
+
+        assert self.counter.count(5, NOW) == 1
+        assert self.counter.count(60, NOW) == 2
+        assert self.counter.count(24 * 60, NOW) == 3
+
+    def test_touch_moves_user_between_buckets(self):
+        """Повторная активность переносит пользователя, не удваивая счет."""
+        self.counter.touch(1, NOW - 30 * MINUTE)
+        assert self.counter.count(5, NOW) == 0
+        assert self.counter.count(60, NOW) == 1
+
+        self.counter.touch(1, NOW)
+
+        assert self.counter.count(5, NOW) == 1
+        assert self.counter.count(60, NOW) == 1
+
+    def test_window_slides_with_time(self):
+        """Счетчик окна уменьшается, когда активность выпадает из него."""
+        self.counter.touch(1, NOW)
+        self.counter.touch(2, NOW + 3 * MINUTE)
+        assert self.counter.count(5, NOW + 3 * MINUTE) == 2
+
+        assert self.counter.count(5, NOW + 6 * MINUTE) == 1
+        assert self.counter.count(5, NOW + 10 * MINUTE) == 0
+
+    def test_window_slides_after_long_idle(self):
+        """Длинный простой не требует перебора всех пропущенных минут."""
+        self.counter.touch(1, NOW)
+        assert self.counter.count(60, NOW) == 1
+
+        assert self.counter.count(60, NOW + 30 * 24 * 3600) == 0
+
+    def test_remove(self):
+        """Удаленный пользователь не учитывается."""
+        self.counter.touch(1, NOW)
+        self.counter.touch(2, NOW)
+        assert self.counter.count(5, NOW) == 2
+
+        self.counter.remove(1)
+
+        assert self.counter.count(5, NOW) == 1
+        assert self.counter.count(60, NOW) == 1
+
+    def test_rebuild(self):
+        """Перестроение заменяет текущее состояние."""
+        self.counter.touch(1, NOW)
+        self.counter.rebuild([(2, NOW), (3, NOW - 2 * 3600)])
+
+        assert self.counter.count(60, NOW) == 1
+        assert self.counter.count(24 * 60, NOW) == 2
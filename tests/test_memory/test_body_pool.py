@@ -0,0 +1,97 @@
+"""Тесты общего пула текстов сообщений."""
+import sys
+from datetime import datetime, timedelta
+
+from memory.body_pool import BodyPool
+from memory.storage import InMemorySessionStore
+
+LONG_TEXT = "Глаголы действия для уровня Применение: применить, использовать, решить. " * 10
+
+
+def fresh_copy(text):
+    """Строка с тем же содержимым, но отдельным объектом (как ответ из сети)."""
+    return "".join(list(text))
+
+
+class TestBodyPool:
+    """Тесты подсчета ссылок."""
+
+    def test_duplicates_share_one_instance(self):
+        """Одинаковые длинные тексты сводятся к одному экземпляру."""
+        pool = BodyPool()
+        first = pool.acquire(fresh_copy(LONG_TEXT))
+        second = pool.acquire(fresh_copy(LONG_TEXT))
+
+        assert first is second
+        assert len(pool) == 1
+        assert pool.dedup_ratio() == 2.0
+        assert pool.saved_bytes == sys.getsizeof(LONG_TEXT)
+
+    def test_short_texts_not_pooled(self):
+        """Короткие тексты не попадают в пул."""
+        pool = BodyPool()
+        pool.acquire("3")
+        pool.release("3")
+
+        assert len(pool) == 0
+        assert pool.references == 0
+
+    def test_last_release_removes_entry(self):
+        """Текст удаляется из пула после снятия последней ссылки."""
+        pool = BodyPool()
+        pool.acquire(LONG_TEXT)
+        pool.acquire(LONG_TEXT)
+
+        pool.release(LONG_TEXT)
+        assert len(pool) == 1
+        assert pool.saved_bytes == 0
+
+        pool.release(LONG_TEXT)
+        assert len(pool) == 0
+        assert pool.pooled_bytes == 0
+        assert pool.references == 0
+
+
+class TestStoreBodyPool:
+    """Тесты пула в хранилище сессий."""
+
+    def setup_method(self):
+        """Хранилище с одинаковым длинным ответом у трех пользователей."""
+        self.store = InMemorySessionStore({})
+        for user_id in (1, 2, 3):
+            self.store.get_session(user_id, "TestUser")
+            self.store.add_message(user_id, "assistant", fresh_copy(LONG_TEXT), 10)
+
+    def test_sessions_reference_shared_body(self):
+        """Сессии ссылаются на общий экземпляр текста."""
+        bodies = [self.store.sessions[user_id]["history"][0].content for user_id in (1, 2, 3)]
+
+        assert bodies[0] is bodies[1] is bodies[2]
+        stats = self.store.memory_stats()
+        assert stats["body_pool_unique"] == 1
+        assert stats["body_pool_dedup_ratio"] == 3.0
+        assert stats["body_pool_saved_bytes"] == 2 * sys.getsizeof(LONG_TEXT)
+
+    def test_references_released_when_messages_leave(self):
+        """Обрезка, очистка и истечение снимают ссылки с текстов."""
+        self.store.add_message(1, "user", "3", 1)
+        self.store.clear_history(2)
+        self.store.sessions[3]["last_activity"] = datetime.now() - timedelta(hours=2)
+        self.store.rebuild_indexes()
+        self.store.expire(ttl_hours=1, limit=100)
+
+        assert len(self.store.bodies) == 0
+        assert self.store.bodies.references == 0
+
+    def test_restored_sessions_pooled(self):
+        """Сессии, восстановленные из снимка, тоже переходят на общие тексты."""
+        restored = InMemorySessionStore({})
+        restored.get_session(1, "TestUser")
+        restored.add_message(1, "assistant", fresh_copy(LONG_TEXT), 10)
+        sessions = [self.store.sessions[2]]
+        sessions[0]["history"][0].content = fresh_copy(LONG_TEXT)
+
+        restored.restore_sessions(sessions)
+
+        assert restored.sessions[2]["history"][0].content is restored.sessions[1]["history"][0].content
+        assert restored.bodies.references == 2
@@ -0,0 +1,69 @@
+"""Замер памяти на сессию: прежнее и компактное представление истории."""
+import tracemalloc
+from datetime import datetime
+
+import pytest
+
+from memory.storage import InMemorySessionStore
+
+SESSIONS = 200
+ROLES = ("user", "assistant")
+
+
+def build_legacy_sessions(contents, history_size):
+    """Прежнее представление: список словарей с datetime и пересрезом при переполнении."""
+    sessions = {}
+    for user_id in range(SESSIONS):
+        now = datetime.now()
+        session = {
+            "user_id": user_id,
+            "user_name": "TestUser",
+            "history": [],
+            "last_activity": now,
+            "created_at": now
+        }
+        for i, content in enumerate(contents):
+            session["history"].append({"role": ROLES[i % 2], "content": content, "timestamp": datetime.now()})
+            session["last_activity"] = datetime.now()
+            if len(session["history"]) > history_size:
+                session["history"] = session["history"][-history_size:]
+        sessions[user_id] = session
+    return sessions
+
+
+def build_compact_sessions(contents, history_size):
+    """Текущее хранилище: кольцевой буфер записей со __slots__."""
+    store = InMemorySessionStore({})
+    for user_id in range(SESSIONS):
+        store.get_session(user_id, "TestUser")
+        for i, content in enumerate(contents):
+            store.add_message(user_id, ROLES[i % 2], content, history_size)
+    return store
+
+
+def bytes_per_session(build, contents, history_size):
+    """Прирост отслеживаемой памяти на одну сессию."""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = build(contents, history_size)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return (after - before) / SESSIONS
+
+
+@pytest.mark.parametrize("history_size,min_saving", [(10, 0.1), (50, 0.4), (200, 0.4)])
+def test_compact_history_uses_less_memory(history_size, min_saving):
+    """Компактное представление экономит память при 10, 50 и 200 сообщениях."""
+    # Тексты создаются заранее и общие для обоих вариантов: сравнивается только
+    # накладной расход структур, а не сами строки
+    contents = [f"Сообщение {i}: глаголы действия для уровня Применение" for i in range(history_size)]
+
+    legacy = bytes_per_session(build_legacy_sessions, contents, history_size)
+    compact = bytes_per_session(build_compact_sessions, contents, history_size)
+
+    # Замер не пустой: прежнее представление тратит больше 100 байт на сообщение
+    assert legacy > history_size * 100
+    assert 0 < compact <= legacy * (1 - min_saving)
@@ -0,0 +1,146 @@
+"""Тесты снимка сессий для восстановления после перезапуска."""
+from datetime import datetime, timedelta
+
+import asyncio
+
+import pytest
+
+from memory.storage import (
+    InMemorySessionStore,
+    set_session_store,
+    get_session_store,
+    get_user_session,
+    add_message,
+    get_user_history,
+    get_user_summary,
+    get_compaction_batch,
+    apply_history_summary,
+    get_session_stats,
+)
+from memory.snapshot import read_snapshot, write_snapshot, save_session_snapshot, load_session_snapshot
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Путь к временному снимку."""
+    return str(tmp_path / "data" / "sessions.snapshot")
+
+
+@pytest.fixture(autouse=True)
+def fresh_store():
+    """Пустое хранилище в памяти на время теста."""
+    set_session_store(InMemorySessionStore({}))
+    yield
+    set_session_store(InMemorySessionStore())
+
+
+def restart():
+    """Новое пустое хранилище, как после перезапуска процесса."""
+    set_session_store(InMemorySessionStore({}))
+
+
+async def test_sessions_survive_restart(snapshot_path):
+    """История, резюме и токены восстанавливаются из снимка."""
+    get_user_session(123, "TestUser")
+    for i in range(4):
+        add_message(123, "user", f"Message {i}", 10)
+    _, folded = get_compaction_batch(123, 2)
+    apply_history_summary(123, "Резюме", folded)
+    get_user_session(456, "Other")
+    tokens = [m.tokens for m in get_session_store().sessions[123]["history"]]
+
+    await save_session_snapshot(snapshot_path)
+    restart()
+    assert await load_session_snapshot(snapshot_path, ttl_hours=24) == 2
+
+    assert [m["content"] for m in get_user_history(123)] == ["Message 2", "Message 3"]
+    assert [m.tokens for m in get_session_store().sessions[123]["history"]] == tokens
+    assert get_user_summary(123).text == "Резюме"
+    assert get_user_session(123, "TestUser")["user_name"] == "TestUser"
+    assert get_session_stats()["total_sessions"] == 2
+
+
+def test_expired_sessions_skipped(snapshot_path):
+    """Сессии, истекшие по TTL, не загружаются."""
+    store = get_session_store()
+    get_user_session(123, "OldUser")
+    get_user_session(456, "ActiveUser")
+    store.sessions[123]["last_activity"] = datetime.now() - timedelta(hours=25)
+
+    write_snapshot(snapshot_path, store.snapshot_sessions())
+
+    assert [s["user_id"] for s in read_snapshot(snapshot_path, ttl_hours=24)] == [456]
+
+
+def test_restored_sessions_expire(snapshot_path):
+    """Восстановленные сессии попадают в индекс истечения."""
+    store = get_session_store()
+    get_user_session(123, "TestUser")
+    store.sessions[123]["last_activity"] = datetime.now() - timedelta(hours=2)
+    write_snapshot(snapshot_path, store.snapshot_sessions())
+
+    restart()
+    restored = get_session_store()
+    restored.restore_sessions(read_snapshot(snapshot_path, ttl_hours=24))
+
+    assert restored.expire(ttl_hours=1, limit=100) == 1
+    assert restored.session_count() == 0
+
+
+def test_live_sessions_not_overwritten(snapshot_path):
+    """Сессия, созданная до загрузки снимка, не заменяется данными из него."""
+    get_user_session(123, "TestUser")
+    add_message(123, "user", "Old", 10)
+    write_snapshot(snapshot_path, get_session_store().snapshot_sessions())
+
+    restart()
+    get_user_session(123, "TestUser")
+    add_message(123, "user", "New", 10)
+
+    assert get_session_store().restore_sessions(read_snapshot(snapshot_path, ttl_hours=24)) == 0
+    assert get_user_history(123) == [{"role": "user", "content": "New"}]
+
+
+def test_many_sessions_span_frames(snapshot_path):
+    """Снимок из нескольких кадров читается целиком."""
+    store = get_session_store()
+    for user_id in range(2500):
+        store.get_session(user_id, f"user{user_id}")
+        store.add_message(user_id, "user", f"Message {user_id}", 10)
+
+    assert write_snapshot(snapshot_path, store.snapshot_sessions()) == 2500
+
+    sessions = read_snapshot(snapshot_path, ttl_hours=24)
+    assert len(sessions) == 2500
+    assert sessions[-1]["history"][0].content == "Message 2499"
+
+
+def test_missing_snapshot_is_empty(snapshot_path):
+    """Отсутствующий снимок - обычный первый запуск."""
+    assert read_snapshot(snapshot_path, ttl_hours=24) == []
+
+
+async def test_corrupted_snapshot_starts_empty(snapshot_path, tmp_path):
+    """Поврежденный снимок не мешает запуску."""
+    path = tmp_path / "broken.snapshot"
+    path.write_bytes(b"not a snapshot at all")
+
+    assert await load_session_snapshot(str(path), ttl_hours=24) == 0
+    assert get_session_store().session_count() == 0
+
+
+async def test_snapshot_copied_before_writing(snapshot_path, monkeypatch):
+    """Изменения сессий во время записи не попадают в уже снятую копию."""
+    get_user_session(123, "TestUser")
+    add_message(123, "user", "До снимка", 10)
+    real_to_thread = asyncio.to_thread
+
+    async def to_thread(func, *args):
+        add_message(123, "user", "Во время записи", 10)
+        return await real_to_thread(func, *args)
+
+    monkeypatch.setattr("memory.snapshot.asyncio.to_thread", to_thread)
+    await save_session_snapshot(snapshot_path)
+
+    [session] = read_snapshot(snapshot_path, ttl_hours=24)
+    assert [m.content for m in session["history"]] == ["До снимка"]
@@ -0,0 +1,177 @@
+"""Тесты бюджета памяти сессий и выгрузки на диск."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from memory.storage import InMemorySessionStore, session_bytes
+from memory.spill import SessionSpill
+from memory.sqlite_store import SQLiteSessionStore
+
+
+@pytest.fixture
+def spill(tmp_path):
+    """Файл выгрузки на время теста."""
+    spill = SessionSpill(str(tmp_path / "sessions.spill"))
+    yield spill
+    spill.close()
+
+
+def fill(store, users, text="Глаголы действия для уровня Применение " * 20):
+    """Создание сессий с одним сообщением, от давних к свежим."""
+    for user_id in users:
+        store.get_session(user_id, f"user{user_id}")
+        store.add_message(user_id, "user", text, 10)
+
+
+class TestMemoryAccounting:
+    """Тесты учета размера сессий."""
+
+    def test_bytes_tracked_incrementally(self):
+        """Инкрементальный учет совпадает с полным пересчетом."""
+        store = InMemorySessionStore({})
+        store.get_session(123, "TestUser")
+        for i in range(15):
+            store.add_message(123, "user", f"Message {i} " * (i + 1), 10)
+        tracked = store.memory_bytes
+
+        store.rebuild_indexes()
+
+        assert tracked == store.memory_bytes == session_bytes(store.sessions[123])
+
+    def test_bytes_released_on_clear_and_expire(self):
+        """Очистка и истечение уменьшают учтенный размер."""
+        store = InMemorySessionStore({})
+        fill(store, [1, 2])
+        before = store.memory_bytes
+
+        store.clear_history(1)
+        assert store.memory_bytes < before
+
+        store.sessions[2]["last_activity"] = datetime.now() - timedelta(hours=2)
+        store.rebuild_indexes()
+        store.expire(ttl_hours=1, limit=100)
+        assert store.memory_bytes == session_bytes(store.sessions[1])
+
+    def test_budget_ignored_without_spill(self):
+        """Без файла выгрузки бюджет не теряет сессии."""
+        store = InMemorySessionStore({}, memory_budget_bytes=1)
+        fill(store, range(10))
+
+        assert store.session_count() == 10
+
+
+class TestSpill:
+    """Тесты вытеснения и возврата сессий."""
+
+    def test_least_recent_sessions_spilled(self, spill):
+        """При превышении бюджета на диск уходят давно неактивные сессии."""
+        store = InMemorySessionStore({}, spill=spill)
+        fill(store, range(10))
+        store.memory_budget_bytes = store.memory_bytes // 2
+
+        fill(store, [10])
+
+        assert store.memory_bytes <= store.memory_budget_bytes
+        assert 0 not in store.sessions
+        assert 10 in store.sessions and 9 in store.sessions
+        assert len(spill) == 11 - store.session_count()
+
+    def test_spilled_session_rehydrated(self, spill):
+        """Вытесненная сессия прозрачно возвращается при обращении."""
+        store = InMemorySessionStore({}, spill=spill)
+        store.get_session(1, "OldUser")
+        store.add_message(1, "user", "Hello", 10)
+        store.add_message(1, "assistant", "Hi!", 10)
+        fill(store, range(2, 10))
+        store.memory_budget_bytes = store.memory_bytes - 1
+        fill(store, [10])
+        assert 1 not in store.sessions
+
+        session = store.get_session(1, "OldUser")
+
+        assert [m.content for m in session["history"]] == ["Hello", "Hi!"]
+        assert store.get_history(1) == [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi!"}]
+        stats = store.memory_stats()
+        assert stats["evictions"] >= 1
+        assert stats["rehydrations"] == 1
+        assert stats["rehydration_avg_ms"] > 0
+
+    def test_current_session_not_evicted(self, spill):
+        """Сессия, с которой идет работа, не вытесняется даже сверх бюджета."""
+        store = InMemorySessionStore({}, memory_budget_bytes=1, spill=spill)
+
+        fill(store, [1])
+
+        assert 1 in store.sessions
+
+    def test_spilled_sessions_expire(self, spill):
+        """Истекшие сессии удаляются и из файла выгрузки."""
+        store = InMemorySessionStore({}, spill=spill)
+        fill(store, [1])
+        store.sessions[1]["last_activity"] = datetime.now() - timedelta(hours=2)
+        store.rebuild_indexes()
+        store.memory_budget_bytes = 1
+        fill(store, [2])
+        assert len(spill) == 1
+
+        assert store.purge_offloaded(ttl_hours=1) == 1
+
+        assert len(spill) == 0
+        assert store.get_history(1) == []
+
+    def test_spill_count_tracked(self, tmp_path):
+        """Счетчик записей совпадает с таблицей и переживает переоткрытие файла."""
+        path = str(tmp_path / "sessions.spill")
+        spill = SessionSpill(path)
+        store = InMemorySessionStore({}, spill=spill)
+        fill(store, range(10))
+        store.memory_budget_bytes = store.memory_bytes // 2
+        fill(store, [10])
+        spill.put([store.sessions[10]])
+        spill.put([store.sessions[10]])
+        spill.take(10)
+        spill.take(0)
+
+        count = spill._conn.execute("SELECT COUNT(*) FROM spill").fetchone()[0]
+        assert len(spill) == count == 10 - store.session_count()
+        assert store.memory_stats()["spilled_sessions"] == count
+        spill.close()
+
+        reopened = SessionSpill(path)
+        assert len(reopened) == count
+        reopened.close()
+
+
+def test_sqlite_store_evicts_without_spill(tmp_path):
+    """SQLite-бэкенд вытесняет сессии из памяти и подгружает их из базы."""
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), sessions={}, flush_interval=0.01)
+    try:
+        fill(store, range(5))
+        store.memory_budget_bytes = store.memory_bytes // 2
+        fill(store, [5])
+        assert 0 not in store.sessions
+
+        assert len(store.get_history(0)) == 1
+    finally:
+        store.close()
+
+
+def test_sqlite_store_eviction_does_not_flush(tmp_path):
+    """Вытеснение и подгрузка не ждут записи; подгрузка видит изменения, стоявшие в очереди."""
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), sessions={}, flush_interval=0.01)
+    try:
+        fill(store, range(5))
+        store.flush = lambda timeout=None: pytest.fail("event loop must not wait for the writer")
+        store.memory_budget_bytes = store.memory_bytes // 2
+        fill(store, [5])
+        assert 0 not in store.sessions and 0 in store._unsynced
+
+        store.memory_budget_bytes = 0
+        assert len(store.get_history(0)) == 1
+        assert 0 in store.sessions and 0 not in store._unsynced
+
+        del store.flush
+        store.flush()
+        assert not store._unsynced
+    finally:
+        store.close()
@@ -0,0 +1,196 @@
+"""Тесты хранилища сессий на SQLite."""
+import sqlite3
+
+import pytest
+from datetime import datetime, timedelta
+
+from memory import storage
+from memory.storage import (
+    InMemorySessionStore,
+    init_session_store,
+    set_session_store,
+    get_user_session,
+    add_message,
+    get_user_history,
+    clear_user_history,
+    cleanup_old_sessions,
+    get_compaction_batch,
+    apply_history_summary,
+    get_user_summary,
+)
+from memory.sqlite_store import SQLiteSessionStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Путь к временной базе сессий."""
+    return str(tmp_path / "sessions.db")
+
+
+@pytest.fixture
+def store(db_path):
+    """Хранилище SQLite, активное на время теста."""
+    store = SQLiteSessionStore(db_path, sessions={}, flush_interval=0.01)
+    set_session_store(store)
+    yield store
+    store.close()
+    set_session_store(InMemorySessionStore())
+
+
+def reopen(store, db_path):
+    """Закрытие хранилища и открытие новой копии над той же базой (рестарт)."""
+    store.close()
+    reopened = SQLiteSessionStore(db_path, sessions={}, flush_interval=0.01)
+    set_session_store(reopened)
+    return reopened
+
+
+class TestSQLiteSessionStore:
+    """Тесты персистентности и отложенной записи."""
+
+    def test_history_survives_restart(self, store, db_path):
+        """История восстанавливается после перезапуска процесса."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        add_message(123, "assistant", "Hi!", 10)
+
+        reopened = reopen(store, db_path)
+        try:
+            assert get_user_history(123) == [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "Hi!"},
+            ]
+            assert get_user_session(123, "TestUser")["user_name"] == "TestUser"
+        finally:
+            reopened.close()
+
+    def test_trim_is_persisted(self, store, db_path):
+        """Обрезка истории по лимиту сохраняется в базе."""
+        get_user_session(123, "TestUser")
+        for i in range(15):
+            add_message(123, "user", f"Message {i}", 10)
+
+        reopened = reopen(store, db_path)
+        try:
+            history = get_user_history(123)
+            assert len(history) == 10
+            assert history[0]["content"] == "Message 5"
+            assert history[-1]["content"] == "Message 14"
+        finally:
+            reopened.close()
+
+    def test_clear_is_persisted(self, store, db_path):
+        """Очистка истории сохраняется в базе."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        clear_user_history(123)
+
+        reopened = reopen(store, db_path)
+        try:
+            assert get_user_history(123) == []
+        finally:
+            reopened.close()
+
+    def test_summary_is_persisted(self, store, db_path):
+        """Резюме и обрезка свернутых сообщений сохраняются в базе."""
+        get_user_session(123, "TestUser")
+        for i in range(5):
+            add_message(123, "user", f"Message {i}", 10)
+        _, folded = get_compaction_batch(123, 2)
+        apply_history_summary(123, "Резюме", folded)
+        folded_tokens = get_user_summary(123).folded_tokens
+
+        reopened = reopen(store, db_path)
+        try:
+            assert [m["content"] for m in get_user_history(123)] == ["Message 3", "Message 4"]
+            assert get_user_summary(123).text == "Резюме"
+            assert get_user_summary(123).folded_tokens == folded_tokens
+        finally:
+            reopened.close()
+
+    def test_old_schema_is_migrated(self, db_path):
+        """База без колонок резюме дополняется при открытии."""
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE sessions (user_id INTEGER PRIMARY KEY, user_name TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_activity REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO sessions VALUES (123, 'TestUser', 0, 0)")
+        conn.commit()
+        conn.close()
+
+        store = SQLiteSessionStore(db_path, sessions={}, flush_interval=0.01)
+        try:
+            assert store.get_summary(123) is None
+            assert store.get_session(123, "TestUser")["summary"] is None
+        finally:
+            store.close()
+
+    def test_cleanup_removes_sessions_from_db(self, store, db_path):
+        """Истекшие сессии удаляются и из памяти, и из базы."""
+        session = get_user_session(123, "OldUser")
+        add_message(123, "user", "Hello", 10)
+        get_user_session(456, "ActiveUser")
+        session["last_activity"] = datetime.now() - timedelta(hours=2)
+        store.rebuild_indexes()
+
+        assert cleanup_old_sessions(ttl_hours=1) == 1
+
+        reopened = reopen(store, db_path)
+        try:
+            assert get_user_history(123) == []
+            assert reopened._load_session(123) is None
+            assert reopened._load_session(456) is not None
+        finally:
+            reopened.close()
+
+    def test_evicted_sessions_purged_from_db(self, store, db_path):
+        """Истекшая сессия, вытесненная из памяти, удаляется из базы без участия кучи."""
+        session = get_user_session(123, "OldUser")
+        add_message(123, "user", "Hello", 10)
+        session["last_activity"] = datetime.now() - timedelta(hours=2)
+        store.rebuild_indexes()
+        store._on_session_touched(session)
+        get_user_session(456, "ActiveUser")
+        store.memory_budget_bytes = 1
+        add_message(456, "user", "Hi", 10)
+        assert 123 not in store.sessions
+        assert not store.has_expired(ttl_hours=1)
+
+        store.purge_offloaded(ttl_hours=1)
+
+        assert store.flush(timeout=5)
+        assert store._load_session(123) is None
+        assert store._load_session(456) is not None
+
+    def test_writes_are_batched_in_background(self, store):
+        """Запись выполняется фоновым потоком, flush дожидается ее."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+
+        assert store.flush(timeout=5)
+        count = store._reader.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        assert count == 1
+
+
+class TestInitSessionStore:
+    """Тесты выбора бэкенда."""
+
+    def teardown_method(self):
+        set_session_store(InMemorySessionStore())
+
+    def test_init_memory_backend(self):
+        store = init_session_store("memory")
+        assert isinstance(store, InMemorySessionStore)
+        assert storage.get_session_store() is store
+
+    def test_init_sqlite_backend(self, db_path):
+        store = init_session_store("sqlite", db_path)
+        try:
+            assert isinstance(store, SQLiteSessionStore)
+        finally:
+            store.close()
+
+    def test_init_unknown_backend(self):
+        with pytest.raises(ValueError):
+            init_session_store("redis")
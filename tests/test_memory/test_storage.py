@@ -1,16 +1,43 @@
 """Тесты системы памяти диалогов."""
+import asyncio
 import pytest
 import time
+from datetime import datetime, timedelta
 from unittest.mock import patch
 from src.memory.storage import (
     get_user_session, 
     add_message, 
     get_user_history, 
+    get_user_history_view,
+    get_user_context,
+    get_user_summary,
+    history_needs_compaction,
+    get_compaction_batch,
+    apply_history_summary,
+    clear_user_history,
     start_cleanup_task,
+    expire_sessions,
+    cleanup_old_sessions,
+    get_session_store,
+    get_session_stats,
+    set_session_store,
+    InMemorySessionStore,
+    SessionStore,
+    SUMMARY_PREFIX,
     user_sessions
 )
 
 
+def test_session_store_is_abstract():
+    """Бэкенд без реализации обязательных методов не создается."""
+    class PartialStore(SessionStore):
+        def get_session(self, user_id, user_name):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
 class TestUserSessions:
     """Тесты управления сессиями пользователей."""
     
@@ -256,3 +283,370 @@ class TestMessageFormat:
         # Проверяем что сообщения упорядочены по времени
         for i in range(len(messages) - 1):
             assert messages[i]['timestamp'] <= messages[i + 1]['timestamp']
+
+
+class TestExpiryIndex:
+    """Тесты индекса истечения сессий."""
+
+    def setup_method(self):
+        """Очистка состояния перед каждым тестом."""
+        user_sessions.clear()
+        get_session_store().rebuild_indexes()
+
+    def make_stale(self, *user_ids, hours=2):
+        """Состаривание сессий в обход API с перестроением индекса."""
+        for user_id in user_ids:
+            user_sessions[user_id]["last_activity"] = datetime.now() - timedelta(hours=hours)
+        get_session_store().rebuild_indexes()
+
+    def test_expire_removes_only_expired(self):
+        """Удаляются только сессии старше TTL."""
+        for user_id in (1, 2, 3):
+            get_user_session(user_id, f"User{user_id}")
+        self.make_stale(1, 2)
+
+        assert expire_sessions(ttl_hours=1, limit=10) == 2
+        assert list(user_sessions) == [3]
+
+    def test_expire_is_bounded(self):
+        """За один шаг удаляется не больше limit сессий."""
+        for user_id in range(5):
+            get_user_session(user_id, f"User{user_id}")
+        self.make_stale(*range(5))
+
+        assert expire_sessions(ttl_hours=1, limit=2) == 2
+        assert get_session_store().has_expired(ttl_hours=1)
+        assert cleanup_old_sessions(ttl_hours=1) == 3
+        assert not get_session_store().has_expired(ttl_hours=1)
+
+    def test_get_user_session_refresh_keeps_session(self):
+        """Обновление активности через get_user_session продлевает сессию."""
+        get_user_session(123, "TestUser")
+        self.make_stale(123)
+
+        get_user_session(123, "TestUser")
+
+        assert expire_sessions(ttl_hours=1, limit=10) == 0
+        assert 123 in user_sessions
+        assert not get_session_store().has_expired(ttl_hours=1)
+
+    def test_add_message_refresh_keeps_session(self):
+        """Обновление активности через add_message продлевает сессию."""
+        get_user_session(123, "TestUser")
+        self.make_stale(123)
+
+        add_message(123, "user", "Hello", 10)
+
+        assert expire_sessions(ttl_hours=1, limit=10) == 0
+        assert 123 in user_sessions
+
+    @pytest.mark.asyncio
+    async def test_cleanup_task_expires_in_slices(self):
+        """Фоновая задача удаляет истекшие сессии порциями."""
+        for user_id in range(5):
+            get_user_session(user_id, f"User{user_id}")
+        self.make_stale(*range(5))
+        get_user_session(99, "Active")
+
+        task = asyncio.create_task(start_cleanup_task(
+            ttl_hours=1, expiry_interval_seconds=0.01, expiry_batch_size=2
+        ))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        assert list(user_sessions) == [99]
+
+
+class TestSessionStats:
+    """Тесты статистики сессий."""
+
+    def setup_method(self):
+        """Свежее хранилище перед каждым тестом."""
+        user_sessions.clear()
+        set_session_store(InMemorySessionStore(user_sessions))
+
+    def test_active_users_windows(self):
+        """Активные пользователи считаются по окнам 5м/1ч/24ч."""
+        get_user_session(1, "Now")
+        get_user_session(2, "HalfHourAgo")
+        get_user_session(3, "TwoHoursAgo")
+        user_sessions[2]["last_activity"] = datetime.now() - timedelta(minutes=30)
+        user_sessions[3]["last_activity"] = datetime.now() - timedelta(hours=2)
+        get_session_store().rebuild_indexes()
+
+        stats = get_session_stats()
+
+        assert stats["total_sessions"] == 3
+        assert stats["active_users_5m"] == 1
+        assert stats["active_users"] == 2
+        assert stats["active_users_24h"] == 3
+
+    def test_stats_follow_activity_and_expiry(self):
+        """Статистика обновляется при активности и истечении сессий."""
+        get_user_session(1, "User")
+        user_sessions[1]["last_activity"] = datetime.now() - timedelta(hours=2)
+        get_session_store().rebuild_indexes()
+        assert get_session_stats()["active_users"] == 0
+
+        add_message(1, "user", "Hello", 10)
+        assert get_session_stats()["active_users"] == 1
+
+        user_sessions[1]["last_activity"] = datetime.now() - timedelta(hours=30)
+        get_session_store().rebuild_indexes()
+        cleanup_old_sessions(ttl_hours=24)
+        stats = get_session_stats()
+        assert {key: stats[key] for key in ("total_sessions", "active_users", "active_users_5m", "active_users_24h")} == {
+            "total_sessions": 0,
+            "active_users": 0,
+            "active_users_5m": 0,
+            "active_users_24h": 0
+        }
+        assert stats["memory_bytes"] == 0
+
+
+class TestRingBufferHistory:
+    """Тесты кольцевого буфера истории."""
+
+    def setup_method(self):
+        """Очистка состояния перед каждым тестом."""
+        user_sessions.clear()
+
+    def test_history_is_bounded_ring_buffer(self):
+        """История ограничена maxlen и вытесняет самые старые сообщения."""
+        get_user_session(123, "TestUser")
+        for i in range(15):
+            add_message(123, "user", f"Message {i}", 10)
+
+        history = user_sessions[123]["history"]
+        assert history.maxlen == 10
+        assert [m.content for m in history] == [f"Message {i}" for i in range(5, 15)]
+
+    def test_message_record_has_float_timestamp(self):
+        """Запись сообщения хранит время как float и не имеет __dict__."""
+        get_user_session(123, "TestUser")
+        add_message(123, "assistant", "Hi!", 10)
+
+        message = user_sessions[123]["history"][0]
+        assert message.role == "assistant"
+        assert message.content == "Hi!"
+        assert isinstance(message.timestamp, float)
+        assert not hasattr(message, "__dict__")
+
+    def test_history_limit_change_keeps_latest(self):
+        """Смена лимита истории сохраняет последние сообщения."""
+        get_user_session(123, "TestUser")
+        for i in range(5):
+            add_message(123, "user", f"Message {i}", 10)
+        add_message(123, "user", "Message 5", 3)
+
+        assert [m["content"] for m in get_user_history(123)] == ["Message 3", "Message 4", "Message 5"]
+
+
+class TestHistoryView:
+    """Тесты готового представления истории для LLM."""
+
+    def setup_method(self):
+        """Свежее хранилище перед каждым тестом."""
+        user_sessions.clear()
+        set_session_store(InMemorySessionStore(user_sessions))
+
+    def test_view_is_cached_between_calls(self):
+        """Повторный вызов без изменений возвращает тот же объект."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+
+        assert get_user_history_view(123) is get_user_history_view(123)
+
+    def test_view_updated_on_append_and_evict(self):
+        """Представление обновляется при добавлении и вытеснении сообщений."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Message 0", 3)
+        first = get_user_history_view(123)
+
+        for i in range(1, 5):
+            add_message(123, "user", f"Message {i}", 3)
+
+        view = get_user_history_view(123)
+        assert [m["content"] for m in view] == ["Message 2", "Message 3", "Message 4"]
+        assert view[0] is not first[0]
+        assert get_user_history(123) == list(view)
+
+    def test_view_reuses_message_dicts(self):
+        """Добавление не пересоздает словари уже имеющихся сообщений."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        before = get_user_history_view(123)
+
+        add_message(123, "assistant", "Hi!", 10)
+
+        after = get_user_history_view(123)
+        assert after[0] is before[0]
+        assert after[1] == {"role": "assistant", "content": "Hi!"}
+
+    def test_view_cleared(self):
+        """Очистка истории очищает представление."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        get_user_history_view(123)
+
+        clear_user_history(123)
+
+        assert get_user_history_view(123) == ()
+
+    def test_view_is_read_only(self):
+        """Представление и его сообщения нельзя изменить."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        view = get_user_history_view(123)
+
+        with pytest.raises(TypeError):
+            view[0]["content"] = "Changed"
+        with pytest.raises(TypeError):
+            view[0].update(content="Changed")
+        assert get_user_history(123)[0]["content"] == "Hello"
+
+        copy = view[0].copy()
+        copy["content"] = "Changed"
+        assert view[0]["content"] == "Hello"
+
+    def test_view_cache_is_bounded(self):
+        """Готовые представления хранятся только для последних активных сессий."""
+        store = InMemorySessionStore(user_sessions, view_cache_size=2)
+        set_session_store(store)
+        for user_id in (1, 2, 3):
+            get_user_session(user_id, f"User{user_id}")
+            add_message(user_id, "user", "Hello", 10)
+            get_user_history_view(user_id)
+
+        assert list(store._views) == [2, 3]
+        assert get_user_history_view(1) == ({"role": "user", "content": "Hello"},)
+
+
+class TestTokenBudgetContext:
+    """Тесты обрезки контекста по бюджету токенов."""
+
+    def setup_method(self):
+        """Свежее хранилище перед каждым тестом."""
+        user_sessions.clear()
+        set_session_store(InMemorySessionStore(user_sessions))
+
+    def test_token_count_cached_on_message(self):
+        """Оценка токенов считается один раз при сохранении сообщения."""
+        get_user_session(123, "TestUser")
+        add_message(123, "assistant", "Анализ " * 100, 10)
+
+        message = user_sessions[123]["history"][0]
+        assert message.tokens > 100
+
+    def test_context_fits_budget(self):
+        """В контекст попадают последние сообщения в пределах бюджета."""
+        get_user_session(123, "TestUser")
+        add_message(123, "assistant", "Длинный ответ " * 200, 10)
+        add_message(123, "user", "3", 10)
+        add_message(123, "assistant", "Короткий ответ", 10)
+        tokens = [m.tokens for m in user_sessions[123]["history"]]
+
+        context = get_user_context(123, tokens[1] + tokens[2])
+
+        assert [m["content"] for m in context] == ["3", "Короткий ответ"]
+
+    def test_context_whole_history_when_budget_allows(self):
+        """При достаточном бюджете возвращается вся история без копирования."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+        add_message(123, "assistant", "Hi!", 10)
+
+        assert get_user_context(123, 10_000) is get_user_history_view(123)
+
+    def test_context_empty_when_budget_exhausted(self):
+        """Нулевой или отрицательный бюджет дает пустой контекст."""
+        get_user_session(123, "TestUser")
+        add_message(123, "user", "Hello", 10)
+
+        assert get_user_context(123, 0) == ()
+        assert get_user_context(123, -100) == ()
+        assert get_user_context(999, 100) == ()
+
+
+class TestHistorySummary:
+    """Тесты сворачивания ранней истории в резюме."""
+
+    def setup_method(self):
+        """Свежее хранилище с шестью сообщениями перед каждым тестом."""
+        user_sessions.clear()
+        set_session_store(InMemorySessionStore(user_sessions))
+        get_user_session(123, "TestUser")
+        for i in range(6):
+            add_message(123, "user" if i % 2 == 0 else "assistant", f"Сообщение {i} " * 20, 10)
+
+    def test_needs_compaction_by_threshold(self):
+        """Сворачивание нужно, только если история длиннее порога и длиннее keep_recent."""
+        total = sum(m.tokens for m in user_sessions[123]["history"])
+
+        assert history_needs_compaction(123, total - 1, 2)
+        assert not history_needs_compaction(123, total, 2)
+        assert not history_needs_compaction(123, 0, 6)
+        assert not history_needs_compaction(999, 0, 0)
+
+    def test_apply_summary_replaces_folded_messages(self):
+        """Свернутые сообщения заменяются резюме в начале контекста."""
+        previous, folded = get_compaction_batch(123, 2)
+        assert previous is None
+        assert len(folded) == 4
+
+        assert apply_history_summary(123, "Обсуждали уровень Анализ", folded)
+
+        context = get_user_context(123, 10_000)
+        assert len(context) == 3
+        assert context[0] == {"role": "system", "content": SUMMARY_PREFIX + "Обсуждали уровень Анализ"}
+        assert context[1]["content"].startswith("Сообщение 4")
+        assert len(user_sessions[123]["history"]) == 2
+
+        summary = get_user_summary(123)
+        assert summary.folded_tokens == sum(m.tokens for m in folded)
+        assert summary.saved_tokens == summary.folded_tokens - summary.tokens
+
+    def test_summary_rolls_over_previous(self):
+        """Повторное сворачивание передает прежнее резюме и накапливает свернутые токены."""
+        _, folded = get_compaction_batch(123, 4)
+        apply_history_summary(123, "Первое резюме", folded)
+        first = get_user_summary(123).folded_tokens
+
+        previous, folded = get_compaction_batch(123, 1)
+        assert previous == "Первое резюме"
+        apply_history_summary(123, "Второе резюме", folded)
+
+        assert get_user_summary(123).folded_tokens == first + sum(m.tokens for m in folded)
+
+    def test_stale_batch_is_discarded(self):
+        """Резюме не применяется, если история изменилась во время его построения."""
+        _, folded = get_compaction_batch(123, 2)
+        for i in range(5):
+            add_message(123, "user", f"Новое {i}", 10)
+
+        assert not apply_history_summary(123, "Устаревшее резюме", folded)
+        assert get_user_summary(123) is None
+        assert len(user_sessions[123]["history"]) == 10
+
+    def test_summary_dropped_when_over_budget(self):
+        """Резюме не попадает в контекст, если не помещается в бюджет."""
+        _, folded = get_compaction_batch(123, 2)
+        apply_history_summary(123, "Резюме " * 50, folded)
+        summary_tokens = get_user_summary(123).tokens
+
+        context = get_user_context(123, summary_tokens - 1)
+        assert all(m["role"] != "system" for m in context)
+
+    def test_clear_history_drops_summary(self):
+        """Очистка истории удаляет и резюме."""
+        _, folded = get_compaction_batch(123, 2)
+        apply_history_summary(123, "Резюме", folded)
+
+        clear_user_history(123)
+
+        assert get_user_summary(123) is None
+        assert get_user_context(123, 10_000) == ()
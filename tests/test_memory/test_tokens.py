@@ -0,0 +1,21 @@
+"""Тесты локальной оценки токенов."""
+from memory.tokens import estimate_tokens, estimate_message_tokens, MESSAGE_OVERHEAD_TOKENS
+
+
+class TestEstimateTokens:
+    """Тесты оценки количества токенов."""
+
+    def test_empty_text(self):
+        assert estimate_tokens("") == 0
+        assert estimate_message_tokens("") == MESSAGE_OVERHEAD_TOKENS
+
+    def test_grows_with_length(self):
+        assert estimate_tokens("3") < estimate_tokens("Анализ") < estimate_tokens("Анализ " * 100)
+
+    def test_cyrillic_is_estimated_conservatively(self):
+        """Кириллица занимает больше токенов, чем латиница той же длины."""
+        assert estimate_tokens("Применение" * 10) > estimate_tokens("Applicatio" * 10)
+
+    def test_message_overhead(self):
+        text = "Hello, world"
+        assert estimate_message_tokens(text) == estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
@@ -184,3 +184,167 @@ class TestMetricsCollector:
         assert any("Почасовая статистика" in msg for msg in log_messages)
         assert any("Сообщений: 1" in msg for msg in log_messages)
         assert any("LLM запросов: 1" in msg for msg in log_messages)
+
+
+class TestSummaryMetrics:
+    """Тесты метрик резюме диалога."""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом."""
+        self.collector = MetricsCollector()
+
+    def test_summary_hits_and_misses(self):
+        """Попадания копят сэкономленные токены, промахи считаются отдельно."""
+        self.collector.record_summary_usage(hit=True, tokens_saved=120)
+        self.collector.record_summary_usage(hit=True, tokens_saved=30)
+        self.collector.record_summary_usage(hit=False)
+        self.collector.record_summary_compaction(folded_messages=6)
+
+        stats = self.collector.get_current_hour_stats()
+        assert stats['summary_hits'] == 2
+        assert stats['summary_misses'] == 1
+        assert stats['summary_tokens_saved'] == 150
+        assert stats['summary_compactions'] == 1
+
+    def test_recording_after_cleanup(self):
+        """После очистки старых метрик почасовая статистика продолжает создаваться."""
+        self.collector.get_hourly_stats()
+        self.collector.record_summary_usage(hit=False)
+
+        assert self.collector.get_current_hour_stats()['summary_misses'] == 1
+
+
+class TestResponseCacheMetrics:
+    """Тесты метрик кэша ответов."""
+
+    def test_hit_ratio_and_latency_saved(self):
+        """Доля попаданий и сэкономленное время считаются по часу."""
+        collector = MetricsCollector()
+        collector.record_response_cache(hit=True, latency_saved=2.5)
+        collector.record_response_cache(hit=True, latency_saved=1.5, stale=True)
+        collector.record_response_cache(hit=False)
+
+        stats = collector.get_current_hour_stats()
+        assert stats['cache_hits'] == 2
+        assert stats['cache_stale_hits'] == 1
+        assert stats['cache_misses'] == 1
+        assert stats['cache_latency_saved'] == 4.0
+        assert collector.get_cache_hit_ratio() == pytest.approx(2 / 3)
+
+
+class TestCacheWarmupMetrics:
+    """Тесты метрик прогрева кэша."""
+
+    def test_warmup_and_first_turn_ratio(self):
+        """Длительность прогрева и доля первых сообщений из прогретых записей."""
+        collector = MetricsCollector()
+        collector.record_cache_warmup(duration=4.2, entries=12)
+        for _ in range(4):
+            collector.record_first_turn()
+        collector.record_response_cache(hit=True, latency_saved=3.0, warm=True)
+        collector.record_response_cache(hit=False)
+
+        stats = collector.get_current_hour_stats()
+        assert stats['warmup_runs'] == 1
+        assert stats['warmup_entries'] == 12
+        assert stats['warmup_duration'] == 4.2
+        assert stats['cache_warm_hits'] == 1
+        assert collector.get_warm_first_turn_ratio() == 0.25
+
+    def test_ratio_without_first_turns(self):
+        """Без первых сообщений доля равна нулю."""
+        assert MetricsCollector().get_warm_first_turn_ratio() == 0.0
+
+
+class TestStreamMetrics:
+    """Тесты метрик потоковых ответов."""
+
+    def test_stream_latency_averages(self):
+        """Среднее время до первого и последнего токена за час."""
+        collector = MetricsCollector()
+        assert collector.get_stream_latency() == (0.0, 0.0)
+
+        collector.record_stream_timing("model", ttft=0.5, ttlt=4.0)
+        collector.record_stream_timing("model", ttft=1.5, ttlt=6.0)
+
+        assert collector.get_current_hour_stats()['stream_requests'] == 2
+        assert collector.get_stream_latency() == (1.0, 5.0)
+
+
+class TestHedgeMetrics:
+    """Тесты метрик хеджирования."""
+
+    def test_hedge_and_win_rates(self):
+        """Доля хеджей и побед моделей за час."""
+        collector = MetricsCollector()
+        collector.record_hedge(fired=False, winner="primary", tail_improvement=0.0)
+        collector.record_hedge(fired=True, winner="fallback", tail_improvement=1.5)
+        collector.record_hedge(fired=True, winner="primary", tail_improvement=2.0)
+        collector.record_hedge(fired=False, winner="primary", tail_improvement=2.0)
+
+        assert collector.get_hedge_rate() == 0.5
+        assert collector.get_hedge_win_rates() == {"primary": 0.75, "fallback": 0.25}
+        assert collector.get_current_hour_stats()['hedge_tail_improvement'] == 2.0
+
+
+class TestHttpPoolMetrics:
+    """Тесты метрик пулов HTTP-соединений."""
+
+    def test_reuse_ratio_and_connect_time(self):
+        """Доля повторно использованных соединений и время их установки."""
+        collector = MetricsCollector()
+        assert collector.get_http_pool_stats() == {}
+
+        collector.record_http_connection("openrouter", 0.2)
+        collector.record_http_request("openrouter", reused=False)
+        collector.record_http_connection("openrouter", 0.4)
+        collector.record_http_request("openrouter", reused=False)
+        collector.record_http_request("openrouter", reused=True)
+        collector.record_http_request("openrouter", reused=True)
+
+        stats = collector.get_http_pool_stats()["openrouter"]
+        assert stats["requests"] == 4
+        assert stats["connections"] == 2
+        assert stats["reuse_ratio"] == 0.5
+        assert stats["avg_connect_time"] == 0.3
+        assert stats["max_connect_time"] == 0.4
+
+
+class TestLlmTimeoutMetrics:
+    """Тесты метрик таймаутов LLM."""
+
+    def test_effective_timeouts_recorded(self):
+        """Таймаут каждого вызова и число оборванных запросов за час."""
+        collector = MetricsCollector()
+        collector.record_llm_call("fast", queue_wait=0.0, latency=1.0, timeout=5.0)
+        collector.record_llm_call("slow", queue_wait=0.0, latency=9.0, timeout=25.0)
+        collector.record_llm_timeout("slow")
+
+        stats = collector.get_current_hour_stats()
+        assert collector.get_avg_llm_timeout() == 15.0
+        assert stats['llm_timeouts'] == 1
+        assert stats['llm_timeout_by_model'] == {"fast": 5.0, "slow": 25.0}
+
+
+class TestTokenUsageMetrics:
+    """Тесты учета токенов."""
+
+    def test_tokens_aggregated_by_hour_model_and_user(self):
+        collector = MetricsCollector()
+        collector.record_token_usage("fast", 1000, 200, 600, 2.0, user_id=1)
+        collector.record_token_usage("slow", 500, 100, 0, 5.0, user_id=2)
+        collector.record_token_usage("fast", 300, 100, 0, 1.0)
+
+        stats = collector.get_current_hour_stats()
+        assert stats['total_tokens'] == 2200
+        assert stats['cached_tokens'] == 600
+        assert collector.get_tokens_per_second() == 50.0
+
+        by_model = collector.get_token_usage_by_model()
+        assert by_model["fast"]["requests"] == 2
+        assert by_model["fast"]["total_tokens"] == 1600
+        assert by_model["fast"]["tokens_per_second"] == 100.0
+        assert by_model["slow"]["tokens_per_second"] == 20.0
+
+        assert list(collector.get_top_token_users(limit=1)) == [1]
+        assert collector.get_top_token_users()[2]["total_tokens"] == 600